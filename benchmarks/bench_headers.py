@@ -0,0 +1,65 @@
+"""
+Benchmark for EmailParser.get_headers
+
+Builds the same message with attachments of growing size and times header extraction
+against the previous implementation, which re-serialized the whole message and ran it
+back through HeaderParser. The current implementation should stay flat as the
+attachment grows.
+
+Run from the repository root:
+
+    python benchmarks/bench_headers.py
+"""
+
+import logging
+import os
+import sys
+import timeit
+from email import message_from_string, parser
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from eml_parser.email_parser import EmailParser  # noqa: E402
+
+ATTACHMENT_SIZES = [0, 64 * 1024, 1024 * 1024, 8 * 1024 * 1024]
+REPEAT = 20
+
+
+def legacy_get_headers(msg):
+    headers = parser.HeaderParser().parsestr(msg.as_string())
+    return [{"name": str(h[0]), "value": str(h[1])} for h in headers.items()]
+
+
+def build_message(attachment_size: int):
+    msg = MIMEMultipart()
+    msg["From"] = "Example User <user@example.com>"
+    msg["To"] = "Example User <user@example.com>"
+    msg["Subject"] = "Header benchmark"
+    msg["Date"] = "Thu, 8 Aug 2019 17:29:14 +0000"
+    msg.attach(MIMEText("Body text"))
+    if attachment_size:
+        attachment = MIMEApplication(os.urandom(attachment_size))
+        attachment.add_header("Content-Disposition", "attachment", filename="blob.bin")
+        msg.attach(attachment)
+    # Round trip through the parser so we time a message the way plugins hand it to us
+    return message_from_string(msg.as_string())
+
+
+def main():
+    email_parser = EmailParser(logging.getLogger("benchmark"))
+    print(f"{'attachment':>12} {'legacy (ms)':>12} {'current (ms)':>13}")
+    for size in ATTACHMENT_SIZES:
+        msg = build_message(size)
+        assert legacy_get_headers(msg) == email_parser.get_headers(msg)
+        legacy = timeit.timeit(lambda: legacy_get_headers(msg), number=REPEAT)
+        current = timeit.timeit(lambda: email_parser.get_headers(msg), number=REPEAT)
+        print(
+            f"{size:>12} {legacy / REPEAT * 1000:>12.3f} {current / REPEAT * 1000:>13.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark for EmailParser.attachments on deeply nested emails
+
+Builds chains of forwarded emails (message/rfc822 inside message/rfc822) where every level
+carries one attachment, then reports how often attachment content was hashed and how long
+the parse took per MIME part. Each part should be hashed once and the time per part should
+stay flat as the nesting gets deeper.
+
+Run from the repository root:
+
+    python benchmarks/bench_nesting.py
+"""
+
+import logging
+import os
+import sys
+import timeit
+from email import message_from_bytes
+from email.mime.application import MIMEApplication
+from email.mime.message import MIMEMessage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import eml_parser.icon_file  # noqa: E402
+from eml_parser.email_parser import EmailParser  # noqa: E402
+
+DEPTHS = [1, 2, 4, 8, 16, 32]
+ATTACHMENT_SIZE = 32 * 1024
+REPEAT = 5
+
+
+def build_message(depth: int):
+    msg = None
+    for level in range(depth, 0, -1):
+        outer = MIMEMultipart()
+        outer["From"] = "Example User <user@example.com>"
+        outer["To"] = "Example User <user@example.com>"
+        outer["Subject"] = f"Level {level}"
+        outer.attach(MIMEText(f"Level {level} body"))
+        attachment = MIMEApplication(os.urandom(ATTACHMENT_SIZE))
+        attachment.add_header(
+            "Content-Disposition", "attachment", filename=f"level{level}.bin"
+        )
+        outer.attach(attachment)
+        if msg is not None:
+            outer.attach(MIMEMessage(msg))
+        msg = outer
+    return message_from_bytes(msg.as_bytes())
+
+
+class CountingIndicators(eml_parser.icon_file.Indicators):
+    calls = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingIndicators.calls += 1
+        super().__init__(*args, **kwargs)
+
+
+def main():
+    email_parser = EmailParser(logging.getLogger("benchmark"))
+    eml_parser.icon_file.Indicators = CountingIndicators
+
+    print(f"{'depth':>6} {'parts':>6} {'hashed':>7} {'ms':>9} {'ms/part':>8}")
+    for depth in DEPTHS:
+        msg = build_message(depth)
+        parts = sum(1 for _ in msg.walk())
+
+        CountingIndicators.calls = 0
+        email_parser.format_result(msg, "benchmark")
+        hashed = CountingIndicators.calls
+
+        elapsed = timeit.timeit(
+            lambda: email_parser.format_result(msg, "benchmark"), number=REPEAT
+        )
+        per_message = elapsed / REPEAT * 1000
+        print(
+            f"{depth:>6} {parts:>6} {hashed:>7} {per_message:>9.2f} {per_message / parts:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
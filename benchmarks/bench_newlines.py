@@ -0,0 +1,64 @@
+"""
+Benchmark for remove_microsoft_newlines
+
+Times the cleaner against the previous implementation, which made four str.replace passes
+and then ran quopri.decodestring, on the raw quoted_printable.eml and encoded_ms_eml.txt
+payloads and on larger bodies built by repeating them. The previous implementation gave
+up on any text that wasn't ASCII, so its non-ASCII timings don't include decoding.
+
+Run from the repository root:
+
+    python benchmarks/bench_newlines.py
+"""
+
+import os
+import quopri
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from eml_parser.microsoft_newline_cleaner import remove_microsoft_newlines  # noqa: E402
+
+PAYLOADS = os.path.join(os.path.dirname(__file__), "..", "unit_test", "payloads")
+FILES = ["quoted_printable.eml", "encoded_ms_eml.txt"]
+SCALES = [1, 100]
+REPEAT = 20
+
+
+def legacy_remove_microsoft_newlines(s: str) -> str:
+    s = s.replace("=\r\n\r\n", "")
+    s = s.replace("=\r\n", "")
+    s = s.replace("=\n\n", "")
+    s = s.replace("=\n", "")
+    try:
+        s = quopri.decodestring(s).decode("UTF-8")
+    except Exception:
+        pass
+    return s
+
+
+def main():
+    print(
+        f"{'payload':<24} {'scale':>5} {'KB':>8} {'legacy ms':>10} {'ms':>8} {'speedup':>8}"
+    )
+    for filename in FILES:
+        with open(os.path.join(PAYLOADS, filename), encoding="utf-8") as payload:
+            text = payload.read()
+        for scale in SCALES:
+            body = text * scale
+            legacy = timeit.timeit(
+                lambda: legacy_remove_microsoft_newlines(body), number=REPEAT
+            )
+            current = timeit.timeit(
+                lambda: remove_microsoft_newlines(body), number=REPEAT
+            )
+            print(
+                f"{filename:<24} {scale:>5} {len(body) / 1024:>8.0f} "
+                f"{legacy / REPEAT * 1000:>10.3f} {current / REPEAT * 1000:>8.3f} "
+                f"{legacy / current:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark for the fields projection of EmailParser
+
+Parses large synthetic emails with every field, and with projections that only need
+part of the email, e.g. just the headers or just the attachment hashes. Projections that
+leave out indicators skip base64 decoding and hashing of attachments entirely.
+
+Run from the repository root:
+
+    python benchmarks/bench_projection.py
+"""
+
+import logging
+import os
+import sys
+import timeit
+from email.parser import BytesParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import corpus  # noqa: E402
+from eml_parser.email_parser import EmailParser  # noqa: E402
+
+CASES = ["utf8_large_body_base64", "many_attachments", "large_attachment"]
+PROJECTIONS = {
+    "all": None,
+    "headers": {"headers"},
+    "body": {"body"},
+    "attachments": {"attachments"},
+    "attachment hashes": {"attachments", "indicators"},
+    "no indicators": {"headers", "body", "attachments", "nested"},
+}
+REPEAT = 5
+
+
+def main():
+    logger = logging.getLogger("benchmark")
+    print(f"{'email':<24} {'fields':<18} {'ms':>9} {'vs all':>7}")
+    for name in CASES:
+        msg = BytesParser().parsebytes(
+            corpus.make_email(**corpus.SYNTHETIC_CASES[name])
+        )
+        baseline = None
+        for projection, fields in PROJECTIONS.items():
+            email_parser = EmailParser(logger, fields=fields)
+            elapsed = timeit.timeit(
+                lambda: email_parser.format_result(msg, "benchmark"), number=REPEAT
+            )
+            per_message = elapsed / REPEAT * 1000
+            baseline = baseline or per_message
+            print(
+                f"{name:<24} {projection:<18} {per_message:>9.2f} {per_message / baseline:>6.0%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
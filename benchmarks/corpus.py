@@ -0,0 +1,115 @@
+"""
+Email corpora for the benchmarks
+
+payload_corpus reads the emails the unit tests use. synthetic_corpus builds emails from a
+grid of shapes (body size, attachment count and size, nesting depth, charset and transfer
+encoding), so each benchmark exercises a known kind of message. Generated emails are
+deterministic, the same parameters always give the same bytes.
+"""
+
+import os
+import random
+from email.message import EmailMessage
+
+PAYLOADS_DIR = os.path.join(os.path.dirname(__file__), "..", "unit_test", "payloads")
+
+# Text that each charset can represent, so non-ASCII content takes the charset's code path
+SAMPLE_TEXT = {
+    "us-ascii": "The quick brown fox jumps over the lazy dog. ",
+    "utf-8": "Grüße aus Köln, naïve café, 日本語のテキスト, emoji 📎. ",
+    "iso-8859-1": "Grüße aus Köln, naïve café, señor, déjà vu. ",
+    "shift_jis": "日本語のテキストです。メールの本文。 ",
+}
+
+# name: make_email parameters
+SYNTHETIC_CASES = {
+    "plain_small": dict(body_size=2 * 1024),
+    "utf8_large_body_base64": dict(body_size=1024 * 1024, encoding="base64"),
+    "latin1_quoted_printable": dict(
+        body_size=64 * 1024, charset="iso-8859-1", encoding="quoted-printable"
+    ),
+    "shift_jis_base64": dict(
+        body_size=64 * 1024, charset="shift_jis", encoding="base64"
+    ),
+    "many_attachments": dict(attachments=32, attachment_size=32 * 1024),
+    "large_attachment": dict(attachments=1, attachment_size=8 * 1024 * 1024),
+    "nested_depth_8": dict(attachments=1, depth=8),
+    "nested_depth_8_wide": dict(attachments=4, depth=8),
+}
+
+
+def make_text(size: int, charset: str = "utf-8") -> str:
+    """Returns about size characters of text that can be encoded with charset"""
+    sample = SAMPLE_TEXT.get(charset, SAMPLE_TEXT["us-ascii"])
+    line = sample * max(1, 76 // len(sample)) + "\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def random_bytes(randomizer: random.Random, size: int) -> bytes:
+    # The same bytes as Random.randbytes, which needs Python 3.9
+    if not size:
+        return b""
+    return randomizer.getrandbits(8 * size).to_bytes(size, "little")
+
+
+def make_email(
+    body_size: int = 4 * 1024,
+    attachments: int = 0,
+    attachment_size: int = 16 * 1024,
+    depth: int = 0,
+    charset: str = "utf-8",
+    encoding: str = "quoted-printable",
+    seed: int = 0,
+) -> bytes:
+    """
+    Builds a raw email
+
+    :param body_size: Size of the text/plain body in characters
+    :param attachments: Number of binary attachments on every level of the email
+    :param attachment_size: Size of every attachment in bytes
+    :param depth: Number of emails nested (message/rfc822) inside each other below this one
+    :param charset: Charset of the body
+    :param encoding: Content-Transfer-Encoding of the body: 8bit, quoted-printable or base64
+    :param seed: Seed for the attachment content
+    :return: Raw email as bytes
+    """
+    randomizer = random.Random(seed)
+    msg = None
+    for level in range(depth, -1, -1):
+        outer = EmailMessage()
+        outer["From"] = "Example Sender <sender@example.com>"
+        outer["To"] = "Example Recipient <recipient@example.com>"
+        outer["Subject"] = f"Synthetic email, level {level}"
+        outer["Date"] = "Thu, 08 Aug 2019 17:29:14 -0500"
+        outer["Message-ID"] = f"<synthetic-{seed}-{level}@example.com>"
+        outer.set_content(make_text(body_size, charset), charset=charset, cte=encoding)
+        for number in range(attachments):
+            outer.add_attachment(
+                random_bytes(randomizer, attachment_size),
+                maintype="application",
+                subtype="octet-stream",
+                filename=f"level{level}_attachment{number}.bin",
+            )
+        if msg is not None:
+            outer.add_attachment(msg)
+        msg = outer
+    return msg.as_bytes()
+
+
+def synthetic_corpus():
+    """
+    :return: Generator of (name, raw email as bytes) for every synthetic case
+    """
+    for name, parameters in SYNTHETIC_CASES.items():
+        yield name, make_email(**parameters)
+
+
+def payload_corpus():
+    """
+    :return: Generator of (name, raw email as bytes) for the unit test payloads
+    """
+    for filename in sorted(os.listdir(PAYLOADS_DIR)):
+        if filename.endswith(".json") or "python_object" in filename:
+            continue
+        with open(os.path.join(PAYLOADS_DIR, filename), "rb") as email_file:
+            yield filename, email_file.read()
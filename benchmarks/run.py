@@ -0,0 +1,247 @@
+"""
+Benchmark suite for the parsing pipeline
+
+Times every stage of the pipeline (format_result, get_headers, decode_body, attachments,
+Indicators, make_serializable, flatten) over the unit test payloads and a synthetic corpus
+(see corpus.py), and compares the results to a saved baseline. A stage that got slower
+than the baseline by more than the threshold is reported as a regression and the run
+exits with status 1.
+
+Run from the repository root:
+
+    python benchmarks/run.py --save-baseline    # record benchmarks/baseline.json
+    python benchmarks/run.py                    # compare against it
+
+or use make bench-baseline and make bench. Timings are machine specific, record the
+baseline on the machine the comparison runs on.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from email.parser import BytesParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import corpus  # noqa: E402
+from eml_parser import __version__  # noqa: E402
+from eml_parser.email_parser import EmailParser  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+CORPORA = {"payloads": corpus.payload_corpus, "synthetic": corpus.synthetic_corpus}
+
+
+def hashed_contents(email_parser: EmailParser, msg) -> list:
+    """
+    :return: List of (content, content transfer encoding) of the body and every attachment
+             part, nested ones included, as the parser hashes them
+    """
+    contents = [(email_parser.get_body(msg) or "", "")]
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        filename, content, content_transfer_encoding = email_parser.attachment_content(
+            part
+        )
+        if filename:
+            contents.append((content, content_transfer_encoding))
+    return contents
+
+
+def flatten(email):
+    email.flatten()
+
+
+# name: (function to time, what it is given: "msg" for the email.message object, "email"
+# for a parsed IconEmail that may be modified, "contents" for hashed_contents of the message)
+STAGES = {
+    "format_result": (None, "msg"),
+    "get_headers": (EmailParser.get_headers, "msg"),
+    "decode_body": (None, "msg"),
+    "attachments": (None, "msg"),
+    "indicators": (None, "contents"),
+    "make_serializable": (lambda email: email.make_serializable(), "email"),
+    "flatten": (flatten, "email"),
+}
+
+
+def measure(function, make_argument, repeat: int) -> float:
+    """
+    Times function(make_argument()) repeat times, only function is timed
+
+    :return: Median time in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        argument = make_argument()
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def run_message(email_parser: EmailParser, raw_email: bytes, repeat: int) -> dict:
+    """
+    :return: Dictionary of stage name to median time in seconds
+    """
+    msg = BytesParser().parsebytes(raw_email)
+    parsed = email_parser.format_result(msg, "benchmark")
+    contents = hashed_contents(email_parser, msg)
+
+    functions = {
+        "format_result": lambda msg: email_parser.format_result(msg, "benchmark"),
+        "decode_body": email_parser.decode_body,
+        "attachments": lambda msg: email_parser.attachments(msg, "benchmark"),
+        "indicators": lambda contents: [
+            email_parser.make_indicators(content, content_transfer_encoding)
+            for content, content_transfer_encoding in contents
+        ],
+    }
+    arguments = {
+        "msg": lambda: msg,
+        "email": lambda: copy.deepcopy(parsed),
+        "contents": lambda: contents,
+    }
+
+    timings = {
+        "parse": measure(BytesParser().parsebytes, lambda: raw_email, repeat),
+    }
+    for stage, (function, argument) in STAGES.items():
+        timings[stage] = measure(
+            function or functions[stage], arguments[argument], repeat
+        )
+    return timings
+
+
+def run(corpora: list, repeat: int) -> dict:
+    email_parser = EmailParser(logging.getLogger("benchmark"))
+    results = {}
+    for corpus_name in corpora:
+        for name, raw_email in CORPORA[corpus_name]():
+            key = f"{corpus_name}/{name}"
+            try:
+                results[key] = run_message(email_parser, raw_email, repeat)
+            except Exception as e:
+                print(f"Skipping {key}, it failed to parse: {e!r}", file=sys.stderr)
+                continue
+            results[key]["bytes"] = len(raw_email)
+    return {
+        "meta": {
+            "parser_version": __version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_time: float) -> list:
+    """
+    :return: List of (message, stage, baseline seconds, current seconds) that regressed
+    """
+    regressions = []
+    for message, timings in current["results"].items():
+        baseline_timings = baseline["results"].get(message, {})
+        for stage, seconds in timings.items():
+            before = baseline_timings.get(stage)
+            if stage == "bytes" or before is None:
+                continue
+            # Stages this fast are mostly noise
+            if max(seconds, before) < min_time:
+                continue
+            if seconds > before * (1 + threshold):
+                regressions.append((message, stage, before, seconds))
+    return regressions
+
+
+def report(results: dict) -> str:
+    stages = ["parse"] + list(STAGES)
+    width = max(len(name) for name in results["results"]) if results["results"] else 0
+    lines = [f"{'message':<{width}} " + " ".join(f"{s[:12]:>12}" for s in stages)]
+    for name, timings in results["results"].items():
+        lines.append(
+            f"{name:<{width}} "
+            + " ".join(f"{timings[stage] * 1000:>10.3f}ms" for stage in stages)
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    argument_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argument_parser.add_argument(
+        "--corpus",
+        choices=sorted(CORPORA) + ["all"],
+        default="all",
+        help="Which emails to run on",
+    )
+    argument_parser.add_argument(
+        "--repeat", type=int, default=5, help="Runs per stage, the median is kept"
+    )
+    argument_parser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare to"
+    )
+    argument_parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Write the results to the baseline instead of comparing",
+    )
+    argument_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown before a stage counts as a regression, 0.25 is 25%%",
+    )
+    argument_parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.0005,
+        help="Stages faster than this many seconds are never reported as regressions",
+    )
+    argument_parser.add_argument(
+        "-o", "--output", default=None, help="Also write the results to this JSON file"
+    )
+    args = argument_parser.parse_args(argv)
+
+    corpora = sorted(CORPORA) if args.corpus == "all" else [args.corpus]
+    results = run(corpora, max(1, args.repeat))
+    print(report(results))
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare(results, baseline, args.threshold, args.min_time)
+    if not regressions:
+        print(f"\nNo regressions beyond {args.threshold:.0%} of the baseline")
+        return 0
+
+    print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+    for message, stage, before, seconds in regressions:
+        print(
+            f"  {message} {stage}: {before * 1000:.3f}ms -> {seconds * 1000:.3f}ms "
+            f"({seconds / before - 1:+.0%})"
+        )
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
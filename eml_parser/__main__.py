@@ -0,0 +1,276 @@
+"""
+Bulk email parser
+
+Parses emails from files, directories, mbox files, Maildirs or stdin across a pool of worker
+processes and writes one JSON object per message (NDJSON) to stdout.
+
+    eml-parser --workers 8 ./export/ archive.mbox > emails.ndjson
+    cat message.eml | eml-parser -
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+from eml_parser import mailbox_reader
+from eml_parser.batch import BatchEmailParser
+from eml_parser.disk_cache import CachedEmailParser, DiskResultCache
+from eml_parser.email_parser import EmailParser
+
+
+def iter_file(path: str):
+    """
+    Yields (source, raw message) for every message in a file.
+    mbox files yield one entry per message, anything else is treated as a single email.
+    A file that can't be read yields (path, the OSError) instead.
+    """
+    try:
+        if mailbox_reader.is_mbox(path):
+            for number, raw_email in enumerate(mailbox_reader.iter_mbox(path), start=1):
+                yield f"{path}#{number}", raw_email
+            return
+        with open(path, "rb") as email_file:
+            yield path, email_file.read()
+    except OSError as error:
+        yield path, error
+
+
+def iter_directory(path: str):
+    """
+    Yields (source, raw message) for every message in a Maildir, or in every file
+    found under any other directory
+    """
+    if mailbox_reader.is_maildir(path):
+        for message_path in mailbox_reader.iter_maildir_paths(path):
+            yield from iter_file(message_path)
+        return
+    for directory, subdirectories, filenames in os.walk(path):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            yield from iter_file(os.path.join(directory, filename))
+
+
+def iter_stdin(stdin):
+    first_line = stdin.readline()
+    if first_line.startswith(mailbox_reader.MBOX_SEPARATOR):
+        raw_emails = mailbox_reader.iter_mbox_stream(
+            itertools.chain([first_line], stdin)
+        )
+        for number, raw_email in enumerate(raw_emails, start=1):
+            yield f"-#{number}", raw_email
+        return
+    yield "-", first_line + stdin.read()
+
+
+def iter_inputs(inputs: list, stdin=None):
+    """
+    Yields (source, raw message) for every message found in the inputs
+
+    :param inputs: Paths to files, mbox files, Maildirs or directories, "-" reads from stdin
+    :param stdin: Binary stream to use for "-", defaults to sys.stdin
+    :return: Generator of (source, raw message as bytes), or (source, OSError) for inputs
+             that can't be read
+    """
+    for source in inputs:
+        if source == "-":
+            yield from iter_stdin(stdin or sys.stdin.buffer)
+        elif os.path.isdir(source):
+            yield from iter_directory(source)
+        else:
+            yield from iter_file(source)
+
+
+class JsonEmailParser(object):
+    """
+    Wraps a parser so that make_email returns the email as a line of JSON. Handed to
+    BatchEmailParser, serialization then happens in the worker processes along with the
+    parsing, and only strings are sent back to the parent.
+    """
+
+    def __init__(self, parser):
+        """
+        :param parser: EmailParser, or anything else with make_email, e.g. CachedEmailParser
+        """
+        self.parser = parser
+
+    @property
+    def logger(self):
+        return self.parser.logger
+
+    def make_email(self, raw_email, mailbox_id: str) -> str:
+        """
+        :param raw_email: Raw email as bytes, str or an email.message object
+        :param mailbox_id: Mailbox ID the message was taken from
+        :return: The serialized email as a JSON string
+        """
+        return json.dumps(
+            self.parser.make_email(raw_email, mailbox_id).make_serializable()
+        )
+
+
+class Stats(object):
+    """
+    Collects throughput and per-message latency for a run
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.messages = 0
+        self.failures = 0
+        self.bytes = 0
+        self.durations = []
+
+    def add(self, outcome, size: int):
+        self.messages += 1
+        self.bytes += size
+        self.durations.append(outcome.duration)
+        if not outcome.ok:
+            self.failures += 1
+
+    def add_unreadable(self):
+        # Counted as a failed message, it has no size or latency
+        self.messages += 1
+        self.failures += 1
+
+    def percentile(self, percent: float) -> float:
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def report(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        rate = self.messages / elapsed
+        megabytes_rate = self.bytes / (1024 * 1024) / elapsed
+        return (
+            f"Parsed {self.messages} message(s), {self.failures} failed, "
+            f"in {elapsed:.2f}s ({rate:.1f} msg/s, {megabytes_rate:.2f} MB/s)\n"
+            f"Latency per message: p50 {self.percentile(50) * 1000:.1f}ms, "
+            f"p95 {self.percentile(95) * 1000:.1f}ms, p99 {self.percentile(99) * 1000:.1f}ms, "
+            f"max {max(self.durations, default=0.0) * 1000:.1f}ms"
+        )
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    argument_parser = argparse.ArgumentParser(
+        prog="eml-parser",
+        description="Parse emails in bulk and write one JSON object per message (NDJSON).",
+    )
+    argument_parser.add_argument(
+        "inputs",
+        nargs="*",
+        default=["-"],
+        help='Email files, directories or mbox files. "-" (the default) reads stdin',
+    )
+    argument_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes, defaults to the CPU count. 0 parses serially",
+    )
+    argument_parser.add_argument(
+        "-m", "--mailbox-id", default="", help="Mailbox ID to record on every email"
+    )
+    argument_parser.add_argument(
+        "-o", "--output", default="-", help='Where to write NDJSON, "-" for stdout'
+    )
+    argument_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=16,
+        help="Number of messages sent to a worker at once",
+    )
+    argument_parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="Write messages as soon as they are parsed instead of in input order",
+    )
+    argument_parser.add_argument(
+        "--cache",
+        default=None,
+        help="SQLite database of earlier results, messages found there aren't parsed again",
+    )
+    argument_parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=None,
+        help="Seconds a cached result stays valid, by default results don't expire",
+    )
+    argument_parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Don't print stats when done"
+    )
+    argument_parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Log parser details to stderr"
+    )
+    return argument_parser
+
+
+def main(argv: list = None, stdin=None, stdout=None, stderr=None) -> int:
+    args = build_argument_parser().parse_args(argv)
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+
+    logging.basicConfig(
+        stream=stderr, level=logging.INFO if args.verbose else logging.WARNING
+    )
+    email_parser = EmailParser(logging.getLogger("eml_parser"))
+    cache = None
+    if args.cache:
+        cache = DiskResultCache(args.cache, ttl=args.cache_ttl)
+        cache.prune()
+        cache.close()  # Worker processes open their own connections
+        email_parser = CachedEmailParser(email_parser, cache)
+
+    sources = {}
+    sizes = {}
+
+    def raw_messages():
+        index = 0
+        for source, raw_email in iter_inputs(args.inputs, stdin):
+            if isinstance(raw_email, OSError):
+                stats.add_unreadable()
+                stderr.write(f"Failed to read {source}:\n{raw_email}\n")
+                continue
+            sources[index] = source
+            sizes[index] = len(raw_email)
+            index += 1
+            yield raw_email
+
+    output = stdout if args.output == "-" else open(args.output, "w")
+    stats = Stats()
+    try:
+        batch_parser = BatchEmailParser(
+            JsonEmailParser(email_parser),
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+        )
+        for outcome in batch_parser.parse(
+            raw_messages(), args.mailbox_id, ordered=not args.unordered
+        ):
+            source = sources.pop(outcome.index)
+            stats.add(outcome, sizes.pop(outcome.index))
+            if outcome.ok:
+                output.write(outcome.email)  # Already serialized by the worker
+                output.write("\n")
+            else:
+                stderr.write(f"Failed to parse {source}:\n{outcome.error}\n")
+    finally:
+        if output is not stdout:
+            output.close()
+        if cache is not None:
+            cache.close()
+
+    if not args.quiet:
+        stderr.write(stats.report() + "\n")
+
+    return 1 if stats.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import asyncio
+from concurrent.futures import Executor
+
+from eml_parser.icon_email import IconEmail
+
+
+class AsyncEmailParser(object):
+    """
+    Runs EmailParser on an executor so parsing never blocks the event loop.
+
+    Parsing is CPU heavy, so pass a ProcessPoolExecutor to parse on more than one core.
+    By default the event loop's default (thread pool) executor is used.
+    """
+
+    def __init__(
+        self,
+        parser,
+        executor: Executor = None,
+        max_concurrency: int = 4,
+        max_pending_bytes: int = 64 * 1024 * 1024,
+    ):
+        """
+        :param parser: EmailParser used to parse each message
+        :param executor: Executor parsing runs on, defaults to the event loop's default executor
+        :param max_concurrency: Maximum number of messages being parsed at once by parse_stream
+        :param max_pending_bytes: High-water mark for the size of the raw messages parse_stream holds
+        """
+        self.parser = parser
+        self.executor = executor
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_pending_bytes = max_pending_bytes
+
+    async def parse(self, raw_email, mailbox_id: str) -> IconEmail:
+        """
+        Parses a single raw email on the executor
+
+        :param raw_email: Raw email as bytes, str or an email.message object
+        :param mailbox_id: Mailbox ID the message was taken from
+        :return: IconEmail
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.parser.make_email, raw_email, mailbox_id
+        )
+
+    async def parse_stream(self, raw_emails, mailbox_id: str):
+        """
+        Parses an async stream of raw emails, yielding IconEmails as they finish.
+
+        The stream keeps being read while earlier messages are parsed. Reading pauses when
+        max_concurrency messages are in flight, or when the raw messages in flight add up to
+        max_pending_bytes (a single message larger than that is still let through on its
+        own). If a message fails to parse, the remaining work is cancelled and the error is
+        raised.
+
+        :param raw_emails: Async iterable of raw emails as bytes, str or email.message objects
+        :param mailbox_id: Mailbox ID the messages were taken from
+        :return: Async generator of IconEmail, in completion order
+        """
+        pending = {}
+        pending_bytes = 0
+        stream = raw_emails.__aiter__()
+        fetch = None
+
+        try:
+            while True:
+                # Fetch the next message alongside the parses, as long as there is room for it
+                if (
+                    fetch is None
+                    and stream is not None
+                    and self._has_room(pending, pending_bytes)
+                ):
+                    fetch = asyncio.ensure_future(stream.__anext__())
+
+                waiting = set(pending)
+                if fetch is not None:
+                    waiting.add(fetch)
+                if not waiting:
+                    return
+
+                done, _ = await asyncio.wait(
+                    waiting, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if fetch in done:
+                    try:
+                        raw_email = fetch.result()
+                    except StopAsyncIteration:
+                        stream = None
+                    else:
+                        size = _raw_size(raw_email)
+                        task = asyncio.ensure_future(self.parse(raw_email, mailbox_id))
+                        pending[task] = size
+                        pending_bytes += size
+                    fetch = None
+
+                for task in done & set(pending):
+                    pending_bytes -= pending.pop(task)
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if fetch is not None:
+                fetch.cancel()
+
+    def _has_room(self, pending: dict, pending_bytes: int) -> bool:
+        if not pending:
+            return True
+        return (
+            len(pending) < self.max_concurrency
+            and pending_bytes < self.max_pending_bytes
+        )
+
+
+def _raw_size(raw_email) -> int:
+    if isinstance(raw_email, (bytes, bytearray, memoryview, str)):
+        return len(raw_email)
+    # An email.message object, we can't tell without serializing it
+    return 0
@@ -0,0 +1,53 @@
+"""
+Sinks for attachment content.
+
+With an attachment sink, EmailParser doesn't keep attachment content in IconFiles. Each
+attachment is decoded in chunks and handed to the sink as it is hashed, and the IconFile
+keeps the name, content type, indicators and whatever the sink returned as its handle.
+
+A sink is any callable taking (file name, content type, chunks), where chunks is an
+iterator of decoded bytes, and returning the handle. Chunks the sink doesn't read are still
+decoded and hashed. Handles end up in IconFile.to_dict, so keep them JSON-serializable, and
+keep sinks picklable when parsing in worker processes.
+"""
+
+import hashlib
+import os
+import tempfile
+
+
+class DirectorySink(object):
+    """
+    Writes every attachment to a file in a directory, named by the sha256 of its content.
+    The same attachment found twice is stored once. The handle is the path of the file.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: Where attachments are written, created if needed
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self):
+        # Part of the parser settings DiskResultCache keys on, so the same in every process
+        return f"DirectorySink({self.directory!r})"
+
+    def __call__(self, filename: str, content_type: str, chunks) -> str:
+        sha256 = hashlib.sha256()
+        # Written under a temporary name first, the final name is only known at the end
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, prefix=".partial-", delete=False
+        ) as partial_file:
+            try:
+                for chunk in chunks:
+                    sha256.update(chunk)
+                    partial_file.write(chunk)
+            except BaseException:
+                partial_file.close()
+                os.remove(partial_file.name)
+                raise
+
+        path = os.path.join(self.directory, sha256.hexdigest())
+        os.replace(partial_file.name, path)
+        return path
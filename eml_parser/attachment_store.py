@@ -0,0 +1,216 @@
+"""
+Content-addressed store for attachment payloads.
+
+When many messages carry the same attachment (a phishing campaign sending one PDF to
+hundreds of people), each payload is hashed once and kept once. Every IconFile built from
+it shares the stored content string and Indicators instead of holding its own copy.
+"""
+
+from collections import OrderedDict
+import os
+import threading
+
+from eml_parser.exceptions import EmailParserException
+from eml_parser.hashing import DEFAULT_ALGORITHMS, hash_content
+from eml_parser.indicators import Indicators
+
+
+class StoredAttachment(object):
+    """
+    A payload held by the AttachmentStore, with the digests computed for it so far.
+    keys holds every index key of the payload, the same payload encoded differently has
+    a key of its own.
+    """
+
+    __slots__ = ("keys", "content", "digests", "size")
+
+    def __init__(self, key: tuple, content: str, digests: dict):
+        self.keys = [key]
+        self.content = content
+        self.digests = digests
+        self.size = len(content)
+
+    @property
+    def sha256(self) -> str:
+        return self.digests["sha256"]
+
+
+class AttachmentStore(object):
+    """
+    Keeps attachment payloads keyed by the sha256 of their decoded content.
+
+    Payloads are kept in memory up to max_bytes, the least recently used ones are evicted
+    first. If spill_dir is set, evicted payloads are written there (one file per sha256)
+    so get() can still return them.
+
+    The store is safe to share between threads. A pickled copy starts out empty, so
+    the worker processes of BatchEmailParser each start with an empty store. Processes
+    forked some other way inherit the parent's store as it was.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, spill_dir: str = None):
+        """
+        :param max_bytes: Memory budget for the payloads held in memory
+        :param spill_dir: Directory evicted payloads are written to, by default they are dropped
+        """
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+
+        self._lock = threading.Lock()
+        # sha256 -> StoredAttachment, least recently used first
+        self._entries = OrderedDict()
+        # (is base64, content) -> (sha256, content to return), so a known payload isn't
+        # hashed again
+        self._index = {}
+        # sha256 -> digests of the payloads that were spilled to disk
+        self._spilled = {}
+
+    def __getstate__(self):
+        return {"max_bytes": self.max_bytes, "spill_dir": self.spill_dir}
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, sha256: str) -> bool:
+        return sha256 in self._entries or sha256 in self._spilled
+
+    def add(
+        self,
+        content: str,
+        content_transfer_encoding: str = "",
+        algorithms: tuple = DEFAULT_ALGORITHMS,
+    ) -> tuple:
+        """
+        Stores an attachment payload, hashing it only if it hasn't been seen before
+
+        :param content: Attachment content, as found in the MIME part
+        :param content_transfer_encoding: If base64, the decoded content is hashed
+        :param algorithms: Digests to compute and report in the returned Indicators, the
+                           sha256 the store is keyed on is computed either way
+        :return: Tuple of (content to keep, Indicators). The content is the stored copy
+                 when the same payload was added before.
+        """
+        key = (content_transfer_encoding.lower() == "base64", content)
+
+        with self._lock:
+            indexed = self._index.get(key)
+            if indexed is not None:
+                sha256, stored_content = indexed
+                self.hits += 1
+                self._entries.move_to_end(sha256)
+                digests = self._entries[sha256].digests
+                missing = tuple(name for name in algorithms if name not in digests)
+                if not missing:
+                    return stored_content, _indicators(digests, algorithms)
+
+        if indexed is not None:
+            # Stored for a parser asking for other digests, only the missing ones are computed
+            computed = hash_content(stored_content, content_transfer_encoding, missing)
+            with self._lock:
+                digests.update(computed)
+            return stored_content, _indicators(digests, algorithms)
+
+        # Payloads are keyed by their sha256, it is computed whatever was asked for
+        digests = hash_content(
+            content,
+            content_transfer_encoding,
+            tuple(algorithms) + (() if "sha256" in algorithms else ("sha256",)),
+        )
+
+        with self._lock:
+            self.misses += 1
+            sha256 = digests["sha256"]
+            entry = self._entries.get(sha256)
+            if entry is None:
+                spilled_digests = self._spilled.pop(sha256, None)
+                if spilled_digests is not None:
+                    # Held in memory again, the spilled copy would be left behind
+                    digests = {**spilled_digests, **digests}
+                    try:
+                        os.remove(self._spill_path(sha256))
+                    except OSError:
+                        pass
+                entry = StoredAttachment(key, content, digests)
+                self._entries[sha256] = entry
+                self._index[key] = (sha256, content)
+                self.size += entry.size
+                self._evict()
+            else:
+                for name, digest in digests.items():
+                    entry.digests.setdefault(name, digest)
+                if key not in self._index:
+                    # Same payload encoded differently, keep the caller's content as is
+                    # and index it too, so it isn't hashed again next time
+                    entry.keys.append(key)
+                    entry.size += len(content)
+                    self._index[key] = (sha256, content)
+                    self.size += len(content)
+                    self._entries.move_to_end(sha256)
+                    self._evict()
+
+        return content, _indicators(digests, algorithms)
+
+    def get(self, sha256: str):
+        """
+        Returns the stored content for a sha256, reading it back from spill_dir if it was evicted
+
+        :param sha256: Hex sha256 of the decoded payload
+        :return: Content as it was added, or None if the payload isn't stored
+        """
+        with self._lock:
+            entry = self._entries.get(sha256)
+            if entry is not None:
+                self._entries.move_to_end(sha256)
+                return entry.content
+            if sha256 not in self._spilled:
+                return None
+
+        with open(self._spill_path(sha256), "rb") as spilled_file:
+            return spilled_file.read().decode("utf-8", "surrogateescape")
+
+    def clear(self):
+        """Drops every payload, including the ones spilled to disk"""
+        with self._lock:
+            for sha256 in self._spilled:
+                try:
+                    os.remove(self._spill_path(sha256))
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._index.clear()
+            self._spilled.clear()
+            self.size = 0
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            sha256, entry = self._entries.popitem(last=False)
+            for key in entry.keys:
+                del self._index[key]
+            self.size -= entry.size
+            self.evictions += 1
+            if self.spill_dir:
+                with open(self._spill_path(sha256), "wb") as spilled_file:
+                    spilled_file.write(entry.content.encode("utf-8", "surrogateescape"))
+                self._spilled[sha256] = entry.digests
+
+    def _spill_path(self, sha256: str) -> str:
+        return os.path.join(self.spill_dir, sha256)
+
+
+def _indicators(digests: dict, algorithms: tuple) -> Indicators:
+    unsupported = set(algorithms) - set(digests)
+    if unsupported:
+        raise EmailParserException(
+            f"Unsupported hash algorithm(s): {', '.join(sorted(unsupported))}"
+        )
+    return Indicators.from_digests({name: digests[name] for name in algorithms})
@@ -0,0 +1,176 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+import os
+import pickle
+import time
+import traceback
+
+# The parser each worker process uses, sent once per worker by the pool initializer
+_worker_parser = None
+
+
+class ParseOutcome(object):
+    """
+    The result of parsing one message in a batch. Exactly one of email or error is set.
+    duration is the time spent parsing the message, in seconds.
+    """
+
+    def __init__(
+        self, index: int, email=None, error: str = None, duration: float = 0.0
+    ):
+        self.index = index
+        self.email = email
+        self.error = error
+        self.duration = duration
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _init_worker(parser):
+    global _worker_parser
+    # Under fork the parser isn't pickled, the worker would start out with whatever the
+    # parent's stores and caches held, and with their locks in whatever state they were.
+    # A pickle round trip resets them, as under spawn.
+    try:
+        _worker_parser = pickle.loads(pickle.dumps(parser))
+    except Exception:
+        _worker_parser = parser  # e.g. a lambda metrics hook, only possible under fork
+
+
+def _parse_chunk(chunk: list, mailbox_id: str, parser=None) -> list:
+    """
+    Parses a chunk of (index, raw message) pairs, capturing failures per message
+
+    :param chunk: List of (index, raw message) tuples
+    :param mailbox_id: Mailbox ID the messages were taken from
+    :param parser: EmailParser to use, defaults to the one handed to this worker process
+    :return: List of ParseOutcome
+    """
+    parser = parser or _worker_parser
+    outcomes = []
+    for index, raw_email in chunk:
+        start = time.perf_counter()
+        try:
+            email = parser.make_email(raw_email, mailbox_id)
+            outcome = ParseOutcome(index, email=email)
+        except Exception:
+            parser.logger.debug(f"Failed to parse message {index}", exc_info=True)
+            outcome = ParseOutcome(index, error=traceback.format_exc())
+        outcome.duration = time.perf_counter() - start
+        outcomes.append(outcome)
+    return outcomes
+
+
+def _failed_chunk(chunk: list, error: BaseException) -> list:
+    message = "".join(
+        traceback.format_exception(type(error), error, error.__traceback__)
+    )
+    return [ParseOutcome(index, error=message) for index, _ in chunk]
+
+
+class BatchEmailParser(object):
+    """
+    Parses many emails in parallel across a pool of worker processes.
+
+    Parsing is pure Python and CPU bound, so threads don't help; each worker process gets
+    its own copy of the EmailParser, with empty attachment stores and result caches whatever
+    the start method, as long as the parser can be pickled. Messages are submitted in chunks to keep the
+    per-message overhead of moving work between processes low, and only a bounded number
+    of chunks is in flight at once so huge inputs are never read into memory up front.
+    """
+
+    def __init__(
+        self,
+        parser,
+        workers: int = None,
+        chunk_size: int = 16,
+        max_pending_chunks: int = None,
+    ):
+        """
+        :param parser: EmailParser used to parse each message
+        :param workers: Number of worker processes, defaults to the CPU count. 0 parses serially in this process
+        :param chunk_size: Number of messages sent to a worker at once
+        :param max_pending_chunks: Chunks in flight at once, defaults to twice the number of workers
+        """
+        self.parser = parser
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.chunk_size = max(1, chunk_size)
+        self.max_pending_chunks = max_pending_chunks or max(1, self.workers) * 2
+
+    def parse(self, raw_messages, mailbox_id: str, ordered: bool = True):
+        """
+        Parses every message, yielding one ParseOutcome per message. A message that fails to
+        parse yields an outcome with its error instead of stopping the batch.
+
+        :param raw_messages: Iterable of raw emails as str, bytes or email.message objects
+        :param mailbox_id: Mailbox ID the messages were taken from
+        :param ordered: Yield outcomes in input order, or as soon as each chunk finishes
+        :return: Generator of ParseOutcome
+        """
+        chunks = self._chunks(raw_messages)
+
+        if self.workers == 0:
+            for chunk in chunks:
+                yield from _parse_chunk(chunk, mailbox_id, self.parser)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.parser,),
+        ) as executor:
+            if ordered:
+                yield from self._parse_ordered(executor, chunks, mailbox_id)
+            else:
+                yield from self._parse_as_completed(executor, chunks, mailbox_id)
+
+    def _chunks(self, raw_messages):
+        numbered = enumerate(raw_messages)
+        while True:
+            chunk = list(islice(numbered, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _submit(self, executor, chunks, mailbox_id: str):
+        chunk = next(chunks, None)
+        if chunk is None:
+            return None
+        return executor.submit(_parse_chunk, chunk, mailbox_id), chunk
+
+    @staticmethod
+    def _outcomes(future, chunk: list) -> list:
+        try:
+            return future.result()
+        except Exception as e:  # The worker died, e.g. BrokenProcessPool
+            return _failed_chunk(chunk, e)
+
+    def _parse_ordered(self, executor, chunks, mailbox_id: str):
+        pending = deque()
+        while True:
+            while len(pending) < self.max_pending_chunks:
+                submitted = self._submit(executor, chunks, mailbox_id)
+                if submitted is None:
+                    break
+                pending.append(submitted)
+            if not pending:
+                return
+            yield from self._outcomes(*pending.popleft())
+
+    def _parse_as_completed(self, executor, chunks, mailbox_id: str):
+        pending = {}
+        while True:
+            while len(pending) < self.max_pending_chunks:
+                submitted = self._submit(executor, chunks, mailbox_id)
+                if submitted is None:
+                    break
+                future, chunk = submitted
+                pending[future] = chunk
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from self._outcomes(future, pending.pop(future))
@@ -0,0 +1,74 @@
+"""
+Decoding of body parts to text.
+
+Every body part goes through decode_part: the transfer encoding is undone once by
+email.message, then the bytes are decoded once, trying in order
+
+    1. ASCII, when every byte is ASCII (most bodies), whatever the declared charset
+    2. The charset declared in the part's Content-Type, if Python knows it
+    3. UTF-8, when the bytes are valid UTF-8
+    4. UTF-8 after UnicodeDammit.detwingle, dropping whatever still doesn't decode
+
+Bodies in a declared non-UTF-8 charset are decoded in a single pass, with undecodable bytes
+replaced. Only bytes that are neither ASCII, in a declared charset nor valid UTF-8 reach
+step 4, the single fallback.
+"""
+
+import codecs
+from functools import lru_cache
+
+from bs4 import UnicodeDammit
+
+# Charsets that say nothing useful about the bytes, mail clients put them on anything
+_UNINFORMATIVE_CHARSETS = frozenset(("ascii", "utf-8"))
+
+
+@lru_cache(maxsize=64)
+def charset_codec(charset: str):
+    """
+    :param charset: Charset as declared in a Content-Type header
+    :return: Name of the Python codec for it, or None if there is none
+    """
+    try:
+        name = codecs.lookup(charset).name
+        b"a".decode(name)  # Rejects codecs that aren't text encodings, e.g. base64
+    except (LookupError, ValueError):
+        return None
+    return name
+
+
+def decode_bytes(payload: bytes, charset: str = None) -> str:
+    """
+    Decodes a body payload to text
+
+    :param payload: Payload bytes, with the transfer encoding already undone
+    :param charset: Charset declared for the payload, if any
+    :return: str
+    """
+    if payload.isascii():
+        return payload.decode("ascii")
+
+    codec = charset_codec(charset) if charset else None
+    if codec is not None and codec not in _UNINFORMATIVE_CHARSETS:
+        return payload.decode(codec, errors="replace")
+
+    try:
+        return payload.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+
+    # Usually UTF-8 mixed with Windows-1252, e.g. text pasted into a UTF-8 template
+    return UnicodeDammit.detwingle(payload).decode("utf-8", errors="ignore")
+
+
+def decode_part(part) -> str:
+    """
+    Decodes a non-multipart body part to text, using its transfer encoding and charset
+
+    :param part: email.message part
+    :return: str
+    """
+    payload = part.get_payload(decode=True)
+    if payload is None:
+        return ""
+    return decode_bytes(payload, part.get_content_charset())
@@ -0,0 +1,242 @@
+"""
+Persistent, on-disk cache of parse results.
+
+Results are kept in a local SQLite database, so a restarted worker or a re-run of a
+backfill can skip every message it has already parsed. The database runs in WAL mode,
+which lets the worker processes of a batch read and write it at the same time.
+
+Each entry holds the make_serializable output of an IconEmail as zlib compressed JSON,
+keyed by the sha256 of the raw message, the mailbox ID and a digest of the parser's
+settings, so parsers set up differently can share a database. Entries written by another
+version of the parser are ignored, and pruned along with expired entries.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from eml_parser import __version__
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parse_results (
+    sha256 TEXT NOT NULL,
+    mailbox_id TEXT NOT NULL,
+    config TEXT NOT NULL,
+    parser_version TEXT NOT NULL,
+    created REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (sha256, mailbox_id, config)
+)
+"""
+
+
+class SerializedEmail(object):
+    """
+    A parse result read back from the cache. It only offers what the serialized form
+    supports, which is what IconEmail.make_serializable returned.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: dict):
+        self.data = data
+
+    def to_dict(self) -> dict:
+        return self.data
+
+    def make_serializable(self) -> dict:
+        return self.data
+
+
+class DiskResultCache(object):
+    """
+    SQLite backed cache of serialized parse results.
+
+    A connection is opened lazily in each process (and shared by its threads), so the cache
+    can be handed to the worker processes of a batch. A connection inherited across fork is
+    never used, the child opens its own.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = None,
+        parser_version: str = __version__,
+        timeout: float = 30.0,
+    ):
+        """
+        :param path: Path to the SQLite database, created if it doesn't exist
+        :param ttl: Seconds an entry stays valid, by default entries don't expire
+        :param parser_version: Entries written by any other version are ignored
+        :param timeout: Seconds to wait for another process holding the write lock
+        """
+        self.path = path
+        self.ttl = ttl
+        self.parser_version = parser_version
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        return {
+            "path": self.path,
+            "ttl": self.ttl,
+            "parser_version": self.parser_version,
+            "timeout": self.timeout,
+        }
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    @staticmethod
+    def key(raw_email) -> str:
+        """
+        :param raw_email: Raw email as bytes, any bytes-like object or str
+        :return: Hex sha256 of the raw message
+        """
+        if isinstance(raw_email, str):
+            raw_email = raw_email.encode("utf-8", "surrogateescape")
+        return hashlib.sha256(raw_email).hexdigest()
+
+    @staticmethod
+    def config_digest(config: tuple) -> str:
+        """
+        :param config: Settings of the parser, as returned by EmailParser.result_cache_config
+        :return: Hex sha256 of their repr. Settings holding an object (e.g. an attachment
+                 sink) are only found again by other processes if its repr is the same there
+        """
+        return hashlib.sha256(repr(config).encode("utf-8")).hexdigest()
+
+    def get(self, key: str, mailbox_id: str, config: str = ""):
+        """
+        :param key: sha256 built by DiskResultCache.key
+        :param mailbox_id: Mailbox ID the message was taken from
+        :param config: Digest built by DiskResultCache.config_digest
+        :return: The serialized email as a dict, or None if there is no valid entry
+        """
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT data FROM parse_results WHERE sha256 = ? AND mailbox_id = ? "
+                    "AND config = ? AND parser_version = ? AND created >= ?",
+                    (key, mailbox_id, config, self.parser_version, self._oldest()),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, mailbox_id: str, data: dict, config: str = ""):
+        """
+        :param key: sha256 built by DiskResultCache.key
+        :param mailbox_id: Mailbox ID the message was taken from
+        :param data: Serialized email, as returned by IconEmail.make_serializable
+        :param config: Digest built by DiskResultCache.config_digest
+        """
+        encoded = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO parse_results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, mailbox_id, config, self.parser_version, time.time(), encoded),
+            )
+
+    def prune(self) -> int:
+        """
+        Deletes expired entries and the ones written by another parser version
+
+        :return: Number of entries deleted
+        """
+        with self._lock:
+            cursor = self._connect().execute(
+                "DELETE FROM parse_results WHERE parser_version != ? OR created < ?",
+                (self.parser_version, self._oldest()),
+            )
+        return cursor.rowcount
+
+    def __len__(self):
+        with self._lock:
+            return (
+                self._connect()
+                .execute("SELECT COUNT(*) FROM parse_results")
+                .fetchone()[0]
+            )
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _oldest(self) -> float:
+        if self.ttl is None:
+            return float("-inf")
+        return time.time() - self.ttl
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            # Inherited across fork, SQLite connections can't be shared with the parent.
+            # It isn't closed either, the parent may still be using it.
+            self._connection = None
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(_SCHEMA)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+
+class CachedEmailParser(object):
+    """
+    Puts a DiskResultCache in front of an EmailParser. It can be handed to BatchEmailParser
+    in place of the parser. make_email returns a SerializedEmail, read from the cache or
+    parsed and written to it. Results cut short by the parser's limits aren't cached.
+    """
+
+    def __init__(self, parser, cache: DiskResultCache):
+        """
+        :param parser: EmailParser used on a miss
+        :param cache: DiskResultCache to read from and write to
+        """
+        self.parser = parser
+        self.cache = cache
+
+    @property
+    def logger(self):
+        return self.parser.logger
+
+    def make_email(self, raw_email, mailbox_id: str):
+        """
+        :param raw_email: Raw email as bytes, str or an email.message object
+        :param mailbox_id: Mailbox ID the message was taken from
+        :return: SerializedEmail
+        """
+        if not isinstance(raw_email, (bytes, bytearray, memoryview, str)):
+            # There are no raw bytes to key on
+            return SerializedEmail(
+                self.parser.make_email(raw_email, mailbox_id).make_serializable()
+            )
+
+        key = self.cache.key(raw_email)
+        config = self.cache.config_digest(self.parser.result_cache_config())
+        data = self.cache.get(key, mailbox_id, config)
+        if data is None:
+            email = self.parser.make_email(raw_email, mailbox_id)
+            data = email.make_serializable()
+            if email.limit_exceeded is None:
+                self.cache.put(key, mailbox_id, data, config)
+        return SerializedEmail(data)
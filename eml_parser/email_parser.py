@@ -1,17 +1,86 @@
-import email
-from email.header import decode_header, make_header
+from email import message_from_string
+from email.header import Header, decode_header, make_header
+from email.parser import BytesFeedParser, BytesParser
+import mmap
+import os
 import re
 
-from bs4 import UnicodeDammit
 from base64 import b64decode
+from functools import partial
 from logging import Logger
-from email import message, parser
+from email import message
 
+from eml_parser.attachment_store import AttachmentStore
+from eml_parser.body_decoder import decode_part
+from eml_parser.batch import BatchEmailParser
 from eml_parser.email_cleaner import get_emails_as_list, get_emails_as_string
-from eml_parser.icon_email import IconEmail
+from eml_parser.hashing import DEFAULT_ALGORITHMS, MultiHasher, iter_decoded
+from eml_parser.headers_only import EmailHeaders, parse_headers_only
+from eml_parser.icon_email import IconEmail, LazyIconEmail
 from eml_parser.icon_file import IconFile
 from eml_parser.microsoft_newline_cleaner import remove_microsoft_newlines
+from eml_parser.exceptions import EmailParserException
+from eml_parser.feed_session import FeedSession
 from eml_parser.indicators import Indicators
+from eml_parser.limits import ParseLimits, current_budget, decoded_size, nested
+from eml_parser.metrics import instrument
+from eml_parser.result_cache import ParseResultCache
+from eml_parser.slow_capture import SlowMessageCapture
+
+# Everything the fields projection of EmailParser can select
+ALL_FIELDS = frozenset(("headers", "body", "attachments", "indicators", "nested"))
+
+
+def normalize_header_value(value: str) -> str:
+    """
+    Folded header values keep whatever line endings the raw message used.
+    Normalize them to plain newlines so every message reports headers the same way.
+    """
+    if "\r" in value:
+        value = "\n".join(value.splitlines())
+    return value
+
+
+def header_to_str(value):
+    """
+    Returns a header value as a string.
+
+    When a message is parsed from bytes, headers holding raw 8-bit data come back as Header
+    objects (or strings with surrogate escapes) instead of plain text. Those bytes are almost
+    always UTF-8, so decode them as such.
+
+    :param value: Header value as returned by email.message
+    :return: str (or None if the header is missing)
+    """
+    if isinstance(value, Header):
+        value = "".join(
+            (
+                chunk.decode("utf-8", errors="replace")
+                if isinstance(chunk, bytes)
+                else chunk
+            )
+            for chunk, _ in decode_header(value)
+        )
+    elif isinstance(value, str) and not value.isascii():
+        value = value.encode("utf-8", errors="surrogateescape").decode(
+            "utf-8", errors="replace"
+        )
+    return value
+
+
+def message_from_buffer(buffer, chunk_size: int = 1024 * 1024) -> message:
+    """
+    Parses a message from a bytes-like buffer (e.g. a memory map) without copying all of it
+    into a bytes object first.
+
+    :param buffer: bytes-like object holding a raw message
+    :param chunk_size: Number of bytes handed to the parser at once
+    :return: email.message object
+    """
+    feed_parser = BytesFeedParser()
+    for start in range(0, len(buffer), chunk_size):
+        feed_parser.feed(buffer[start : start + chunk_size])
+    return feed_parser.close()
 
 
 class EmailParser(object):
@@ -21,8 +90,79 @@ class EmailParser(object):
     and usable by InsightConnect.
     """
 
-    def __init__(self, logger: Logger):
+    def __init__(
+        self,
+        logger: Logger,
+        hash_algorithms: tuple = DEFAULT_ALGORITHMS,
+        attachment_store: AttachmentStore = None,
+        result_cache: ParseResultCache = None,
+        metrics=None,
+        slow_capture: SlowMessageCapture = None,
+        limits: ParseLimits = None,
+        fields=None,
+        lazy_nested: bool = False,
+        attachment_sink=None,
+    ):
+        """
+        :param logger: Logger object
+        :param hash_algorithms: Digests to compute for bodies and attachments, any of md5, sha1 and sha256
+        :param attachment_store: Optional AttachmentStore, identical attachments are then hashed and kept once
+        :param result_cache: Optional ParseResultCache, raw messages seen before are then not parsed again
+        :param metrics: Optional callable, receives an eml_parser.metrics.MessageMetrics with the time
+                        spent in each stage for every message parsed or serialized
+        :param slow_capture: Optional SlowMessageCapture, messages that are slow to parse are then
+                             profiled and saved
+        :param limits: Optional ParseLimits, parsing stops when a message goes over one of them
+        :param fields: Optional projection, any of headers, body, attachments, indicators and nested.
+                       Only the requested parts of each email are extracted, by default all are.
+                       Sender, subject, recipients and date are always extracted.
+        :param lazy_nested: If True, attached emails are LazyIconEmails, only parsed when first read
+        :param attachment_sink: Optional callable receiving the decoded content of every attachment
+                                in chunks, IconFiles then keep its handle instead of the content.
+                                See eml_parser.attachment_sink.
+        """
         self.logger = logger
+        self.hash_algorithms = tuple(hash_algorithms)
+        self.attachment_store = attachment_store
+        self.result_cache = result_cache
+        self.metrics = metrics
+        self.slow_capture = slow_capture
+        self.limits = limits
+        if fields is None:
+            fields = ALL_FIELDS
+        unknown = set(fields) - ALL_FIELDS
+        if unknown:
+            raise EmailParserException(
+                f"Unknown field(s): {', '.join(sorted(unknown))}"
+            )
+        self.fields = frozenset(fields)
+        self.lazy_nested = lazy_nested
+        self.attachment_sink = attachment_sink
+        self._instrumented = self._instrument()
+
+    def __getstate__(self):
+        # Instrumented methods are closures, they are rebuilt when unpickled
+        state = dict(self.__dict__)
+        for name in self._instrumented:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._instrumented = self._instrument()
+
+    def _instrument(self) -> tuple:
+        """
+        Wraps methods of this instance for metrics and slow message capture, if enabled
+
+        :return: Names of the wrapped methods
+        """
+        wrapped = ()
+        if self.metrics is not None:
+            wrapped += tuple(instrument(self, self.metrics))
+        if self.slow_capture is not None:
+            wrapped += self.slow_capture.instrument(self)
+        return wrapped
 
     def make_email_from_raw(self, email_message: message, mailbox_id: str) -> IconEmail:
         """
@@ -37,6 +177,166 @@ class EmailParser(object):
 
         return self.format_result(email_message, mailbox_id)
 
+    def make_email(self, raw_email, mailbox_id: str) -> IconEmail:
+        """
+        Converts a raw email in any of the supported forms into an IconEmail
+
+        :param raw_email: Raw email as bytes, str or an email.message object
+        :param mailbox_id: Optional message ID.
+        :return: IconEmail
+        """
+
+        if isinstance(raw_email, (bytes, bytearray, memoryview)):
+            return self.make_email_from_bytes(bytes(raw_email), mailbox_id)
+        if isinstance(raw_email, str):
+            return self._cached(
+                raw_email,
+                mailbox_id,
+                lambda: self.make_email_from_raw(
+                    message_from_string(raw_email), mailbox_id
+                ),
+            )
+        return self.make_email_from_raw(raw_email, mailbox_id)
+
+    def feed_session(self, mailbox_id: str) -> FeedSession:
+        """
+        Starts parsing a message that is received in chunks, e.g. while it is downloaded.
+
+        Feed the raw bytes to the session's feed() as they arrive, close() returns the
+        IconEmail. Parsing and attachment hashing happen as the chunks come in, and the
+        chunks are never joined into one bytes object. The parsed email.message still holds
+        every payload until close().
+
+        :param mailbox_id: Mailbox ID the message is taken from
+        :return: FeedSession
+        """
+
+        return FeedSession(self, mailbox_id)
+
+    @staticmethod
+    def parse_headers_only(raw_email) -> EmailHeaders:
+        """
+        Parses only the headers of a raw email, for triage and routing.
+
+        Only the header block, up to the first blank line, is read. No email.message object
+        is built and the body is never touched, so this takes the same time whatever the
+        size of the message.
+
+        :param raw_email: Raw email as bytes or str, a path as an os.PathLike (e.g. pathlib.Path),
+                          or a file object opened in binary mode
+        :return: EmailHeaders with sender, recipients, subject, date_received, message_id and headers
+        """
+
+        return parse_headers_only(raw_email)
+
+    def parse_many(
+        self,
+        raw_messages,
+        mailbox_id: str,
+        workers: int = None,
+        ordered: bool = True,
+        chunk_size: int = 16,
+    ):
+        """
+        Parses many raw emails in parallel across a pool of worker processes.
+
+        A message that fails to parse doesn't stop the batch, its outcome carries the error instead.
+
+        :param raw_messages: Iterable of raw emails as bytes, str or email.message objects
+        :param mailbox_id: Mailbox ID the messages were taken from
+        :param workers: Number of worker processes, defaults to the CPU count. 0 parses serially
+        :param ordered: Yield outcomes in input order, or as soon as they are ready
+        :param chunk_size: Number of messages sent to a worker at once
+        :return: Generator of ParseOutcome (index, email, error)
+        """
+
+        batch_parser = BatchEmailParser(self, workers=workers, chunk_size=chunk_size)
+        return batch_parser.parse(raw_messages, mailbox_id, ordered=ordered)
+
+    def make_email_from_bytes(self, raw_email: bytes, mailbox_id: str) -> IconEmail:
+        """
+        Converts a raw email in bytes into an IconEmail.
+
+        Parsing bytes directly avoids decoding the whole message to a string first, and
+        works for 8-bit mail that isn't valid UTF-8.
+
+        :param raw_email: Raw email bytes
+        :param mailbox_id: Optional message ID.
+        :return: IconEmail
+        """
+
+        return self._cached(
+            raw_email,
+            mailbox_id,
+            lambda: self.make_email_from_raw(
+                BytesParser().parsebytes(raw_email), mailbox_id
+            ),
+        )
+
+    def make_email_from_file(self, source, mailbox_id: str) -> IconEmail:
+        """
+        Converts a raw email stored in a file into an IconEmail.
+
+        Paths are memory mapped and fed to the parser in chunks, so the file is never read
+        into a single bytes object. The parsed email.message still holds every payload.
+
+        :param source: Path to an email file, or a file object opened in binary mode
+        :param mailbox_id: Optional message ID.
+        :return: IconEmail
+        """
+
+        if not isinstance(source, (str, bytes, os.PathLike)):
+            return self.make_email_from_raw(BytesParser().parse(source), mailbox_id)
+
+        with open(source, "rb") as email_file:
+            if os.fstat(email_file.fileno()).st_size == 0:
+                # Empty files can't be memory mapped
+                return self.make_email_from_bytes(b"", mailbox_id)
+
+            with mmap.mmap(
+                email_file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as email_map:
+                return self._cached(
+                    email_map,
+                    mailbox_id,
+                    lambda: self.make_email_from_raw(
+                        message_from_buffer(email_map), mailbox_id
+                    ),
+                )
+
+    def _cached(self, raw_email, mailbox_id: str, parse) -> IconEmail:
+        """
+        Returns the cached result for raw_email, or calls parse and caches what it returns
+
+        :param raw_email: Raw email as bytes, a bytes-like object or str
+        :param mailbox_id: Mailbox ID the message was taken from
+        :param parse: Function that parses raw_email, called on a cache miss
+        :return: IconEmail
+        """
+        if self.result_cache is None or current_budget() is not None:
+            # Emails parsed within another message's budget may be cut short by it
+            return parse()
+
+        key = self.result_cache.key(raw_email, mailbox_id, self.result_cache_config())
+        result = self.result_cache.get(key)
+        if result is None:
+            result = parse()
+            if result.limit_exceeded is None:
+                # A partial result would be returned for every later parse of the message
+                self.result_cache.put(key, result, len(raw_email))
+        return result
+
+    def result_cache_config(self) -> tuple:
+        """
+        :return: The settings that change what this parser returns, part of its cache keys
+        """
+        return (
+            tuple(sorted(self.fields)),
+            self.hash_algorithms,
+            self.lazy_nested,
+            self.attachment_sink,
+        )
+
     # This builds an IconEmail from a python email object
     def format_result(self, msg: message, mailbox_id: str) -> IconEmail:
         """
@@ -48,18 +348,27 @@ class EmailParser(object):
         :return: IconEmail
         """
 
-        result = IconEmail()
-        result.account = mailbox_id
-        result.date_received = msg["Date"]
-        result.sender = get_emails_as_string(msg.get("From", ""))
-        result.subject = str(
-            make_header(decode_header(msg["Subject"]))
-        )  # This will decode mime words
-        result.is_read = False
-        result.recipients = self.get_recipients(msg)
-        result.body = self.get_body(msg)
-        result.headers = self.get_headers(msg)
-        result.indicators = Indicators(result.body)
+        if self.limits is not None and current_budget() is None:
+            with self.limits.track() as budget:
+                result = self._format_result(msg, mailbox_id)
+            result.limit_exceeded = budget.exceeded
+            return result
+
+        result = self._format_result(msg, mailbox_id)
+        budget = self._budget()
+        if budget is not None and budget.exceeded is not None:
+            # An attached email, parsing stopped before it was complete
+            result.limit_exceeded = budget.exceeded
+        return result
+
+    def _format_result(self, msg: message, mailbox_id: str) -> IconEmail:
+        result = self.format_message(msg, mailbox_id)
+
+        budget = self._budget()
+        if budget is not None and budget.exceeded is not None:
+            return result
+        if not self.fields & {"attachments", "nested"}:
+            return result
 
         (
             result.attached_files,
@@ -72,12 +381,74 @@ class EmailParser(object):
                 if orphan not in result.body:
                     result.body += orphan
 
-        result.has_attachments = False
-        if len(result.attached_files) > 0 or len(result.attached_emails) > 0:
-            result.has_attachments = True
+        self.set_has_attachments(result)
+        return result
+
+    def format_message(self, msg: message, mailbox_id: str) -> IconEmail:
+        """
+        Builds an IconEmail from everything in a message except its attachments
+
+        :param msg: email.message object to extract information from
+        :param mailbox_id: Mailbox ID that this message was take from
+        :return: IconEmail
+        """
+
+        result = IconEmail()
+        result.account = mailbox_id
+        result.date_received = header_to_str(msg["Date"])
+        result.sender = get_emails_as_string(header_to_str(msg.get("From", "")))
+        result.subject = str(
+            make_header(decode_header(header_to_str(msg["Subject"])))
+        )  # This will decode mime words
+        result.is_read = False
+        result.recipients = self.get_recipients(msg)
+        if "body" in self.fields:
+            result.body = self.get_body(msg)
+        if "headers" in self.fields:
+            result.headers = self.get_headers(msg)
+
+        budget = self._budget()
+        if budget is not None and not budget.add_bytes(len(result.body or "")):
+            self.logger.info(
+                f"Parse limit {budget.exceeded} exceeded, skipping the rest"
+            )
+            return result
 
+        if "body" in self.fields and "indicators" in self.fields:
+            result.indicators = self.make_indicators(result.body)
         return result
 
+    def _budget(self):
+        """The budget of the message being parsed, if the parser has limits"""
+        return current_budget() if self.limits is not None else None
+
+    def make_indicators(
+        self, content, content_transfer_encoding: str = ""
+    ) -> Indicators:
+        """
+        Hashes content with the parser's hash algorithms
+
+        :param content: Content to hash, str or bytes
+        :param content_transfer_encoding: If base64, the decoded content is hashed
+        :return: Indicators
+        """
+        return Indicators(content, content_transfer_encoding, self.hash_algorithms)
+
+    def serialize(self, email: IconEmail) -> dict:
+        """
+        Converts a parsed email to a JSON-serializable dict, timed when metrics are enabled
+
+        :param email: IconEmail
+        :return: dict
+        """
+        return email.make_serializable()
+
+    @staticmethod
+    def set_has_attachments(icon_email: IconEmail):
+        icon_email.has_attachments = False
+        if len(icon_email.attached_files) > 0 or len(icon_email.attached_emails) > 0:
+            icon_email.has_attachments = True
+
     @staticmethod
     def get_headers(msg: message) -> list:
         """
@@ -87,11 +458,16 @@ class EmailParser(object):
         :return: List of headers
         """
 
-        headers = parser.HeaderParser().parsestr(msg.as_string())
-        header_list = []
-        for h in headers.items():
-            header_list.append({"name": str(h[0]), "value": str(h[1])})
-        return header_list
+        # Read the headers straight off the parsed message. Re-serializing the whole
+        # message (attachments included) just to re-parse the header block is by far
+        # the most expensive way to get the same list.
+        return [
+            {
+                "name": str(name),
+                "value": normalize_header_value(str(header_to_str(value))),
+            }
+            for name, value in msg.items()
+        ]
 
     def get_body(self, msg):
         """
@@ -99,8 +475,13 @@ class EmailParser(object):
         :param msg: raw message
         :return: body as String
         """
-        bdy = self.decode_body(msg)
-        bdy = remove_microsoft_newlines(bdy)
+        body_part = self.body_part(msg)
+        bdy = self.decode_body(msg, body_part)
+        part = body_part[0]
+        transfer_encoding = (
+            "" if part is None else part.get("Content-Transfer-Encoding")
+        )
+        bdy = remove_microsoft_newlines(bdy, str(transfer_encoding or ""))
         return bdy
 
     def get_recipients(self, msg: message) -> list:
@@ -113,9 +494,9 @@ class EmailParser(object):
 
         recipients = None
         if "To" in msg:
-            recipients = msg["To"]
+            recipients = header_to_str(msg["To"])
         elif "Delivered-To" in msg:
-            recipients = msg["Delivered-To"]
+            recipients = header_to_str(msg["Delivered-To"])
 
         if not recipients:
             self.logger.info("No To address.")
@@ -124,14 +505,29 @@ class EmailParser(object):
         recipients = get_emails_as_list(recipients)
         return recipients
 
-    def decode_body(self, msg: message) -> str:
+    def decode_body(self, msg: message, body_part: tuple = None) -> str:
         """
         Get the body of an email.
 
         :param msg: email.message object to extract information from
-        :param logger: logger
+        :param body_part: What body_part returned for msg, if it was already looked up
         :return: Body of the email (String)
         """
+        part, strip_newlines = body_part or self.body_part(msg)
+        if part is None:
+            return None
+
+        body = decode_part(part)
+        return body.replace("\n", "") if strip_newlines else body
+
+    def body_part(self, msg: message) -> tuple:
+        """
+        Find the part the body of an email is taken from.
+
+        :param msg: email.message object to extract information from
+        :return: Tuple of the part (None if there is no body) and whether the newlines are
+                 removed from its text
+        """
         if msg.is_multipart():
             message_content_type = msg.get_content_type()
 
@@ -140,51 +536,32 @@ class EmailParser(object):
             # being the most faithful to the original message
             # http://blog.magiksys.net/parsing-email-using-python-content
             if "multipart/alternative" == message_content_type.lower():
-                body = self.prep_multipart_alt_body(msg)
-                return body
+                return self.multipart_alt_body_part(msg)
             else:
                 for part in msg.walk():
                     content_type = part.get_content_type()
                     content_disposition = str(part.get("Content-Disposition"))
 
                     if "multipart/alternative" == content_type.lower():
-                        body = self.prep_multipart_alt_body(part)
-                        return body
+                        return self.multipart_alt_body_part(part)
 
                     elif (
-                        content_type == "text/plain"
+                        content_type in ("text/plain", "text/html")
                         and "attachment" not in content_disposition.lower()
                     ):
-                        body = self.prep_body(part)
-                        return body
+                        return part, True
 
-                    elif (
-                        content_type == "text/html"
-                        and "attachment" not in content_disposition.lower()
-                    ):
-                        body = self.prep_body(part)
-                        return body
+                return None, False
 
         else:  # NOT MULTIPART MESSAGE
-            try:
-                return msg.get_payload(decode=True).decode("utf-8")
-            except Exception:
-                self.logger.debug(
-                    "Decode failed, attempting to remove offending characters"
-                )
-                return (
-                    UnicodeDammit.detwingle(msg.get_payload(decode=True))
-                    .decode("utf-8", errors="ignore")
-                    .replace("\n", "")
-                )
+            return msg, False
 
-    @staticmethod
-    def prep_multipart_alt_body(msg):
+    def multipart_alt_body_part(self, msg) -> tuple:
         """
-        Takes a multipart/alternative part, extracts the payload, and decodes it if necessary.
+        Takes a multipart/alternative part and finds the payload the body is taken from.
 
         :param msg: multipart/alternative message
-        :return: body (string)
+        :return: Tuple of the part and whether the newlines are removed from its text
         """
         payloads = msg.get_payload(decode=False)
 
@@ -195,23 +572,20 @@ class EmailParser(object):
         stripped out)
         """
 
-        body = payloads[-1].get_payload()
-        content_transfer_encoding = payloads[-1].get("Content-Transfer-Encoding")
+        if payloads[-1].is_multipart():
+            # e.g. multipart/related holding the HTML along with its images
+            return self.body_part(payloads[-1])
 
-        # In some rare cases, a Content-Transfer_Encoding type is not provided. In that case we will return
-        # the contents as is. I believe this doesn't conform to email standards, but Microsoft does it anyway
+        return payloads[-1], False
 
-        if content_transfer_encoding and "base64" == content_transfer_encoding.lower():
-            body = body.replace("\n", "")
-            try:
-                body = b64decode(body).decode("utf-8")
-            except Exception as ex:
-                log.error("Failed to decode base64 body, retuning the body as is")
-                log.error(ex)
-                pass
+    def prep_multipart_alt_body(self, msg):
+        """
+        Takes a multipart/alternative part, extracts the payload, and decodes it if necessary.
 
-        remove_microsoft_newlines(body)
-        return body
+        :param msg: multipart/alternative message
+        :return: body (string)
+        """
+        return self.decode_body(msg, self.multipart_alt_body_part(msg))
 
     def prep_body(self, part):
         """
@@ -221,29 +595,20 @@ class EmailParser(object):
         :param part: html or text message
         :return: body (string)
         """
-        try:
-            body = (
-                part.get_payload(decode=True).decode("utf-8").replace("\n", "")
-            )  # decode
-        except Exception as ex:
-            self.logger.debug(ex)
-            self.logger.debug(
-                "Failed to parse email as UTF-8, attempting to detwingle first before retrying parse"
-            )
-            body = (
-                UnicodeDammit.detwingle(part.get_payload(decode=True))
-                .decode("utf-8", errors="ignore")
-                .replace("\n", "")
-            )
-        remove_microsoft_newlines(body)
-        return body
+        return self.decode_body(part, (part, True))
 
-    def attachments(self, mail, mailbox_id):
+    def attachments(self, mail, mailbox_id, shape=None):
         """
         Decode attachments from the raw message
 
+        Every MIME part is visited exactly once. An attached email's parts belong to that
+        email and to every email above it in the tree, so anything found inside it is added
+        to the attachment lists of all of its ancestors as well as its own.
+
         :param mail: Raw message to decode
         :param mailbox_id: Mailbox ID that this message was received from
+        :param shape: Optional eml_parser.metrics.MessageMetrics, the size, count and nesting
+                      depth of the parts walked are added to it
         :return:
         file_attachments - List of IconFiles
         email_attachments - List of IconEmails
@@ -254,108 +619,386 @@ class EmailParser(object):
         )  # For some reason, we will get text parts not associated with any emails
         file_attachments = []
         email_attachments = []
-
-        filename_pattern = re.compile('name=".*"')
-        count = 0
-
-        for part in mail.walk():
-            count += 1
+        attached_emails = []
+        # Attached emails whose parts are walked here, by id() of their attached_files
+        walked_emails = {}
+
+        # Depth first, in the same order as mail.walk(). Each entry holds a part along with the
+        # (files, emails) attachment lists of every email that part belongs to.
+        stack = [(mail, ((file_attachments, email_attachments),))]
+        budget = self._budget()
+        while stack:
+            part, owners = stack.pop()
+            # How deep the email this part belongs to is nested
+            depth = (budget.depth if budget else 0) + len(owners) - 1
+            if budget is not None and not budget.add_part():
+                self.logger.info(f"Parse limit {budget.exceeded} exceeded, stopping")
+                stack.append((part, owners))
+                break
+
+            children = part.get_payload() if part.is_multipart() else []
+            child_owners = [owners] * len(children)
+
+            if shape is not None:
+                shape.part_count += 1
+                shape.depth = max(shape.depth, len(owners) - 1)
+                if not children:
+                    payload = part.get_payload()
+                    if isinstance(payload, str):
+                        shape.size += len(payload)
 
             content_type = part.get_content_maintype()
             self.logger.info(f"Content main type: {content_type}")
 
             if not content_type or content_type == "multipart":
-                continue
+                pass
 
             ##################
             # Email Attachments
             ##################
 
-            if part.get_content_maintype() == "message":
-                if part.is_multipart():
+            elif content_type == "message":
+                if "nested" not in self.fields:
+                    continue
+                if budget is not None and not budget.allows_depth(depth + 1):
+                    self.logger.info(
+                        f"Parse limit {budget.exceeded} exceeded, stopping"
+                    )
+                    stack.append((part, owners))
+                    break
+                if self.lazy_nested:
+                    # Parsed when first read, their parts aren't walked here
+                    if not part.is_multipart():
+                        children = [part.get_payload()]
+                    for attached_message in children:
+                        lazy_email = self.lazy_email(
+                            partial(
+                                self.make_email_from_raw, attached_message, mailbox_id
+                            ),
+                            depth + 1,
+                        )
+                        for _, owner_emails in owners:
+                            owner_emails.append(lazy_email)
+                    children = []
+                elif part.is_multipart():
                     self.logger.info("Parsing attached multipart email")
-                    content = part.get_payload()
                     # EMAILCEPTION
-                    for message in content:
-                        new_message = self.format_result(message, mailbox_id)
-                        email_attachments.append(new_message)
+                    for index, attached_message in enumerate(children):
+                        new_message = self.format_message(attached_message, mailbox_id)
+                        new_message.attached_files = []
+                        new_message.attached_emails = []
+                        for _, owner_emails in owners:
+                            owner_emails.append(new_message)
+                        attached_emails.append(new_message)
+                        walked_emails[id(new_message.attached_files)] = new_message
+                        child_owners[index] = owners + (
+                            (new_message.attached_files, new_message.attached_emails),
+                        )
                 else:
                     self.logger.info("Parsing attached email")
-                    content = part.get_payload()
-                    new_email = self.make_email_from_raw(content, mailbox_id)
-                    email_attachments.append(new_email)
-                continue
-
-            # We've tried all the message types...
-            filename = part.get_filename()
+                    with nested(budget, depth + 1):
+                        new_email = self.make_email_from_raw(
+                            part.get_payload(), mailbox_id
+                        )
+                    for _, owner_emails in owners:
+                        owner_emails.append(new_email)
 
             #################
             # File Attachments
             #################
-            if filename is None:
-                # Attempt to get filename from Content-Type header
-                part_content_type = part.get("Content-Type")
-                content_line = []
-                if part_content_type:
-                    content_line = filename_pattern.findall(part_content_type)
-                # Test if array has contents
-                if content_line:
-                    # Attempt parsing filename, it *might* be here
-                    filename = content_line[0].lstrip("name=").strip('"')
-                    logger.debug("Content-Type filename: %s", filename)
-
-            # If we still don't have a file name, skip this part
-            if not filename:
-                self.logger.info(
-                    "Could not find filename of attachment, ignoring attachment."
-                )
-                continue
-                # filename = 'Attachment-{}'.format(count)
-                # logger.debug('Dynamic filename: %s', filename)
 
-            content = part.get_payload(decode=False)
+            elif "attachments" in self.fields or "nested" in self.fields:
+                # With only "nested", attached .eml files are still converted
+                with nested(budget, depth):
+                    attachment = self.part_to_attachment(part, mailbox_id)
+                if isinstance(attachment, IconEmail):
+                    for _, owner_emails in owners:
+                        owner_emails.append(attachment)
+                elif attachment is not None:
+                    for owner_files, _ in owners:
+                        owner_files.append(attachment)
+
+            if budget is not None and budget.exceeded is not None:
+                self.logger.info(f"Parse limit {budget.exceeded} exceeded, stopping")
+                stack.extend(zip(children, child_owners))
+                break
+
+            stack.extend(reversed(list(zip(children, child_owners))))
+
+        # The stack now only holds parts left unvisited because a limit was hit, the emails
+        # they belong to are incomplete
+        for _, owners in stack:
+            for owner_files, _ in owners:
+                truncated_email = walked_emails.get(id(owner_files))
+                if truncated_email is not None:
+                    truncated_email.limit_exceeded = budget.exceeded
+
+        for attached_email in attached_emails:
+            self.set_has_attachments(attached_email)
+
+        # Remove duplicates. Python will have the same orphan at different levels
+        # in the email tree
+        orphaned_text = list(set(orphaned_text))
+
+        return file_attachments, email_attachments, orphaned_text
 
-            # If not a string
-            if not isinstance(content, str):
-                content = part.as_string()
-                self.logger.debug("Content not string")
+    def part_to_attachment(self, part: message, mailbox_id: str):
+        """
+        Converts a single, non-multipart MIME part to an attachment
 
-            content = content.replace("\r\n", "")
+        :param part: email.message part to convert
+        :param mailbox_id: Mailbox ID that this message was received from
+        :return: IconFile, IconEmail for attached .eml files, or None if the part isn't an attachment
+        """
 
-            content_transfer_encoding = part.get("Content-Transfer-Encoding", "")
+        # If we still don't have a file name, skip this part
+        filename = self.attachment_filename(part)
+        if not filename:
+            self.logger.info(
+                "Could not find filename of attachment, ignoring attachment."
+            )
+            return None
+
+        filename = str(make_header(decode_header(header_to_str(filename))))
+        is_eml = filename.endswith(".eml") and "nested" in self.fields
+        if not is_eml and "attachments" not in self.fields:
+            return None  # Only attached emails were asked for
+
+        # Content streamed to a sink is cleaned chunk by chunk instead of copied whole
+        _, content, content_transfer_encoding = self.attachment_content(
+            part, clean=self.attachment_sink is None
+        )
+
+        budget = self._budget()
+        if budget is not None and not budget.add_bytes(
+            decoded_size(content, content_transfer_encoding), attachment=True
+        ):
+            self.logger.info(
+                f"Parse limit {budget.exceeded} exceeded, skipping {filename}"
+            )
+            return None
+
+        content_type = part.get_content_type()
+
+        #################
+        #  Attached .eml
+        #################
+        if is_eml and self.lazy_nested:
+            # Neither hashed nor parsed until the email is read
+            return self.lazy_email(
+                partial(
+                    self.convert_attached_eml,
+                    filename,
+                    content_type,
+                    content,
+                    content_transfer_encoding,
+                    mailbox_id,
+                ),
+                budget.depth if budget else 0,
+            )
+
+        if is_eml:
+            # Only the content is needed to convert it, it's hashed if it ends up a file
+            unhashed = IconFile(file_name=filename, content=content, hash_algorithms=())
+            try:
+                return self.convert_icon_file_to_email(unhashed, mailbox_id)
+            except Exception:  # Conversion failed, attach it as a file.
+                self.logger.info(f"Conversion of {filename} failed, attaching as file")
+
+        return self.make_icon_file(
+            filename, content_type, content, content_transfer_encoding
+        )
+
+    def make_icon_file(
+        self,
+        filename: str,
+        content_type: str,
+        content: str,
+        content_transfer_encoding: str = "",
+    ) -> IconFile:
+        """
+        Builds an IconFile, hashing its content as the parser is configured to
+
+        :param filename: Decoded file name
+        :param content_type: Content type of the attachment
+        :param content: Content as found in the MIME part
+        :param content_transfer_encoding: If base64, the decoded content is hashed
+        :return: IconFile
+        """
+        if self.attachment_sink is not None:
+            return self.sink_icon_file(
+                filename, content_type, content, content_transfer_encoding
+            )
+
+        hash_algorithms = self.hash_algorithms
+        if "indicators" not in self.fields:
+            # An empty Indicators is built without touching the content
+            indicators = None
+            hash_algorithms = ()
+        elif self.attachment_store is not None:
+            content, indicators = self.attachment_store.add(
+                content, content_transfer_encoding, self.hash_algorithms
+            )
+        else:
+            indicators = self.make_indicators(content, content_transfer_encoding)
+
+        icon_file = IconFile(
+            file_name=filename,
+            content_type=content_type,
+            content=content,
+            content_transfer_encoding=content_transfer_encoding,
+            hash_algorithms=hash_algorithms,
+            indicators=indicators,
+        )
+        if "indicators" not in self.fields:
+            icon_file.indicators = None
+        return icon_file
+
+    def sink_icon_file(
+        self,
+        filename: str,
+        content_type: str,
+        content: str,
+        content_transfer_encoding: str = "",
+    ) -> IconFile:
+        """
+        Streams an attachment to the attachment sink, hashing it on the way
+
+        The content is decoded one chunk at a time, so no decoded or cleaned copy of the
+        whole attachment is ever held.
+
+        :return: IconFile without content, holding the sink's handle
+        """
+        hasher = MultiHasher(
+            self.hash_algorithms if "indicators" in self.fields else ()
+        )
+
+        def hashed_chunks():
+            for chunk in iter_decoded(content, content_transfer_encoding):
+                hasher.update(chunk)
+                yield chunk
+
+        chunks = hashed_chunks()
+        handle = self.attachment_sink(filename, content_type, chunks)
+        for _ in chunks:
+            pass  # Whatever the sink didn't read still has to be hashed
+
+        icon_file = IconFile(
+            file_name=filename,
+            content_type=content_type,
+            content=None,
+            indicators=Indicators.from_digests(hasher.hexdigests()),
+            handle=handle,
+        )
+        if "indicators" not in self.fields:
+            icon_file.indicators = None
+        return icon_file
+
+    def attachment_content(self, part: message, clean: bool = True) -> tuple:
+        """
+        Finds the file name and the content of a single, non-multipart MIME part
+
+        :param part: email.message part
+        :param clean: Remove line breaks from the content, as it is hashed
+        :return: Tuple of (file name, content, content transfer encoding). The file name is None
+                 and the content is None when the part isn't an attachment.
+        """
+        filename = self.attachment_filename(part)
+        if not filename:
+            return None, None, ""
+
+        content = part.get_payload(decode=False)
+
+        # If not a string
+        if not isinstance(content, str):
+            content = part.as_string()
+            self.logger.debug("Content not string")
+
+        content_transfer_encoding = part.get("Content-Transfer-Encoding", "")
+        if clean:
+            content = content.replace("\r\n", "")
             if content_transfer_encoding.lower() == "base64":
                 content = content.replace("\n", "")
 
-            icon_file = IconFile(
-                file_name=filename,
-                content_type=part.get_content_type(),
-                content=content,
-                content_transfer_encoding=content_transfer_encoding,
+        return filename, content, content_transfer_encoding
+
+    def attachment_filename(self, part: message):
+        """
+        Finds the file name of a single, non-multipart MIME part, as found in its headers
+
+        :param part: email.message part
+        :return: File name, None if the part isn't an attachment
+        """
+
+        filename_pattern = re.compile('name=".*"')
+
+        # We've tried all the message types...
+        filename = part.get_filename()
+
+        if filename is None:
+            # Attempt to get filename from Content-Type header
+            part_content_type = part.get("Content-Type")
+            content_line = []
+            if part_content_type:
+                content_line = filename_pattern.findall(part_content_type)
+            # Test if array has contents
+            if content_line:
+                # Attempt parsing filename, it *might* be here
+                filename = content_line[0].lstrip("name=").strip('"')
+                self.logger.debug("Content-Type filename: %s", filename)
+
+        return filename
+
+    def convert_attached_eml(
+        self,
+        filename: str,
+        content_type: str,
+        content: str,
+        content_transfer_encoding: str,
+        mailbox_id: str,
+    ) -> IconEmail:
+        """
+        Parses an attached .eml file for a LazyIconEmail. If that fails, the file is kept as
+        the only attachment of an otherwise empty IconEmail.
+
+        :param filename: Decoded file name
+        :param content_type: Content type of the attachment
+        :param content: Content as found in the MIME part
+        :param content_transfer_encoding: Content-Transfer-Encoding of the content
+        :param mailbox_id: Mailbox ID that is being operated on
+        :return: IconEmail
+        """
+        unhashed = IconFile(file_name=filename, content=content, hash_algorithms=())
+        try:
+            return self.convert_icon_file_to_email(unhashed, mailbox_id)
+        except Exception:  # Conversion failed, keep it as a file.
+            self.logger.info(f"Conversion of {filename} failed, keeping the file")
+            icon_file = self.make_icon_file(
+                filename, content_type, content, content_transfer_encoding
+            )
+            return IconEmail(
+                account=mailbox_id, attached_files=[icon_file], has_attachments=True
             )
 
-            #################
-            #  Attached .eml
-            #################
-            icon_file.name = str(make_header(decode_header(icon_file.name)))
-            if icon_file.name.endswith(".eml"):
-                try:
-                    converted_file = self.convert_icon_file_to_email(
-                        icon_file, mailbox_id
-                    )
-                    email_attachments.append(converted_file)
-                    continue
-                except Exception:  # Conversion failed, attach it as a file.
-                    self.logger.info(
-                        f"Conversion of {icon_file.name} failed, attaching as file"
-                    )
+    def lazy_email(self, parse, depth: int) -> LazyIconEmail:
+        """
+        Wraps the parsing of an attached email in a LazyIconEmail
 
-            file_attachments.append(icon_file)
+        :param parse: Function without arguments that parses the attached email
+        :param depth: How deep the email is nested, counted against the parser's limits
+        :return: LazyIconEmail
+        """
+        if self.limits is None:
+            return LazyIconEmail(parse)
 
-        # Remove duplicates. Python will have the same orphan at different levels
-        # in the email tree
-        orphaned_text = list(set(orphaned_text))
+        def parse_within_limits():
+            # The email's own budget, starting at the depth it was found at
+            with self.limits.track() as budget, budget.nested(depth):
+                result = parse()
+            result.limit_exceeded = result.limit_exceeded or budget.exceeded
+            return result
 
-        return file_attachments, email_attachments, orphaned_text
+        return LazyIconEmail(parse_within_limits)
 
     def convert_icon_file_to_email(self, icon_file: IconFile, mailbox_id: str):
         """
@@ -370,9 +1013,15 @@ class EmailParser(object):
         self.logger.info(
             f"{icon_file.name} appears to be an .eml. Attempting to convert"
         )
+        budget = self._budget()
+        if budget is not None and not budget.allows_depth(budget.depth + 1):
+            raise EmailParserException(f"Parse limit {budget.exceeded} exceeded")
+
         decoded_bytes = b64decode(icon_file.content)
-        converted_email = self.make_email_from_raw(
-            email.message_from_string(decoded_bytes.decode()), mailbox_id
-        )
+        with nested(budget, budget.depth + 1 if budget else 0):
+            # Not through make_email_from_bytes, attached emails aren't cached
+            converted_email = self.make_email_from_raw(
+                BytesParser().parsebytes(decoded_bytes), mailbox_id
+            )
         self.logger.info(f"Conversion of {icon_file.name} succeeded")
         return converted_email
@@ -0,0 +1,136 @@
+"""
+Incremental parsing of messages received in chunks.
+
+A FeedSession is handed the raw message one chunk at a time, as it is downloaded, and
+builds the email.message tree with the standard library's BytesFeedParser as the chunks
+arrive. Each attachment is hashed as soon as its MIME part is complete, so by the time the
+last chunk is in, most of the work is done and close() only has to assemble the IconEmail.
+The chunks are never joined into a single bytes object, though the email.message tree
+holds every payload until the session is closed.
+"""
+
+import copy
+from email.message import Message
+from email.parser import BytesFeedParser
+from email.policy import compat32
+
+from eml_parser.attachment_store import AttachmentStore
+from eml_parser.exceptions import EmailParserException
+from eml_parser.icon_email import IconEmail
+from eml_parser.limits import decoded_size
+
+
+class FeedSession(object):
+    """
+    Parses one message fed in chunks through feed(), close() returns the IconEmail.
+
+    Attachments are hashed through the parser's AttachmentStore, or a store private to the
+    session when the parser doesn't have one, so the attachment walk done by close() finds
+    them already hashed. Sessions aren't thread-safe, use one per message.
+    """
+
+    def __init__(self, parser, mailbox_id: str):
+        """
+        :param parser: EmailParser that builds the IconEmail
+        :param mailbox_id: Mailbox ID the message is taken from
+        """
+        self.mailbox_id = mailbox_id
+        self.size = 0
+        self.closed = False
+
+        self._parser = parser
+        self._store = None
+        hashes_attachments = {"attachments", "indicators"} <= parser.fields
+        # Attachments streamed to a sink are hashed on the way there instead
+        if hashes_attachments and parser.attachment_sink is None:
+            self._store = parser.attachment_store
+            if self._store is None:
+                self._parser = copy.copy(parser)
+                self._parser.attachment_store = self._store = AttachmentStore()
+
+        self._digest = None
+        if parser.result_cache is not None:
+            self._digest = parser.result_cache.hasher()
+
+        # Parts that are still being received, checked after every chunk
+        self._pending = []
+        self._feed_parser = BytesFeedParser(self._new_part)
+        self._pending.clear()  # BytesFeedParser probes the factory once
+
+    def _new_part(self, policy=compat32) -> Message:
+        part = Message(policy=policy)
+        if self._store is not None:
+            self._pending.append(part)
+        return part
+
+    def feed(self, chunk: bytes):
+        """
+        Parses the next chunk of the raw message
+
+        :param chunk: bytes or any bytes-like object
+        """
+        if self.closed:
+            raise EmailParserException("Can't feed a closed FeedSession")
+
+        self.size += len(chunk)
+        if self._digest is not None:
+            self._digest.update(chunk)
+        self._feed_parser.feed(chunk)
+        self._hash_complete_parts()
+
+    def close(self) -> IconEmail:
+        """
+        Finishes parsing the message
+
+        :return: IconEmail
+        """
+        if self.closed:
+            raise EmailParserException("FeedSession is already closed")
+        self.closed = True
+
+        email_message = self._feed_parser.close()
+        self._pending.clear()
+
+        if self._digest is None:
+            return self._parser.make_email_from_raw(email_message, self.mailbox_id)
+
+        # Same key as make_email_from_bytes gives the whole message
+        result_cache = self._parser.result_cache
+        config = self._parser.result_cache_config()
+        key = ("bytes", self.mailbox_id, config, self._digest.digest())
+        result = result_cache.get(key)
+        if result is None:
+            result = self._parser.make_email_from_raw(email_message, self.mailbox_id)
+            result_cache.put(key, result, self.size)
+        return result
+
+    def _hash_complete_parts(self):
+        pending = []
+        for part in self._pending:
+            if part.is_multipart():
+                continue
+            if part.get_payload() is None:
+                pending.append(part)  # Still being received
+            elif part.get_content_maintype() != "message":
+                self._hash(part)
+        self._pending = pending
+
+    def _hash(self, part: Message):
+        filename, content, content_transfer_encoding = self._parser.attachment_content(
+            part
+        )
+        if not filename:
+            return
+
+        limits = self._parser.limits
+        if (
+            limits is not None
+            and limits.max_attachment_bytes is not None
+            and decoded_size(content, content_transfer_encoding)
+            > limits.max_attachment_bytes
+        ):
+            return  # Would be skipped by the attachment walk anyway
+
+        self._store.add(
+            content, content_transfer_encoding, self._parser.hash_algorithms
+        )
@@ -0,0 +1,158 @@
+import binascii
+import hashlib
+
+from eml_parser.exceptions import EmailParserException
+
+# Every digest an Indicators object knows how to report
+DEFAULT_ALGORITHMS = ("md5", "sha1", "sha256")
+
+# Content is fed to the digests this many characters at a time. Base64 is decoded in
+# chunks of the same size, so no decoded copy of a whole attachment is made. The encoded
+# content itself is still held by email.message.
+CHUNK_SIZE = 256 * 1024
+
+# Everything a non-strict base64 decoder keeps. Anything else (newlines, spaces, junk)
+# is skipped by binascii, which is what base64.b64decode does as well.
+_BASE64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+_BASE64_NOISE = bytes(set(range(256)) - set(_BASE64_ALPHABET))
+
+
+class MultiHasher(object):
+    """
+    Feeds every chunk of data to all of the requested digests in a single pass
+    """
+
+    def __init__(self, algorithms: tuple = DEFAULT_ALGORITHMS):
+        unsupported = set(algorithms) - set(DEFAULT_ALGORITHMS)
+        if unsupported:
+            raise EmailParserException(
+                f"Unsupported hash algorithm(s): {', '.join(sorted(unsupported))}"
+            )
+        self.hashes = {name: hashlib.new(name) for name in algorithms}
+
+    def update(self, data: bytes):
+        for digest in self.hashes.values():
+            digest.update(data)
+
+    def hexdigests(self) -> dict:
+        return {name: digest.hexdigest() for name, digest in self.hashes.items()}
+
+
+def iter_encoded(content, chunk_size: int = CHUNK_SIZE):
+    """
+    Yields content as UTF-8 bytes, chunk_size characters at a time.
+
+    :param content: str or bytes
+    :param chunk_size: Number of characters to encode at once
+    :return: Generator of bytes
+    """
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        for start in range(0, len(content), chunk_size):
+            yield bytes(content[start : start + chunk_size])
+        return
+
+    for start in range(0, len(content), chunk_size):
+        yield content[start : start + chunk_size].encode("UTF-8")
+
+
+def iter_base64_decoded(content, chunk_size: int = CHUNK_SIZE):
+    """
+    Decodes base64 content incrementally, yielding decoded bytes in bounded chunks.
+    Only the decoded copy of the whole content is avoided, the content passed in is kept
+    by the caller (usually email.message) as it is.
+
+    The result is the same as base64.b64decode(content): characters outside the base64
+    alphabet are ignored, decoding stops at the first complete padding and malformed
+    input raises binascii.Error.
+
+    :param content: base64 str or bytes
+    :param chunk_size: Number of encoded characters to read at once
+    :return: Generator of bytes
+    """
+    carry = b""
+    for start in range(0, len(content), chunk_size):
+        chunk = content[start : start + chunk_size]
+        if isinstance(chunk, str):
+            chunk = chunk.encode("ascii")
+        chunk = carry + bytes(chunk).translate(None, _BASE64_NOISE)
+
+        if b"=" in chunk:
+            # Padding ends the data. Whatever follows is either more padding or ignored by
+            # the decoder, so hand the rest to binascii in one go to keep its exact semantics.
+            rest = content[start + chunk_size :]
+            if isinstance(rest, str):
+                rest = rest.encode("ascii")
+            yield binascii.a2b_base64(chunk + bytes(rest))
+            return
+
+        # Only decode whole quads, the remainder carries into the next chunk
+        boundary = len(chunk) - len(chunk) % 4
+        carry = chunk[boundary:]
+        if boundary:
+            yield binascii.a2b_base64(chunk[:boundary])
+
+    if carry:
+        # Let binascii raise the same error b64decode would for truncated input
+        yield binascii.a2b_base64(carry)
+
+
+def iter_decoded(
+    content, content_transfer_encoding: str = "", chunk_size: int = CHUNK_SIZE
+):
+    """
+    Yields the bytes of an attachment as they are hashed, without a decoded or cleaned copy
+    of the whole content. The content itself is still held by email.message.
+
+    Base64 is decoded, anything else is encoded as UTF-8 with CRLF line breaks removed, the
+    same way EmailParser cleans attachment content before hashing it.
+
+    :param content: Content as found in the MIME part, str or bytes
+    :param content_transfer_encoding: Content-Transfer-Encoding of the content
+    :param chunk_size: Number of characters to handle at once
+    :return: Generator of bytes
+    """
+    if content_transfer_encoding.lower() == "base64":
+        yield from iter_base64_decoded(content, chunk_size)
+        return
+
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        content = bytes(content).decode("UTF-8", "surrogateescape")
+
+    carry = ""
+    for start in range(0, len(content), chunk_size):
+        chunk = carry + content[start : start + chunk_size]
+        carry = ""
+        if chunk.endswith("\r"):
+            # Might be the first half of a CRLF split across two chunks
+            chunk, carry = chunk[:-1], "\r"
+        yield chunk.replace("\r\n", "").encode("UTF-8")
+    if carry:
+        yield carry.encode("UTF-8")
+
+
+def hash_content(
+    content,
+    content_transfer_encoding: str = "",
+    algorithms: tuple = DEFAULT_ALGORITHMS,
+) -> dict:
+    """
+    Hashes content with every requested algorithm in a single pass, decoding and encoding
+    it in chunks rather than making a copy of the whole content
+
+    :param content: Content to hash, str or bytes
+    :param content_transfer_encoding: If base64, the decoded content is hashed
+    :param algorithms: Names of the digests to compute
+    :return: Dictionary of algorithm name to hex digest
+    """
+    hasher = MultiHasher(algorithms)
+    if not algorithms:
+        return {}
+
+    if content_transfer_encoding.lower() == "base64":
+        chunks = iter_base64_decoded(content)
+    else:
+        chunks = iter_encoded(content)
+
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.hexdigests()
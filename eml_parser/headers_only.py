@@ -0,0 +1,152 @@
+"""
+Header-only fast path for triage and routing.
+
+Only the header block of a raw message is read, up to the first blank line, and it is
+parsed without building an email.message object. The body is never read or decoded, so
+the cost doesn't depend on the size of the message.
+"""
+
+from email.header import decode_header, make_header
+import os
+import re
+
+from eml_parser.email_cleaner import get_emails_as_list, get_emails_as_string
+from eml_parser.helper import serialize_fields
+
+# Headers larger than this are cut off, no legitimate message comes close
+MAX_HEADER_BYTES = 1024 * 1024
+READ_SIZE = 8 * 1024
+
+_BLANK_LINE = re.compile(rb"\r?\n\r?\n")
+_BLANK_LINE_STR = re.compile(r"\r?\n\r?\n")
+
+
+class EmailHeaders(object):
+    """
+    The headers of an email, along with the decoded fields used for triage.
+    sender, subject and recipients are decoded the same way EmailParser decodes them.
+    """
+
+    FIELDS = (
+        "sender",
+        "recipients",
+        "subject",
+        "date_received",
+        "message_id",
+        "headers",
+    )
+
+    __slots__ = FIELDS
+
+    def __init__(self, headers: list):
+        """
+        :param headers: List of {"name": ..., "value": ...} dicts, as in IconEmail.headers
+        """
+        self.headers = headers
+
+        first = {}
+        for header in headers:
+            first.setdefault(header["name"].lower(), header["value"])
+
+        self.sender = get_emails_as_string(first.get("from", ""))
+        recipients = first.get("to") or first.get("delivered-to")
+        self.recipients = get_emails_as_list(recipients) if recipients else []
+        self.subject = None
+        if "subject" in first:
+            self.subject = str(make_header(decode_header(first["subject"])))
+        self.date_received = first.get("date")
+        self.message_id = first.get("message-id")
+        if self.message_id is not None:
+            self.message_id = self.message_id.strip()
+
+    def to_dict(self) -> dict:
+        """Converts the headers to a JSON-serializable, cleaned dict"""
+        return serialize_fields(self, self.FIELDS)
+
+    def make_serializable(self) -> dict:
+        """Converts the headers to a JSON-serializable, cleaned dict"""
+        return self.to_dict()
+
+
+def read_header_block(source) -> bytes:
+    """
+    Reads the header block of a raw message, stopping at the first blank line
+
+    :param source: Raw email as bytes or str, a path as an os.PathLike (e.g. pathlib.Path),
+                   or a file object opened in binary mode
+    :return: Header block as bytes, without the blank line
+    """
+    if isinstance(source, str):
+        # Always the raw message, even a single line, paths must be os.PathLike
+        if source.startswith("\n") or source.startswith("\r\n"):
+            return b""
+        match = _BLANK_LINE_STR.search(source, 0, MAX_HEADER_BYTES)
+        end = match.start() if match else MAX_HEADER_BYTES
+        return source[:end].encode("utf-8", "surrogateescape")
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return _header_block(source)
+
+    if isinstance(source, os.PathLike):
+        with open(source, "rb") as email_file:
+            return _read_header_block(email_file)
+
+    return _read_header_block(source)
+
+
+def _header_block(raw) -> bytes:
+    raw = memoryview(raw)[:MAX_HEADER_BYTES]
+    if raw[:1] == b"\n" or raw[:2] == b"\r\n":
+        return b""  # No headers at all
+    match = _BLANK_LINE.search(raw)
+    return bytes(raw[: match.start()] if match else raw)
+
+
+def _read_header_block(email_file) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < MAX_HEADER_BYTES:
+        chunk = email_file.read(READ_SIZE)
+        if not chunk:
+            break
+        # Step back so a blank line split across two reads is still found
+        start = max(0, len(buffer) - 3)
+        buffer += chunk
+        if buffer.startswith(b"\n") or buffer.startswith(b"\r\n"):
+            return b""
+        match = _BLANK_LINE.search(buffer, start)
+        if match:
+            return bytes(buffer[: match.start()])
+    return bytes(buffer[:MAX_HEADER_BYTES])
+
+
+def parse_header_block(block: bytes) -> list:
+    """
+    Splits a header block into headers, unfolding continuation lines
+
+    :param block: Header block as bytes
+    :return: List of {"name": ..., "value": ...} dicts
+    """
+    headers = []
+    for line in block.decode("utf-8", "replace").split("\n"):
+        line = line.rstrip("\r")
+        if line[:1] in (" ", "\t"):
+            if headers:
+                # Folded lines keep their leading whitespace, as email.message does
+                headers[-1]["value"] += "\n" + line
+            continue
+        name, separator, value = line.partition(":")
+        if not separator or line.startswith("From "):
+            continue  # Not a header, e.g. an mbox separator line
+        headers.append({"name": name.strip(), "value": value.lstrip(" \t")})
+    return headers
+
+
+def parse_headers_only(source) -> EmailHeaders:
+    """
+    Parses only the headers of a raw message
+
+    :param source: Raw email as bytes or str, a path as an os.PathLike (e.g. pathlib.Path),
+                   or a file object opened in binary mode
+    :return: EmailHeaders
+    """
+    return EmailHeaders(parse_header_block(read_header_block(source)))
@@ -1,3 +1,8 @@
+import base64
+import datetime
+import json
+
+
 def clean_dict(dictionary):
     """
     Returns a new but cleaned dictionary.
@@ -59,3 +64,60 @@ def clean(obj):
                 cleaned[key] = clean(value)
 
     return cleaned
+
+
+def is_empty(value) -> bool:
+    """Returns True for the values clean removes: None and empty strings"""
+    return value is None or (isinstance(value, str) and value == "")
+
+
+def serialize(value):
+    """
+    Returns value as cleaned, JSON-serializable data in a single traversal.
+
+    This gives the same result as dumping value to JSON (sorted keys, bytes as base64,
+    datetimes as ISO 8601) and running clean over the parsed result, without building
+    and re-parsing a JSON string. Objects that define to_dict are serialized with it.
+    Strings are passed through as is, so attachment content is never copied.
+    """
+
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        serialized = (serialize(item) for item in value)
+        return [item for item in serialized if not is_empty(item)]
+    if isinstance(value, dict):
+        serialized = {}
+        items = (
+            (key if isinstance(key, str) else json.dumps(key), item)
+            for key, item in value.items()
+        )
+        for key, item in sorted(items, key=lambda pair: pair[0]):
+            item = serialize(item)
+            if not is_empty(item):
+                serialized[key] = item
+        return serialized
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    return serialize(vars(value))
+
+
+def serialize_fields(obj, field_names) -> dict:
+    """
+    Serializes the named attributes of obj into a cleaned dictionary, see serialize
+
+    :param obj: Object to serialize
+    :param field_names: Names of the attributes to include
+    :return: dict
+    """
+
+    serialized = {}
+    for name in sorted(field_names):
+        value = serialize(getattr(obj, name))
+        if not is_empty(value):
+            serialized[name] = value
+    return serialized
@@ -1,9 +1,8 @@
 import base64
 import datetime
-import json
 
 from eml_parser.exceptions import EmailParserException
-from eml_parser.helper import clean
+from eml_parser.helper import serialize_fields
 from eml_parser.indicators import Indicators
 
 
@@ -12,6 +11,29 @@ class IconEmail(object):
     Base class to hold plugin-usable information for a common Email type
     """
 
+    FIELDS = (
+        "account",
+        "recipients",
+        "is_read",
+        "id",
+        "sender",
+        "subject",
+        "body",
+        "indicators",
+        "categories",
+        "date_received",
+        "headers",
+        "attached_files",
+        "attached_emails",
+        "has_attachments",
+        "flattened_attached_files",
+        "flattened_attached_emails",
+        "limit_exceeded",
+    )
+
+    # Slots keep thousands of parsed emails small
+    __slots__ = FIELDS
+
     def __init__(self, **kwargs):
         self.account = kwargs.get("account", None)
         self.recipients = kwargs.get("recipients", None)
@@ -29,6 +51,15 @@ class IconEmail(object):
         self.has_attachments = kwargs.get("has_attachments", False)
         self.flattened_attached_files = []
         self.flattened_attached_emails = []
+        # Name of the ParseLimits limit that stopped parsing early, if any
+        self.limit_exceeded = kwargs.get("limit_exceeded", None)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
 
     @staticmethod
     def json_handler(obj: object):
@@ -42,7 +73,15 @@ class IconEmail(object):
             if isinstance(obj, bytes):
                 return base64.b64encode(obj).decode()
 
-            dict_obj = obj.__dict__
+            # Build a new dictionary, the object itself must not be modified
+            fields = getattr(obj, "FIELDS", None)
+            if fields is not None:
+                dict_obj = {name: getattr(obj, name) for name in fields}
+                for name in getattr(obj, "OPTIONAL_FIELDS", ()):
+                    if getattr(obj, name) is not None:
+                        dict_obj[name] = getattr(obj, name)
+            else:
+                dict_obj = dict(obj.__dict__)
 
             for key in list(dict_obj.keys()):
                 if isinstance(dict_obj.get(key), datetime.datetime):
@@ -55,106 +94,162 @@ class IconEmail(object):
         except Exception as e:
             raise EmailParserException(e)
 
+    def to_dict(self) -> dict:
+        """
+        Converts the Email to a JSON-serializable, cleaned dict.
+
+        Attached emails and files are converted with their own to_dict in the same pass.
+        :return:
+        dict
+        """
+        return serialize_fields(self, self.FIELDS)
+
     def make_serializable(self) -> dict:
         """
         Converts the Email to a JSON-serializable, cleaned dict
         :return:
         dict
         """
-        message_json = json.dumps(
-            self, default=self.json_handler, sort_keys=True, indent=4
-        )
-        message_json = json.loads(message_json, strict=False)
-
-        message_json_clean = clean(message_json)
-        return message_json_clean
+        return self.to_dict()
 
     def flatten(self):
         """
         This will go through all the attachments and return them as a flat list instead of a
-        nested list of emails
+        nested list of emails.
+
+        Duplicates are dropped, and the lists keep the order the emails and files are found
+        in, walking the tree depth first. See iter_all_emails and iter_all_files.
         :return:
         None - (Will flatten self.attached_emails and self.attached_files)
         """
-        if self.attached_emails:
-            self.flattened_attached_emails = self.flatten_email(self.attached_emails)
-        self.flattened_attached_files.extend(self.attached_files)
-
-        # Nuke duplicates
-        self.flattened_attached_emails = list(set(self.flattened_attached_emails))
-        self.flattened_attached_files = list(set(self.flattened_attached_files))
+        self.flattened_attached_emails = list(self.iter_all_emails())
+        self.flattened_attached_files = list(self.iter_all_files())
 
-        # Need to sort the list for testability
-        # python hash adds a random seed to all hashes on launch, which makes these pop out in random order
-        self.flattened_attached_emails.sort()
-        self.flattened_attached_files.sort()
-
-    def flatten_email(self, email_list: list):
+    def iter_all_emails(self):
         """
-        Recursive function that will flatten email_attachments and file attachments
-
-        As it marches through the tree of emails, it will also add any files found to the
-        flattened_attached_files list as well.
+        Yields every email attached anywhere in the tree below this one, without duplicates
 
-        :param email_list: List of emails to flatten
-        :return:
-        Flat list of emails
-        * Modifies file_attachments to be a list of all attachments in the email tree that is being flattened
+        :return: Generator of IconEmail, depth first in discovery order
         """
-        ret_val = []
-
-        for email in email_list:
-            if len(email.attached_emails) > 0:
-                ret_val.extend(self.flatten_email(email.attached_emails))
-
-            ret_val.append(email)
-
-            if len(email.attached_files) > 0:
-                self.flattened_attached_files.extend(email.attached_files)
+        seen = set()
+        for email in self._walk():
+            if email is self:
+                continue
+            key = email.dedup_key()
+            if key not in seen:
+                seen.add(key)
+                yield email
+
+    def iter_all_files(self):
+        """
+        Yields every file attached to this email or to any email below it, without duplicates
 
-        return ret_val
+        :return: Generator of IconFile, depth first in discovery order
+        """
+        seen = set()
+        for email in self._walk():
+            for icon_file in email.attached_files:
+                key = icon_file.dedup_key()
+                if key not in seen:
+                    seen.add(key)
+                    yield icon_file
+
+    def _walk(self):
+        """Yields this email and every email below it once, depth first without recursion"""
+        visited = {id(self)}
+        yield self
+        stack = [iter(self.attached_emails)]
+        while stack:
+            email = next(stack[-1], None)
+            if email is None:
+                stack.pop()
+            elif id(email) not in visited:
+                visited.add(id(email))
+                yield email
+                stack.append(iter(email.attached_emails))
 
     # These functions are needed for equality and hashing. They
     # are used to remove duplicates in the flattened lists.
 
-    def __eq__(self, other):
-        """Check for equality"""
+    def _digest(self):
+        """The body's strongest digest, or the body itself if it wasn't hashed"""
+        if self.indicators is None:
+            return self.body
         return (
-            self.id == other.id
-            and self.subject == other.subject
-            and self.body == other.body
-            and self.date_received == other.date_received
-            and self.recipients == other.recipients
-            and self.sender == other.sender
-            and self.account == other.account
-            and self.categories == other.categories
+            self.indicators.sha256
+            or self.indicators.sha1
+            or self.indicators.md5
+            or self.body
         )
 
-    def __hash__(self):
-        """Return a unique hash"""
-
-        # 'Tue, 13 Aug 2019 12:56:31 -0500'
-        return hash(
-            (
-                "id",
-                self.id,
-                "subject",
-                str(self.subject),
-                "body",
-                self.body,
-                "date_received",
-                self.date_received,
-                "recipients",
-                str(self.recipients),
-                "sender",
-                self.sender,
-                "account",
-                self.account,
-                "categories",
-                str(self.categories),
-            )
+    def dedup_key(self) -> tuple:
+        """Identifies the email by its metadata and body digest, used to deduplicate"""
+        return (
+            self.id,
+            str(self.subject),
+            self._digest(),
+            self.date_received,
+            str(self.recipients),
+            self.sender,
+            self.account,
+            str(self.categories),
         )
 
+    def __eq__(self, other):
+        """Check for equality by dedup_key, the same key __hash__ uses"""
+        if self is other:
+            return True
+        if not isinstance(other, IconEmail):
+            return NotImplemented
+        return self.dedup_key() == other.dedup_key()
+
+    def __hash__(self):
+        """Return a hash of dedup_key. Not cached, the fields it covers can change"""
+        return hash(self.dedup_key())
+
     def __lt__(self, other):
         """Less than, allows class to be sorted"""
         return self.subject < other.subject
+
+
+class LazyIconEmail(IconEmail):
+    """
+    An attached email that is only parsed when one of its fields is first read.
+
+    Until then it holds a function that parses it. The first attribute access calls it once
+    and copies the parsed email's fields in, from then on it behaves like any IconEmail.
+    Fields set on it before that are kept. Pickling or copying it parses it, and gives a
+    plain IconEmail.
+    """
+
+    __slots__ = ("_parse",)
+
+    def __init__(self, parse):
+        """
+        :param parse: Function without arguments that returns the parsed IconEmail
+        """
+        self._parse = parse
+
+    @property
+    def parsed(self) -> bool:
+        """True once the email has been parsed"""
+        return self._parse is None
+
+    def __getattr__(self, name: str):
+        # Only called for slots that aren't set yet, i.e. before parsing
+        if name not in IconEmail.__slots__ or self._parse is None:
+            raise AttributeError(name)
+        self._load()
+        return getattr(self, name)
+
+    def _load(self):
+        parsed = self._parse()
+        self._parse = None
+        for name in IconEmail.__slots__:
+            try:
+                object.__getattribute__(self, name)
+            except AttributeError:
+                setattr(self, name, getattr(parsed, name))
+
+    def __reduce_ex__(self, protocol):
+        return IconEmail, (), self.__getstate__()
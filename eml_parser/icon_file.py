@@ -1,51 +1,85 @@
-import json
-
 import eml_parser.helper as helper
+from eml_parser.hashing import DEFAULT_ALGORITHMS
 from eml_parser.indicators import Indicators
 
 
 class IconFile(object):
+    FIELDS = ("name", "content", "content_type", "indicators")
+    # Only serialized when set
+    OPTIONAL_FIELDS = ("handle",)
+
+    # Slots keep the per-file overhead down
+    __slots__ = FIELDS + OPTIONAL_FIELDS
+
     def __init__(
         self,
         file_name: str = "",
         content_type: str = "",
         content: str = "",
         content_transfer_encoding: str = "",
+        hash_algorithms: tuple = DEFAULT_ALGORITHMS,
+        indicators: Indicators = None,
+        handle=None,
     ):
         self.name = file_name
         self.content = content
         self.content_type = content_type
-        self.indicators = Indicators(content, content_transfer_encoding)
+        # Indicators can be handed in when the content was already hashed, e.g. by an AttachmentStore
+        if indicators is None:
+            indicators = Indicators(content, content_transfer_encoding, hash_algorithms)
+        self.indicators = indicators
+        # Set when the content went to an attachment sink instead, see attachment_sink.py
+        self.handle = handle
 
-    # May not need this
-    def make_serializable(self) -> dict:
-        """Converts the File to a JSON-serializable, cleaned dict"""
-        message_json = json.dumps(
-            self, default=lambda o: o.__dict__, sort_keys=True, indent=4
+    def __getstate__(self):
+        return {
+            name: getattr(self, name) for name in self.FIELDS + self.OPTIONAL_FIELDS
+        }
+
+    def __setstate__(self, state: dict):
+        self.handle = None  # Missing from files pickled before handles existed
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def _digest(self):
+        """The content's strongest digest, or the content itself if it wasn't hashed"""
+        if self.indicators is None:
+            return self.content
+        return (
+            self.indicators.sha256
+            or self.indicators.sha1
+            or self.indicators.md5
+            or self.content
         )
-        message_json = json.loads(message_json, strict=False)
 
-        message_json_clean = helper.clean(message_json)
-        return message_json_clean
+    def to_dict(self) -> dict:
+        """Converts the File to a JSON-serializable, cleaned dict"""
+        return helper.serialize_fields(self, self.FIELDS + self.OPTIONAL_FIELDS)
+
+    def make_serializable(self) -> dict:
+        """Converts the File to a JSON-serializable, cleaned dict"""
+        return self.to_dict()
 
     def __eq__(self, other):
+        """Check for equality, comparing the content digests before the content itself"""
+        if self is other:
+            return True
+        if not isinstance(other, IconFile):
+            return NotImplemented
         return (
             self.name == other.name
-            and self.content == other.content
             and self.content_type == other.content_type
+            and self._digest() == other._digest()
+            and self.content == other.content
         )
 
+    def dedup_key(self) -> tuple:
+        """Identifies the file by name, content type and content digest, used to deduplicate"""
+        return self.name, self.content_type, self._digest()
+
     def __hash__(self):
-        return hash(
-            (
-                "file_name",
-                self.name,
-                "content",
-                self.content,
-                "content_type",
-                self.content_type,
-            )
-        )
+        """Return a hash of dedup_key. Not cached, the fields it covers can change"""
+        return hash(self.dedup_key())
 
     def __lt__(self, other):
         """Less than, allows class to be sorted"""
@@ -1,31 +1,50 @@
-import hashlib
-import json
 import eml_parser.helper as helper
-import base64
+from eml_parser.hashing import DEFAULT_ALGORITHMS, hash_content
 
 
 class Indicators(object):
-    def __init__(self, content: str, content_transfer_encoding: str = ""):
-        if content_transfer_encoding.lower() == "base64":
-            encoded_content = base64.b64decode(content)
-        else:
-            encoded_content = content.encode("UTF-8")
-        self.md5 = hashlib.md5(encoded_content).hexdigest()
-        self.sha1 = hashlib.sha1(encoded_content).hexdigest()
-        self.sha256 = hashlib.sha256(encoded_content).hexdigest()
-
-    # May not need this
-    def make_serializable(self) -> dict:
-        """Converts the File to a JSON-serializable, cleaned dict"""
-        message_json = json.dumps(
-            self, default=lambda o: o.__dict__, sort_keys=True, indent=4
-        )
-        message_json = json.loads(message_json, strict=False)
+    FIELDS = ("md5", "sha1", "sha256")
+
+    __slots__ = FIELDS
+
+    def __init__(
+        self,
+        content: str,
+        content_transfer_encoding: str = "",
+        algorithms: tuple = DEFAULT_ALGORITHMS,
+    ):
+        # All digests are computed in a single pass over the (decoded) content.
+        # Algorithms that weren't asked for are left as None.
+        digests = hash_content(content, content_transfer_encoding, algorithms)
+        self.md5 = digests.get("md5")
+        self.sha1 = digests.get("sha1")
+        self.sha256 = digests.get("sha256")
 
-        message_json_clean = helper.clean(message_json)
-        return message_json_clean
+    @classmethod
+    def from_digests(cls, digests: dict):
+        """
+        Builds Indicators from digests that were already computed
+
+        :param digests: Dictionary of algorithm name to hex digest
+        :return: Indicators
+        """
+        indicators = cls.__new__(cls)
+        indicators.md5 = digests.get("md5")
+        indicators.sha1 = digests.get("sha1")
+        indicators.sha256 = digests.get("sha256")
+        return indicators
+
+    def to_dict(self) -> dict:
+        """Converts the Indicators to a JSON-serializable, cleaned dict"""
+        return helper.serialize_fields(self, self.FIELDS)
+
+    def make_serializable(self) -> dict:
+        """Converts the Indicators to a JSON-serializable, cleaned dict"""
+        return self.to_dict()
 
     def __eq__(self, other):
+        if not isinstance(other, Indicators):
+            return NotImplemented
         return (
             self.md5 == other.md5
             and self.sha1 == other.sha1
@@ -0,0 +1,150 @@
+"""
+Resource limits for parsing untrusted mail.
+
+A ParseLimits caps how much work a single message may cause: how deep emails may be nested,
+how many MIME parts are visited, how large a single decoded attachment and all decoded
+content together may be, and how long the message may take. When a limit is hit, parsing
+stops and EmailParser returns what it has so far, with IconEmail.limit_exceeded set to the
+name of the limit on the email and on every attached email that was cut short.
+"""
+
+from contextlib import contextmanager, nullcontext
+import threading
+import time
+
+# The budget of the message being parsed on this thread, nested emails share it
+_current = threading.local()
+
+
+class ParseLimits(object):
+    """
+    Limits for a single message, None means unlimited
+    """
+
+    def __init__(
+        self,
+        max_depth: int = None,
+        max_parts: int = None,
+        max_attachment_bytes: int = None,
+        max_total_bytes: int = None,
+        max_seconds: float = None,
+    ):
+        """
+        :param max_depth: How deep emails may be nested, 0 means attached emails aren't parsed
+        :param max_parts: Number of MIME parts visited, nested emails included
+        :param max_attachment_bytes: Decoded size of a single attachment
+        :param max_total_bytes: Decoded size of the bodies and attachments together
+        :param max_seconds: Wall-clock time for the message, checked between parts
+        """
+        self.max_depth = max_depth
+        self.max_parts = max_parts
+        self.max_attachment_bytes = max_attachment_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_seconds = max_seconds
+
+    @contextmanager
+    def track(self):
+        """
+        Starts a budget for a message on this thread
+
+        :return: Context manager giving the ParseBudget
+        """
+        budget = ParseBudget(self)
+        # Budgets nest, e.g. a LazyIconEmail read while another message is being parsed
+        outer_budget = current_budget()
+        _current.budget = budget
+        try:
+            yield budget
+        finally:
+            _current.budget = outer_budget
+
+
+class ParseBudget(object):
+    """
+    What a message has used of its ParseLimits so far. Every method returns False, and
+    records the limit in exceeded, once a limit is hit.
+    """
+
+    def __init__(self, limits: ParseLimits):
+        self.limits = limits
+        self.parts = 0
+        self.total_bytes = 0
+        # Depth of the email being parsed, raised while parsing nested emails
+        self.depth = 0
+        self.exceeded = None
+        self.deadline = None
+        if limits.max_seconds is not None:
+            self.deadline = time.perf_counter() + limits.max_seconds
+
+    def exceed(self, limit: str) -> bool:
+        if self.exceeded is None:
+            self.exceeded = limit
+        return False
+
+    def allows_depth(self, depth: int) -> bool:
+        if self.exceeded is not None:
+            return False
+        if self.limits.max_depth is not None and depth > self.limits.max_depth:
+            return self.exceed("max_depth")
+        return True
+
+    def add_part(self) -> bool:
+        if self.exceeded is not None:
+            return False
+        self.parts += 1
+        if self.limits.max_parts is not None and self.parts > self.limits.max_parts:
+            return self.exceed("max_parts")
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            return self.exceed("max_seconds")
+        return True
+
+    def add_bytes(self, size: int, attachment: bool = False) -> bool:
+        if self.exceeded is not None:
+            return False
+        limit = self.limits.max_attachment_bytes
+        if attachment and limit is not None and size > limit:
+            return self.exceed("max_attachment_bytes")
+        self.total_bytes += size
+        limit = self.limits.max_total_bytes
+        if limit is not None and self.total_bytes > limit:
+            return self.exceed("max_total_bytes")
+        return True
+
+    @contextmanager
+    def nested(self, depth: int):
+        """Parses an attached email at depth"""
+        outer_depth = self.depth
+        self.depth = depth
+        try:
+            yield self
+        finally:
+            self.depth = outer_depth
+
+
+def current_budget():
+    """
+    :return: The ParseBudget of the message being parsed on this thread, or None
+    """
+    return getattr(_current, "budget", None)
+
+
+def nested(budget, depth: int):
+    """
+    :return: Context manager that parses an attached email at depth within budget, if any
+    """
+    if budget is None:
+        return nullcontext()
+    return budget.nested(depth)
+
+
+def decoded_size(content, content_transfer_encoding: str = "") -> int:
+    """
+    Estimates the decoded size of content without decoding it
+
+    :param content: Encoded content
+    :param content_transfer_encoding: Content-Transfer-Encoding of the content
+    :return: Size in bytes
+    """
+    if content_transfer_encoding.lower() == "base64":
+        return len(content) * 3 // 4
+    return len(content)
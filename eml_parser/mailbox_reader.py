@@ -0,0 +1,177 @@
+"""
+Streaming readers for mbox files and Maildir trees.
+
+Every reader is a generator that yields one raw message (bytes) at a time, so memory use
+stays at roughly one message no matter how large the archive is. mbox files are memory
+mapped and split on "From " lines; only the message being yielded is ever copied out of
+the map.
+"""
+
+import mmap
+import os
+
+MBOX_SEPARATOR = b"From "
+MAILDIR_SUBDIRECTORIES = ("new", "cur")
+
+
+def is_mbox(path: str) -> bool:
+    """Returns True if the file at path looks like an mbox (starts with a "From " line)"""
+    with open(path, "rb") as mbox_file:
+        return mbox_file.read(len(MBOX_SEPARATOR)) == MBOX_SEPARATOR
+
+
+def is_maildir(path: str) -> bool:
+    """Returns True if path is a Maildir (a directory holding cur and new)"""
+    return all(
+        os.path.isdir(os.path.join(path, subdirectory))
+        for subdirectory in MAILDIR_SUBDIRECTORIES
+    )
+
+
+def iter_mbox(path: str):
+    """
+    Yields the raw messages in an mbox file, one at a time
+
+    :param path: Path to the mbox file
+    :return: Generator of raw messages as bytes
+    """
+    with open(path, "rb") as mbox_file:
+        if os.fstat(mbox_file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(mbox_file.fileno(), 0, access=mmap.ACCESS_READ) as mbox_map:
+            yield from _split_mbox(mbox_map)
+
+
+def _split_mbox(mbox_map):
+    separator = b"\n" + MBOX_SEPARATOR
+    if mbox_map[: len(MBOX_SEPARATOR)] == MBOX_SEPARATOR:
+        position = 0
+    else:
+        # Anything before the first "From " line isn't part of a message
+        position = mbox_map.find(separator)
+        if position == -1:
+            return
+        position += 1
+
+    size = len(mbox_map)
+    while position < size:
+        # Skip the "From " line itself
+        start = mbox_map.find(b"\n", position)
+        if start == -1:
+            return
+        start += 1
+
+        # start - 1 so a "From " line right after this one ends an empty message
+        end = mbox_map.find(separator, start - 1)
+        if end == -1:
+            yield mbox_map[start:size]
+            return
+        if end + 1 > start:
+            yield mbox_map[start : end + 1]
+        position = end + 1
+
+
+def iter_mbox_stream(lines):
+    """
+    Yields the raw messages of an mbox read from a stream (e.g. stdin) that can't be memory
+    mapped. Only one message is held in memory at a time.
+
+    :param lines: Binary file object or any iterable of the mbox's lines as bytes
+    :return: Generator of raw messages as bytes
+    """
+    message_lines = []
+    seen_separator = False
+    for line in lines:
+        if line.startswith(MBOX_SEPARATOR):
+            if message_lines:
+                yield b"".join(message_lines)
+            message_lines = []
+            seen_separator = True
+            continue
+        if seen_separator:
+            message_lines.append(line)
+    if message_lines:
+        yield b"".join(message_lines)
+
+
+def iter_maildir_paths(path: str):
+    """
+    Yields the path of every message in a Maildir tree, including its sub-folders
+    (Maildir++ folders are directories starting with a dot, e.g. .Sent)
+
+    :param path: Path to the Maildir
+    :return: Generator of message file paths
+    """
+    for subdirectory in MAILDIR_SUBDIRECTORIES:
+        directory = os.path.join(path, subdirectory)
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            message_path = os.path.join(directory, filename)
+            if not filename.startswith(".") and os.path.isfile(message_path):
+                yield message_path
+
+    for folder in sorted(os.listdir(path)):
+        folder_path = os.path.join(path, folder)
+        if folder.startswith(".") and is_maildir(folder_path):
+            yield from iter_maildir_paths(folder_path)
+
+
+def iter_maildir(path: str):
+    """
+    Yields the raw messages in a Maildir tree, one at a time
+
+    :param path: Path to the Maildir
+    :return: Generator of raw messages as bytes
+    """
+    for message_path in iter_maildir_paths(path):
+        with open(message_path, "rb") as message_file:
+            yield message_file.read()
+
+
+def iter_messages(path: str):
+    """
+    Yields the raw messages stored at path, whatever the format: a Maildir, an mbox or a
+    single email file
+
+    :param path: Path to a Maildir, mbox file or email file
+    :return: Generator of raw messages as bytes
+    """
+    if os.path.isdir(path):
+        yield from iter_maildir(path)
+    elif is_mbox(path):
+        yield from iter_mbox(path)
+    else:
+        with open(path, "rb") as message_file:
+            yield message_file.read()
+
+
+def parse_messages(parser, raw_messages, mailbox_id: str):
+    """
+    Parses a stream of raw messages lazily, one message at a time
+
+    :param parser: EmailParser used to parse each message
+    :param raw_messages: Iterable of raw emails, e.g. from iter_mbox or iter_maildir
+    :param mailbox_id: Mailbox ID the messages were taken from
+    :return: Generator of IconEmail
+    """
+    for raw_email in raw_messages:
+        yield parser.make_email(raw_email, mailbox_id)
+
+
+def parse_mbox(parser, path: str, mailbox_id: str):
+    """
+    Parses every message in an mbox file, one at a time
+
+    :return: Generator of IconEmail
+    """
+    return parse_messages(parser, iter_mbox(path), mailbox_id)
+
+
+def parse_maildir(parser, path: str, mailbox_id: str):
+    """
+    Parses every message in a Maildir tree, one at a time
+
+    :return: Generator of IconEmail
+    """
+    return parse_messages(parser, iter_maildir(path), mailbox_id)
@@ -0,0 +1,218 @@
+"""
+Per-stage timing for EmailParser.
+
+When an EmailParser is given a metrics hook, the methods behind each stage of the pipeline
+are wrapped, on that parser instance only, with timers. Parsers without a hook are left
+untouched, so disabled metrics cost nothing.
+
+The hook is called with a MessageMetrics once per message parsed, and once per email
+serialized through EmailParser.serialize. Stage times are exclusive: time spent in a
+nested stage (e.g. hashing inside the attachment walk) is only counted once, so the
+stages of a message add up to its total. Everything done for an email attached inside
+the message is counted under nested_emails.
+"""
+
+import threading
+import time
+
+# Stage name: (EmailParser method, function of (args, result) giving the bytes processed)
+STAGES = {
+    "headers": (
+        "get_headers",
+        lambda args, headers: sum(len(header["value"]) for header in headers),
+    ),
+    "body_decode": ("decode_body", lambda args, body: len(body or "")),
+    "newline_cleanup": ("get_body", lambda args, body: len(body or "")),
+    "hashing": ("make_indicators", lambda args, result: len(args[0] or "")),
+}
+
+# Methods that start a message. When called inside another message, they are nested emails.
+ROOT_METHODS = ("format_result",)
+NESTED_METHODS = ("format_message", "convert_icon_file_to_email")
+
+
+class StageMetrics(object):
+    __slots__ = ("seconds", "bytes", "calls")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.bytes = 0
+        self.calls = 0
+
+    def to_dict(self) -> dict:
+        return {"seconds": self.seconds, "bytes": self.bytes, "calls": self.calls}
+
+
+class MessageMetrics(object):
+    """
+    Timings for one message, along with the shape of the message. The shape is collected by
+    the attachment walk, it stays 0 when the walk is skipped (a fields projection without
+    attachments and nested, or a limit hit before it) and only covers the parts walked.
+
+    size: Total size of the message's MIME part payloads in characters
+    part_count: Number of MIME parts, nested emails included
+    depth: How deep message/* parts are nested inside the message, 0 when there are none
+    duration: Total seconds spent on the message
+    stages: Dictionary of stage name to StageMetrics
+    """
+
+    __slots__ = ("size", "part_count", "depth", "duration", "stages")
+
+    def __init__(self, size: int = 0, part_count: int = 0, depth: int = 0):
+        self.size = size
+        self.part_count = part_count
+        self.depth = depth
+        self.duration = 0.0
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float, size: int = 0):
+        stage_metrics = self.stages.get(stage)
+        if stage_metrics is None:
+            stage_metrics = self.stages[stage] = StageMetrics()
+        stage_metrics.seconds += seconds
+        stage_metrics.bytes += size
+        stage_metrics.calls += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "size": self.size,
+            "part_count": self.part_count,
+            "depth": self.depth,
+            "duration": self.duration,
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+        }
+
+
+def instrument(parser, hook):
+    """
+    Wraps the stage methods of a single EmailParser instance with timers
+
+    :param parser: EmailParser to instrument
+    :param hook: Callable that receives a MessageMetrics for every message
+    :return: Names of the wrapped methods
+    """
+    # Each thread parsing with this parser tracks its own message
+    state = threading.local()
+    wrapped = []
+
+    def wrap(name, wrapper):
+        setattr(parser, name, wrapper(getattr(parser, name)))
+        wrapped.append(name)
+
+    def recording() -> bool:
+        return getattr(state, "message", None) is not None and not state.nested
+
+    def run(stage, method, args, kwargs, inclusive=False):
+        # Each frame collects the time of the stages called from it, so it can be
+        # subtracted to get the stage's own time
+        frame = [0.0]
+        state.stack.append(frame)
+        state.nested = inclusive
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            state.nested = False
+            state.stack.pop()
+            state.stack[-1][0] += elapsed
+            state.message.add(stage, elapsed if inclusive else elapsed - frame[0])
+
+    def timed(stage, size_of):
+        def wrapper(method):
+            def timed_method(*args, **kwargs):
+                if not recording():
+                    return method(*args, **kwargs)
+                result = run(stage, method, args, kwargs)
+                state.message.stages[stage].bytes += size_of(args, result)
+                return result
+
+            return timed_method
+
+        return wrapper
+
+    def nested(method):
+        def nested_method(*args, **kwargs):
+            # Only emails found by the attachment walk are nested, not the message itself
+            if not recording() or len(state.stack) < 2:
+                return method(*args, **kwargs)
+            return run("nested_emails", method, args, kwargs, inclusive=True)
+
+        return nested_method
+
+    def walk(method):
+        def walk_method(mail, mailbox_id, shape=None):
+            if not recording():
+                return method(mail, mailbox_id, shape)
+            # The walk visits every part anyway, it measures the message on the way
+            result = run("attachments", method, (mail, mailbox_id, state.message), {})
+            state.message.stages["attachments"].bytes += state.message.size
+            return result
+
+        return walk_method
+
+    def root(method):
+        nested_method = nested(method)
+
+        def root_method(msg, *args, **kwargs):
+            if getattr(state, "message", None) is not None:
+                return nested_method(msg, *args, **kwargs)
+
+            message = MessageMetrics()
+            state.message = message
+            state.stack = [[0.0]]
+            state.nested = False
+            start = time.perf_counter()
+            try:
+                return method(msg, *args, **kwargs)
+            finally:
+                message.duration = time.perf_counter() - start
+                message.add("other", message.duration - state.stack[0][0])
+                state.message = None
+                state.stack = None
+                hook(message)
+
+        return root_method
+
+    def serialize(method):
+        def serialize_method(email):
+            message = MessageMetrics(*email_shape(email))
+            start = time.perf_counter()
+            result = method(email)
+            message.duration = time.perf_counter() - start
+            message.add("serialization", message.duration, message.size)
+            hook(message)
+            return result
+
+        return serialize_method
+
+    for stage, (name, size_of) in STAGES.items():
+        wrap(name, timed(stage, size_of))
+    wrap("attachments", walk)
+    for name in ROOT_METHODS:
+        wrap(name, root)
+    for name in NESTED_METHODS:
+        wrap(name, nested)
+    wrap("serialize", serialize)
+    return wrapped
+
+
+def email_shape(email) -> tuple:
+    """
+    :param email: IconEmail
+    :return: Tuple of (body and attachment size, number of emails and files, nesting depth)
+    """
+    size = 0
+    part_count = 0
+    depth = 0
+    stack = [(email, 0)]
+    while stack:
+        current, level = stack.pop()
+        part_count += 1 + len(current.attached_files)
+        depth = max(depth, level)
+        size += len(current.body or "")
+        size += sum(
+            len(icon_file.content or "") for icon_file in current.attached_files
+        )
+        stack.extend((attached, level + 1) for attached in current.attached_emails)
+    return size, part_count, depth
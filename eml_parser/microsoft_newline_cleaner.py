@@ -1,19 +1,27 @@
-import quopri
+import binascii
+import re
 
+# Soft line breaks, along with the blank line Microsoft sometimes puts after them
+SOFT_LINE_BREAK = re.compile(r"=(?:\r\n\r\n|\r\n|\n\n|\n)")
 
-def remove_microsoft_newlines(s: str) -> str:
-    # Removes Microsoft specific newlines when raw emails are returned
 
-    # I say we nuke it from orbit
-    s = s.replace("=\r\n\r\n", "")
-    s = s.replace("=\r\n", "")
-    s = s.replace("=\n\n", "")
-    s = s.replace(
-        "=\n", ""
-    )  # This is dangerous, but I'd rather preserve links and give ill formatted output
-    try:
-        s = quopri.decodestring(s).decode("UTF-8")
-    except Exception:
-        pass  # quopri will only work on ASCII characters, it fails if it hits unicode...in that case just return the string
+# Transfer encodings email.message has already undone, decoding again would mangle the text
+DECODED_TRANSFER_ENCODINGS = frozenset(("quoted-printable", "base64"))
+
+
+def remove_microsoft_newlines(s: str, content_transfer_encoding: str = "") -> str:
+    # Removes Microsoft specific newlines when raw emails are returned, then decodes
+    # whatever quoted-printable is left in text that wasn't transfer decoded yet
 
-    return s
+    s = SOFT_LINE_BREAK.sub("", s)
+    if content_transfer_encoding.strip().lower() in DECODED_TRANSFER_ENCODINGS:
+        return s  # Any '=' left is part of the text, e.g. a URL query
+    if "=" not in s:
+        return s  # Nothing left to decode
+
+    # binascii only takes ASCII strings, non-ASCII text goes through as UTF-8 bytes
+    try:
+        return binascii.a2b_qp(s.encode("UTF-8", "surrogateescape")).decode("UTF-8")
+    except UnicodeDecodeError:
+        # The escapes weren't UTF-8, e.g. a Latin-1 body, keep the text as it is
+        return s
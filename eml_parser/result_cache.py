@@ -0,0 +1,122 @@
+"""
+In-memory cache of parse results.
+
+Plugins that poll a mailbox fetch the same messages again on every run and after retries.
+With a ParseResultCache, EmailParser recognizes a raw message it has already parsed (by a
+digest of its bytes, the mailbox ID and the parser's settings) and returns the earlier
+IconEmail instead of parsing it again. Only the messages handed to the parser are cached,
+not the emails attached to them.
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+
+
+class ParseResultCache(object):
+    """
+    LRU cache of IconEmails keyed by a digest of the raw message and its mailbox ID.
+
+    Entries are evicted, least recently used first, once there are more than max_entries
+    of them or the raw messages they were parsed from add up to more than max_bytes.
+    The raw size is a cheap stand-in for the size of the parsed result.
+
+    Cached IconEmails are shared by every caller that gets a hit, treat them as read-only.
+    The cache is safe to share between threads. A pickled copy starts out empty, so
+    the worker processes of BatchEmailParser each start with an empty cache. Processes
+    forked some other way inherit the parent's cache as it was.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 256 * 1024 * 1024):
+        """
+        :param max_entries: Maximum number of parse results kept
+        :param max_bytes: Maximum total size of the raw messages behind the kept results
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+
+        self._lock = threading.Lock()
+        # key -> (IconEmail, raw size), least recently used first
+        self._entries = OrderedDict()
+
+    def __getstate__(self):
+        return {"max_entries": self.max_entries, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(raw_email, mailbox_id: str, config: tuple = ()) -> tuple:
+        """
+        Builds the cache key for a raw message
+
+        :param raw_email: Raw email as bytes, any bytes-like object (e.g. a memory map) or str
+        :param mailbox_id: Mailbox ID the message was taken from
+        :param config: Settings of the parser that change its results, parsers sharing the
+                       cache only get each other's results when these are the same
+        :return: Hashable cache key
+        """
+        kind = "str" if isinstance(raw_email, str) else "bytes"
+        if isinstance(raw_email, str):
+            raw_email = raw_email.encode("utf-8", "surrogateescape")
+        digest = ParseResultCache.hasher()
+        digest.update(raw_email)
+        return kind, mailbox_id, config, digest.digest()
+
+    @staticmethod
+    def hasher():
+        """
+        :return: Incremental digest of raw message bytes, for messages received in chunks.
+                 ("bytes", mailbox_id, config, hasher.digest()) is then the message's
+                 cache key.
+        """
+        return hashlib.blake2b(digest_size=16)
+
+    def get(self, key: tuple):
+        """
+        :param key: Key built by ParseResultCache.key
+        :return: The cached IconEmail, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: tuple, email, size: int = 0):
+        """
+        :param key: Key built by ParseResultCache.key
+        :param email: IconEmail parsed from the raw message
+        :param size: Size of the raw message in bytes
+        """
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (email, size)
+            self.size += size
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.size > self.max_bytes
+        ):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
@@ -0,0 +1,252 @@
+"""
+Capture of messages that are slow to parse.
+
+With a SlowMessageCapture, EmailParser times every make_email_from_raw call. Timing costs
+next to nothing; only when a message takes longer than the threshold is it parsed a second
+time, under cProfile, and everything needed to reproduce it is saved in a directory of its
+own:
+
+    message.eml    The raw message as it was handed to the parser, or generated back from
+                   the email.message object when the parser was given one
+    profile.pstats The cProfile stats of the second parse, load them with pstats.Stats
+    summary.txt    Duration, mailbox, the MIME tree of the message and the top functions
+
+The second parse runs on a copy of the parser without its metrics hook, attachment sink,
+attachment store and result cache, so it has no side effects and isn't served from a cache
+the first parse warmed up.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import shutil
+import threading
+import time
+
+
+class SlowMessageCapture(object):
+    """
+    Profiles each message parsed and saves the ones slower than threshold seconds.
+    Only the most recent max_captures captures are kept.
+    """
+
+    def __init__(self, directory: str, threshold: float = 1.0, max_captures: int = 20):
+        """
+        :param directory: Where captures are saved, one sub-directory per message
+        :param threshold: Messages taking longer than this many seconds are captured
+        :param max_captures: Number of captures kept, the oldest are deleted first
+        """
+        self.directory = directory
+        self.threshold = threshold
+        self.max_captures = max_captures
+        self.captured = 0
+
+        self._lock = threading.Lock()
+        self._state = threading.local()
+
+    def __getstate__(self):
+        return {
+            "directory": self.directory,
+            "threshold": self.threshold,
+            "max_captures": self.max_captures,
+        }
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    def instrument(self, parser) -> tuple:
+        """
+        Wraps make_email_from_raw of a single EmailParser instance with the timer
+
+        :param parser: EmailParser to instrument
+        :return: Names of the wrapped methods
+        """
+        parser.make_email_from_raw = self.wrap(parser.make_email_from_raw, parser)
+        parser._cached = self.keep_raw(parser._cached)
+        return ("make_email_from_raw", "_cached")
+
+    def keep_raw(self, cached):
+        # Every raw message handed to the parser as bytes, str or a file goes through
+        # _cached, it is kept so a capture can save it as it was received
+        def keeping_raw(raw_email, mailbox_id: str, parse):
+            outer_raw = getattr(self._state, "raw", None)
+            self._state.raw = raw_email
+            try:
+                return cached(raw_email, mailbox_id, parse)
+            finally:
+                self._state.raw = outer_raw
+
+        return keeping_raw
+
+    def wrap(self, make_email_from_raw, parser=None):
+        def timed(email_message, mailbox_id: str):
+            # Attached emails are parsed by nested calls, only the outer call is timed
+            if getattr(self._state, "active", False):
+                return make_email_from_raw(email_message, mailbox_id)
+
+            self._state.active = True
+            start = time.perf_counter()
+            try:
+                return make_email_from_raw(email_message, mailbox_id)
+            finally:
+                duration = time.perf_counter() - start
+                try:
+                    if duration > self.threshold:
+                        profile = self.profile(
+                            (
+                                make_email_from_raw
+                                if parser is None
+                                else quiet_copy(parser).make_email_from_raw
+                            ),
+                            email_message,
+                            mailbox_id,
+                        )
+                        raw_email = getattr(self._state, "raw", None)
+                        self.capture(
+                            email_message, mailbox_id, profile, duration, raw_email
+                        )
+                finally:
+                    self._state.active = False
+
+        return timed
+
+    @staticmethod
+    def profile(make_email_from_raw, email_message, mailbox_id: str):
+        """
+        Parses a message again under cProfile
+
+        :return: The cProfile.Profile, or None if another profiler is running
+        """
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Another profiler is running
+            return None
+        try:
+            make_email_from_raw(email_message, mailbox_id)
+        except Exception:
+            pass  # Failing messages are captured too, the first parse raises
+        finally:
+            profile.disable()
+        return profile
+
+    def capture(
+        self,
+        email_message,
+        mailbox_id: str,
+        profile,
+        duration: float,
+        raw_email=None,
+    ) -> str:
+        """
+        Saves a slow message, its profile and a summary
+
+        :param email_message: email.message object of the message
+        :param mailbox_id: Mailbox ID the message was taken from
+        :param profile: cProfile.Profile of the message, or None
+        :param duration: Seconds the parse took
+        :param raw_email: The raw message as received, bytes, a bytes-like object or str
+        :return: Path to the capture's directory
+        """
+        with self._lock:
+            self.captured += 1
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.captured:04d}"
+            path = os.path.join(self.directory, name)
+            os.makedirs(path)
+
+        if raw_email is None:
+            raw_email = message_bytes(email_message)
+        elif isinstance(raw_email, str):
+            raw_email = raw_email.encode("utf-8", "surrogateescape")
+        with open(os.path.join(path, "message.eml"), "wb") as message_file:
+            message_file.write(raw_email)
+
+        top_functions = io.StringIO()
+        if profile is not None:
+            profile.dump_stats(os.path.join(path, "profile.pstats"))
+            pstats.Stats(profile, stream=top_functions).sort_stats(
+                "cumulative"
+            ).print_stats(25)
+        with open(os.path.join(path, "summary.txt"), "w") as summary:
+            summary.write(f"Duration: {duration:.3f}s\n")
+            summary.write(f"Mailbox: {mailbox_id}\n\n")
+            summary.write("MIME tree:\n")
+            summary.write(mime_tree(email_message))
+            summary.write("\nTop functions by cumulative time:\n")
+            summary.write(top_functions.getvalue())
+
+        self._prune()
+        return path
+
+    def _prune(self):
+        with self._lock:
+            captures = []
+            for entry in os.listdir(self.directory):
+                path = os.path.join(self.directory, entry)
+                try:
+                    if os.path.isdir(path):
+                        captures.append((os.path.getmtime(path), entry, path))
+                except OSError:
+                    pass  # Removed by another process meanwhile
+            # Oldest first, names break ties between captures made in the same instant
+            captures.sort()
+            for _, _, path in captures[: max(0, len(captures) - self.max_captures)]:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def quiet_copy(parser):
+    """
+    Copies an EmailParser for a profiling run, without the settings that have side effects
+
+    :param parser: EmailParser to copy
+    :return: EmailParser that neither times, captures, stores nor caches anything
+    """
+    state = parser.__getstate__()  # Without the instrumented methods
+    state.update(
+        metrics=None,
+        slow_capture=None,
+        attachment_sink=None,
+        attachment_store=None,
+        result_cache=None,
+    )
+    quiet = object.__new__(type(parser))
+    quiet.__setstate__(state)
+    return quiet
+
+
+def message_bytes(email_message) -> bytes:
+    """Generates the raw message back from an email.message object"""
+    try:
+        return email_message.as_bytes()
+    except Exception:
+        return email_message.as_string().encode("utf-8", "surrogateescape")
+
+
+def mime_tree(email_message) -> str:
+    """
+    Summarizes the MIME structure of a message, one line per part
+
+    :param email_message: email.message object
+    :return: Indented text, e.g. "multipart/mixed" followed by its parts
+    """
+    lines = []
+    stack = [(email_message, 0)]
+    while stack:
+        part, level = stack.pop()
+        line = "  " * level + part.get_content_type()
+        if part.is_multipart():
+            children = part.get_payload()
+            line += f" ({len(children)} parts)"
+            stack.extend((child, level + 1) for child in reversed(children))
+        else:
+            payload = part.get_payload()
+            line += f" {len(payload) if isinstance(payload, str) else 0} chars"
+            encoding = part.get("Content-Transfer-Encoding")
+            if encoding:
+                line += f", {encoding}"
+            filename = part.get_filename()
+            if filename:
+                line += f", {filename}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
@@ -1,13 +1,19 @@
 #!/usr/bin/env python
 
+import re
+
 from setuptools import setup, find_packages
 
 with open("README.md", "r") as fh:
     long_description = fh.read()
 
+# The version lives in the package so the parse cache can tell which version wrote an entry
+with open("eml_parser/__init__.py", "r") as fh:
+    version = re.search(r'__version__ = "(.+)"', fh.read()).group(1)
+
 setup(
     name="python_eml_parser",
-    version="2.0.1",
+    version=version,
     description="Rapid7 InsightConnect email parser for email plugins",
     long_description=long_description,
     long_description_content_type="text/markdown",
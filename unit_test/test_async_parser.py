@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from eml_parser.async_parser import AsyncEmailParser
+from eml_parser.email_parser import EmailParser
+from unittest import IsolatedAsyncioTestCase
+import asyncio
+import logging
+import os
+
+CURRENT_DIR = os.path.dirname(__file__)
+PAYLOADS = [
+    f"{CURRENT_DIR}/payloads/basic_email.txt",
+    f"{CURRENT_DIR}/payloads/four_deep_with_pic.txt",
+    f"{CURRENT_DIR}/payloads/get_raw_attachment_test.txt",
+    f"{CURRENT_DIR}/payloads/quoted_printable.eml",
+]
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+
+def read_file_to_bytes(filename):
+    with open(filename, "rb") as my_file:
+        return my_file.read()
+
+
+class TestAsyncEmailParser(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.raw_emails = [read_file_to_bytes(payload) for payload in PAYLOADS]
+
+    async def fetch(self, raw_emails):
+        for raw_email in raw_emails:
+            await asyncio.sleep(0)
+            yield raw_email
+
+    async def test_parse(self):
+        async_parser = AsyncEmailParser(EmailParser(self.log))
+        email = await async_parser.parse(self.raw_emails[0], TEST_MAILBOX_ID)
+        self.assertEqual(email.subject, "Test")
+
+    async def test_parse_stream(self):
+        with ThreadPoolExecutor(2) as executor:
+            async_parser = AsyncEmailParser(
+                EmailParser(self.log), executor=executor, max_concurrency=2
+            )
+            subjects = [
+                email.subject
+                async for email in async_parser.parse_stream(
+                    self.fetch(self.raw_emails), TEST_MAILBOX_ID
+                )
+            ]
+
+        self.assertEqual(
+            sorted(subjects),
+            ["Attachment", "SOAR Mimecast URL Test 1", "Test", "level 3"],
+        )
+
+    async def test_parse_stream_respects_limits(self):
+        email_parser = EmailParser(self.log)
+        in_flight = []
+        most_in_flight = []
+
+        def make_email(raw_email, mailbox_id):
+            in_flight.append(raw_email)
+            most_in_flight.append(len(in_flight))
+            try:
+                return EmailParser.make_email(email_parser, raw_email, mailbox_id)
+            finally:
+                in_flight.remove(raw_email)
+
+        email_parser.make_email = make_email
+        async_parser = AsyncEmailParser(
+            email_parser, max_concurrency=3, max_pending_bytes=1
+        )
+        emails = [
+            email
+            async for email in async_parser.parse_stream(
+                self.fetch(self.raw_emails), TEST_MAILBOX_ID
+            )
+        ]
+
+        # The byte high-water mark only lets one message through at a time
+        self.assertEqual(len(emails), 4)
+        self.assertEqual(max(most_in_flight), 1)
+
+    async def test_parse_stream_raises_failures(self):
+        async_parser = AsyncEmailParser(EmailParser(self.log))
+        broken = b"From: user@example.com\r\n\r\nNo subject\r\n"
+
+        with self.assertRaises(TypeError):
+            async for _ in async_parser.parse_stream(
+                self.fetch([broken]), TEST_MAILBOX_ID
+            ):
+                pass
@@ -0,0 +1,124 @@
+from base64 import b64decode
+from unittest import TestCase
+import hashlib
+import logging
+import os
+import tempfile
+
+from eml_parser.attachment_sink import DirectorySink
+from eml_parser.email_parser import EmailParser
+from eml_parser.hashing import iter_decoded
+from eml_parser.icon_file import IconFile
+
+CURRENT_DIR = os.path.dirname(__file__)
+PAYLOADS = f"{CURRENT_DIR}/payloads"
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+
+def read_file_to_bytes(filename):
+    with open(f"{PAYLOADS}/{filename}", "rb") as my_file:
+        return my_file.read()
+
+
+class TestAttachmentSink(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.email_parser = EmailParser(self.log)
+
+    def test_indicators_match_without_sink(self):
+        sink_parser = EmailParser(self.log, attachment_sink=lambda *args: "handle")
+        for filename in (
+            "3_deep_with_text_attachment.txt",
+            "double_attached_with_images.txt",
+            "lots_of_eml_attached.eml",
+            "hash_crash.eml",
+        ):
+            raw_email = read_file_to_bytes(filename)
+            expected = self.email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+            actual = sink_parser.make_email(raw_email, TEST_MAILBOX_ID)
+            expected.flatten()
+            actual.flatten()
+
+            self.assertTrue(actual.flattened_attached_files, filename)
+            self.assertEqual(
+                [
+                    (attached_file.name, attached_file.indicators)
+                    for attached_file in actual.flattened_attached_files
+                ],
+                [
+                    (attached_file.name, attached_file.indicators)
+                    for attached_file in expected.flattened_attached_files
+                ],
+            )
+            for attached_file in actual.flattened_attached_files:
+                self.assertIsNone(attached_file.content)
+                self.assertEqual(attached_file.handle, "handle")
+
+    def test_directory_sink(self):
+        raw_email = read_file_to_bytes("double_attached_with_images.txt")
+        with tempfile.TemporaryDirectory() as directory:
+            email_parser = EmailParser(
+                self.log, attachment_sink=DirectorySink(directory)
+            )
+            actual = email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+            actual.flatten()
+
+            expected = self.email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+            expected.flatten()
+            for attached_file, plain_file in zip(
+                actual.flattened_attached_files, expected.flattened_attached_files
+            ):
+                with open(attached_file.handle, "rb") as stored_file:
+                    stored = stored_file.read()
+                self.assertEqual(
+                    os.path.basename(attached_file.handle),
+                    attached_file.indicators.sha256,
+                )
+                self.assertEqual(
+                    hashlib.sha256(stored).hexdigest(), attached_file.indicators.sha256
+                )
+                self.assertEqual(stored, b64decode(plain_file.content))
+
+            # Nothing left behind under a temporary name
+            self.assertFalse(
+                [name for name in os.listdir(directory) if name.startswith(".")]
+            )
+
+    def test_unread_chunks_are_hashed(self):
+        received = []
+
+        def sink(filename, content_type, chunks):
+            received.append((filename, content_type))
+            return None  # Doesn't read the content at all
+
+        email_parser = EmailParser(self.log, attachment_sink=sink)
+        raw_email = read_file_to_bytes("hash_crash.eml")
+        actual = email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+        expected = self.email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+
+        self.assertEqual(
+            received,
+            [
+                (attached.name, attached.content_type)
+                for attached in actual.attached_files
+            ],
+        )
+        self.assertEqual(
+            [attached.indicators for attached in actual.attached_files],
+            [attached.indicators for attached in expected.attached_files],
+        )
+        # Sinks returning None leave the handle out of the output
+        self.assertNotIn("handle", actual.attached_files[0].to_dict())
+
+    def test_handle_serialized(self):
+        icon_file = IconFile(
+            "a.txt", "text/plain", None, hash_algorithms=(), handle="/tmp/a"
+        )
+        self.assertEqual(icon_file.to_dict()["handle"], "/tmp/a")
+        self.assertNotIn("handle", IconFile("a.txt", "text/plain", "a").to_dict())
+
+    def test_iter_decoded_crlf_across_chunks(self):
+        content = "line one\r\nline two\r\n\r\nend\r"
+        for chunk_size in (1, 2, 3, 9, 10, 100):
+            actual = b"".join(iter_decoded(content, "", chunk_size))
+            self.assertEqual(actual, b"line oneline twoend\r")
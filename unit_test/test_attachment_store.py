@@ -0,0 +1,183 @@
+from eml_parser.attachment_store import AttachmentStore
+from eml_parser.email_parser import EmailParser
+from eml_parser.exceptions import EmailParserException
+from eml_parser.hashing import hash_content
+from eml_parser.icon_file import IconFile
+from unittest import TestCase
+from unittest.mock import patch
+import logging
+import os
+import pickle
+import tempfile
+
+CURRENT_DIR = os.path.dirname(__file__)
+DOUBLE_ATTACHED_EMAIL = f"{CURRENT_DIR}/payloads/double_attached_with_images.txt"
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+CONTENT_SHA256 = "ed7002b439e9ac845f22357d822bac1444730fbdb6016d3ec9432297b9ec9f73"
+
+
+class TestAttachmentStore(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_add_hashes_once(self):
+        store = AttachmentStore()
+
+        content, indicators = store.add("content")
+        same_content, same_indicators = store.add("".join(["con", "tent"]))
+
+        self.assertIs(same_content, content)
+        self.assertEqual(indicators, same_indicators)
+        self.assertEqual(indicators.sha256, CONTENT_SHA256)
+        self.assertEqual(store.hits, 1)
+        self.assertEqual(store.misses, 1)
+        self.assertEqual(len(store), 1)
+        self.assertIn(CONTENT_SHA256, store)
+
+    def test_add_matches_icon_file(self):
+        store = AttachmentStore()
+
+        _, indicators = store.add("Y29udGVudA==", "base64", ("md5",))
+
+        self.assertEqual(
+            indicators,
+            IconFile(
+                content="Y29udGVudA==",
+                content_transfer_encoding="base64",
+                hash_algorithms=("md5",),
+            ).indicators,
+        )
+        self.assertIsNone(indicators.sha256)
+        # The same payload, base64 encoded, is the same attachment
+        self.assertIn(CONTENT_SHA256, store)
+
+    def test_other_encoding_indexed(self):
+        store = AttachmentStore()
+        store.add("content")
+
+        content, indicators = store.add("Y29udGVudA==", "base64")
+        with patch("eml_parser.attachment_store.hash_content") as hash_content:
+            same_content, same_indicators = store.add("Y29udGVudA==", "base64")
+            hash_content.assert_not_called()
+
+        # The caller's encoding is kept, not the stored copy
+        self.assertEqual(same_content, "Y29udGVudA==")
+        self.assertEqual(same_indicators, indicators)
+        self.assertEqual((store.hits, store.misses, len(store)), (1, 2, 1))
+        self.assertEqual(store.size, len("content") + len(content))
+
+    def test_other_encoding_evicted_with_payload(self):
+        store = AttachmentStore(max_bytes=20)
+        store.add("content")
+        store.add("Y29udGVudA==", "base64")
+
+        store.add("other content")
+
+        self.assertNotIn(CONTENT_SHA256, store)
+        _, indicators = store.add("Y29udGVudA==", "base64")
+        self.assertEqual(indicators.sha256, CONTENT_SHA256)
+
+    def test_requested_algorithms_only(self):
+        store = AttachmentStore()
+
+        with patch(
+            "eml_parser.attachment_store.hash_content", wraps=hash_content
+        ) as hashed:
+            _, sha256_only = store.add("content", algorithms=("sha256",))
+            _, md5_only = store.add("Y29udGVudA==", "base64", ("md5",))
+            _, every_digest = store.add("content")
+            store.add("content")
+
+        self.assertEqual(
+            [call.args[2] for call in hashed.call_args_list],
+            [("sha256",), ("md5", "sha256"), ("sha1",)],
+        )
+        self.assertEqual(sha256_only.sha256, CONTENT_SHA256)
+        self.assertIsNone(sha256_only.md5)
+        self.assertEqual(md5_only.md5, every_digest.md5)
+        self.assertEqual(every_digest, IconFile(content="content").indicators)
+
+    def test_unsupported_algorithm(self):
+        store = AttachmentStore()
+
+        with self.assertRaises(EmailParserException):
+            store.add("content", algorithms=("sha512",))
+
+    def test_lru_eviction(self):
+        store = AttachmentStore(max_bytes=10)
+
+        store.add("aaaaa")
+        store.add("bbbbb")
+        store.add("aaaaa")  # Makes bbbbb the least recently used
+        store.add("ccccc")
+
+        self.assertEqual(store.evictions, 1)
+        self.assertEqual(store.size, 10)
+        self.assertEqual(store.get(store.add("aaaaa")[1].sha256), "aaaaa")
+        self.assertIsNone(store.get(store.add("bbbbb")[1].sha256 + "0"))
+        self.assertEqual(store.hits, 2)
+
+    def test_spill_to_directory(self):
+        store = AttachmentStore(max_bytes=5, spill_dir=self.directory.name)
+
+        _, first = store.add("aaaaa")
+        store.add("bbbbb")
+
+        self.assertEqual(len(store), 1)
+        self.assertIn(first.sha256, store)
+        self.assertEqual(store.get(first.sha256), "aaaaa")
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, first.sha256)))
+
+        store.clear()
+        self.assertEqual(os.listdir(self.directory.name), [])
+        self.assertNotIn(first.sha256, store)
+
+    def test_spilled_payload_added_again(self):
+        store = AttachmentStore(max_bytes=5, spill_dir=self.directory.name)
+        _, first = store.add("aaaaa")
+        store.add("bbbbb")
+
+        content, indicators = store.add("aaaaa")
+
+        self.assertEqual((content, indicators), ("aaaaa", first))
+        # Back in memory, bbbbb is spilled in its place
+        self.assertEqual(store.get(first.sha256), "aaaaa")
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory.name, first.sha256))
+        )
+        store.clear()
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_pickle_starts_empty(self):
+        store = AttachmentStore(max_bytes=1024)
+        store.add("content")
+
+        copied = pickle.loads(pickle.dumps(store))
+
+        self.assertEqual(copied.max_bytes, 1024)
+        self.assertEqual(len(copied), 0)
+
+    def test_parser_shares_attachments(self):
+        with open(DOUBLE_ATTACHED_EMAIL, "rb") as email_file:
+            raw_email = email_file.read()
+        store = AttachmentStore()
+        email_parser = EmailParser(self.log, attachment_store=store)
+
+        first = email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+        second = email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+        expected = EmailParser(self.log).make_email(raw_email, TEST_MAILBOX_ID)
+        self.assertEqual(second.make_serializable(), expected.make_serializable())
+
+        first.flatten()
+        second.flatten()
+        self.assertTrue(first.flattened_attached_files)
+        for first_file, second_file in zip(
+            first.flattened_attached_files, second.flattened_attached_files
+        ):
+            self.assertIs(first_file.content, second_file.content)
+        self.assertGreater(store.hits, 0)
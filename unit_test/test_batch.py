@@ -0,0 +1,107 @@
+from eml_parser import batch
+from eml_parser.attachment_store import AttachmentStore
+from eml_parser.email_parser import EmailParser
+from eml_parser.result_cache import ParseResultCache
+from unittest import TestCase
+import logging
+import os
+
+CURRENT_DIR = os.path.dirname(__file__)
+PAYLOADS = [
+    f"{CURRENT_DIR}/payloads/basic_email.txt",
+    f"{CURRENT_DIR}/payloads/four_deep_with_pic.txt",
+    f"{CURRENT_DIR}/payloads/get_raw_attachment_test.txt",
+    f"{CURRENT_DIR}/payloads/quoted_printable.eml",
+    f"{CURRENT_DIR}/payloads/double_attached_with_images.txt",
+]
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+# Has no Subject, which the parser can't handle
+BROKEN_EMAIL = b"From: user@example.com\r\nTo: user@example.com\r\n\r\nBody\r\n"
+
+
+def read_file_to_bytes(filename):
+    with open(filename, "rb") as my_file:
+        return my_file.read()
+
+
+class TestBatchEmailParser(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.raw_emails = [read_file_to_bytes(payload) for payload in PAYLOADS]
+        email_parser = EmailParser(self.log)
+        self.expected = [
+            email_parser.make_email_from_bytes(raw_email, TEST_MAILBOX_ID)
+            for raw_email in self.raw_emails
+        ]
+
+    def test_parse_many_ordered(self):
+        email_parser = EmailParser(self.log)
+        outcomes = list(
+            email_parser.parse_many(
+                self.raw_emails, TEST_MAILBOX_ID, workers=2, chunk_size=2
+            )
+        )
+
+        self.assertEqual([outcome.index for outcome in outcomes], [0, 1, 2, 3, 4])
+        for outcome, expected in zip(outcomes, self.expected):
+            self.assertTrue(outcome.ok)
+            self.assertEqual(
+                outcome.email.make_serializable(), expected.make_serializable()
+            )
+
+    def test_parse_many_as_completed(self):
+        email_parser = EmailParser(self.log)
+        outcomes = list(
+            email_parser.parse_many(
+                self.raw_emails, TEST_MAILBOX_ID, workers=2, ordered=False, chunk_size=1
+            )
+        )
+
+        outcomes.sort(key=lambda outcome: outcome.index)
+        self.assertEqual([outcome.index for outcome in outcomes], [0, 1, 2, 3, 4])
+        for outcome, expected in zip(outcomes, self.expected):
+            self.assertEqual(outcome.email.subject, expected.subject)
+
+    def test_parse_many_captures_failures(self):
+        email_parser = EmailParser(self.log)
+        raw_emails = [self.raw_emails[0], BROKEN_EMAIL, self.raw_emails[0]]
+
+        for workers in (0, 2):
+            outcomes = list(
+                email_parser.parse_many(raw_emails, TEST_MAILBOX_ID, workers=workers)
+            )
+
+            self.assertEqual([outcome.ok for outcome in outcomes], [True, False, True])
+            self.assertIsNone(outcomes[1].email)
+            self.assertTrue("TypeError" in outcomes[1].error)
+            self.assertEqual(outcomes[2].email.subject, "Test")
+
+    def test_make_email(self):
+        email_parser = EmailParser(self.log)
+        raw_email = self.raw_emails[0]
+
+        from_bytes = email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+        from_string = email_parser.make_email(raw_email.decode(), TEST_MAILBOX_ID)
+
+        self.assertEqual(from_bytes.subject, "Test")
+        self.assertEqual(
+            from_bytes.make_serializable(), from_string.make_serializable()
+        )
+
+    def test_workers_start_empty(self):
+        store = AttachmentStore()
+        cache = ParseResultCache()
+        email_parser = EmailParser(self.log, attachment_store=store, result_cache=cache)
+        email_parser.make_email(self.raw_emails[1], TEST_MAILBOX_ID)
+        self.assertTrue(len(store) and len(cache))
+
+        # What a forked worker is handed, the parent's parser itself
+        batch._init_worker(email_parser)
+        try:
+            worker_parser = batch._worker_parser
+            self.assertIsNot(worker_parser.attachment_store, store)
+            self.assertEqual(len(worker_parser.attachment_store), 0)
+            self.assertEqual(len(worker_parser.result_cache), 0)
+        finally:
+            batch._worker_parser = None
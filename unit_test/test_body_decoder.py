@@ -0,0 +1,51 @@
+from eml_parser.body_decoder import charset_codec, decode_bytes, decode_part
+from email.message import Message
+from unittest import TestCase
+
+
+def make_part(payload: bytes, charset: str = None, encoding: str = None):
+    part = Message()
+    content_type = "text/plain"
+    if charset:
+        content_type += f'; charset="{charset}"'
+    part["Content-Type"] = content_type
+    if encoding:
+        part["Content-Transfer-Encoding"] = encoding
+    part.set_payload(payload.decode("ascii"))
+    return part
+
+
+class TestBodyDecoder(TestCase):
+    def test_ascii(self):
+        self.assertEqual(decode_bytes(b"Hello\n", "shift_jis"), "Hello\n")
+
+    def test_declared_charset(self):
+        self.assertEqual(decode_bytes("Grüße".encode("latin-1"), "iso-8859-1"), "Grüße")
+        self.assertEqual(
+            decode_bytes("こんにちは".encode("shift_jis"), "Shift_JIS"), "こんにちは"
+        )
+
+    def test_utf8(self):
+        self.assertEqual(decode_bytes("Grüße".encode("utf-8")), "Grüße")
+        self.assertEqual(decode_bytes("Grüße".encode("utf-8"), "us-ascii"), "Grüße")
+        self.assertEqual(
+            decode_bytes("Grüße".encode("utf-8"), "no-such-charset"), "Grüße"
+        )
+
+    def test_detwingle(self):
+        # UTF-8 with a Windows-1252 quote pasted in
+        payload = "“Grüße”".encode("utf-8") + b" \x93quoted\x94"
+        self.assertEqual(decode_bytes(payload, "utf-8"), "“Grüße” “quoted”")
+
+    def test_charset_codec(self):
+        self.assertEqual(charset_codec("latin-1"), "iso8859-1")
+        self.assertEqual(charset_codec("UTF8"), "utf-8")
+        self.assertIsNone(charset_codec("x-unknown"))
+        self.assertIsNone(charset_codec("base64"))
+
+    def test_decode_part(self):
+        part = make_part(b"Gr=FC=DFe=\n here", "iso-8859-1", "quoted-printable")
+        self.assertEqual(decode_part(part), "Grüße here")
+
+        part = make_part(b"R3LDvMOfZQ==\n", "utf-8", "base64")
+        self.assertEqual(decode_part(part), "Grüße")
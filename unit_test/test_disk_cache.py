@@ -0,0 +1,151 @@
+from eml_parser import __version__
+from eml_parser.disk_cache import CachedEmailParser, DiskResultCache, SerializedEmail
+from eml_parser.email_parser import EmailParser
+from eml_parser.limits import ParseLimits
+from unittest import TestCase
+from unittest.mock import patch
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+
+CURRENT_DIR = os.path.dirname(__file__)
+BASIC_EMAIL = f"{CURRENT_DIR}/payloads/basic_email.txt"
+FOUR_DEEP = f"{CURRENT_DIR}/payloads/four_deep_with_pic.txt"
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+
+def read_file_to_bytes(filename):
+    with open(filename, "rb") as my_file:
+        return my_file.read()
+
+
+class TestDiskResultCache(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite")
+        self.basic_email = read_file_to_bytes(BASIC_EMAIL)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_put_and_get(self):
+        cache = DiskResultCache(self.path)
+        key = cache.key(self.basic_email)
+
+        self.assertIsNone(cache.get(key, TEST_MAILBOX_ID))
+        cache.put(key, TEST_MAILBOX_ID, {"subject": "Test"})
+        cache.close()
+
+        # A new cache (e.g. after a restart) sees the entry
+        reopened = DiskResultCache(self.path)
+        self.assertEqual(reopened.get(key, TEST_MAILBOX_ID), {"subject": "Test"})
+        self.assertIsNone(reopened.get(key, "other"))
+        self.assertEqual(len(reopened), 1)
+        reopened.close()
+
+    def test_wal_mode(self):
+        DiskResultCache(self.path).prune()
+
+        connection = sqlite3.connect(self.path)
+        journal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+        connection.close()
+
+        self.assertEqual(journal_mode, "wal")
+
+    def test_ttl(self):
+        cache = DiskResultCache(self.path, ttl=60)
+        cache.put("key", TEST_MAILBOX_ID, {"subject": "Test"})
+
+        with patch("eml_parser.disk_cache.time.time", return_value=10**12):
+            self.assertIsNone(cache.get("key", TEST_MAILBOX_ID))
+            self.assertEqual(cache.prune(), 1)
+        self.assertEqual(len(cache), 0)
+        cache.close()
+
+    def test_parser_version(self):
+        old_cache = DiskResultCache(self.path, parser_version="0.0.1")
+        old_cache.put("key", TEST_MAILBOX_ID, {"subject": "Test"})
+        old_cache.close()
+
+        cache = DiskResultCache(self.path)
+        self.assertEqual(cache.parser_version, __version__)
+        self.assertIsNone(cache.get("key", TEST_MAILBOX_ID))
+        self.assertEqual(cache.prune(), 1)
+        cache.close()
+
+    def test_cached_email_parser(self):
+        cache = DiskResultCache(self.path)
+        email_parser = EmailParser(self.log)
+        cached_parser = CachedEmailParser(email_parser, cache)
+
+        first = cached_parser.make_email(self.basic_email, TEST_MAILBOX_ID)
+        with patch.object(email_parser, "make_email") as make_email:
+            second = cached_parser.make_email(self.basic_email, TEST_MAILBOX_ID)
+            make_email.assert_not_called()
+
+        self.assertIsInstance(second, SerializedEmail)
+        self.assertEqual(
+            second.make_serializable(),
+            email_parser.make_email(
+                self.basic_email, TEST_MAILBOX_ID
+            ).make_serializable(),
+        )
+        self.assertEqual(first.make_serializable(), second.make_serializable())
+        cache.close()
+
+    def test_parser_settings(self):
+        cache = DiskResultCache(self.path)
+        headers_parser = CachedEmailParser(
+            EmailParser(self.log, fields={"headers"}), cache
+        )
+        full_parser = CachedEmailParser(EmailParser(self.log), cache)
+
+        headers_only = headers_parser.make_email(self.basic_email, TEST_MAILBOX_ID)
+        full = full_parser.make_email(self.basic_email, TEST_MAILBOX_ID)
+
+        self.assertIsNone(headers_only.data.get("body"))
+        self.assertEqual(full.data["body"], "Test\n")
+        self.assertEqual(len(cache), 2)
+        cache.close()
+
+    def test_limited_results_not_cached(self):
+        cache = DiskResultCache(self.path)
+        raw_email = read_file_to_bytes(FOUR_DEEP)
+        limited_parser = CachedEmailParser(
+            EmailParser(self.log, limits=ParseLimits(max_parts=2)), cache
+        )
+
+        limited = limited_parser.make_email(raw_email, TEST_MAILBOX_ID)
+
+        self.assertEqual(limited.data["limit_exceeded"], "max_parts")
+        self.assertEqual(len(cache), 0)
+        full = CachedEmailParser(EmailParser(self.log), cache).make_email(
+            raw_email, TEST_MAILBOX_ID
+        )
+        self.assertIsNone(full.data.get("limit_exceeded"))
+        cache.close()
+
+    def test_reconnect_after_fork(self):
+        cache = DiskResultCache(self.path)
+        cache.put("key", TEST_MAILBOX_ID, {"subject": "Test"})
+        inherited = cache._connection
+
+        with patch("eml_parser.disk_cache.os.getpid", return_value=-1):
+            self.assertEqual(cache.get("key", TEST_MAILBOX_ID), {"subject": "Test"})
+            self.assertIsNot(cache._connection, inherited)
+            cache.close()
+        inherited.close()
+
+    def test_pickle(self):
+        cache = DiskResultCache(self.path, ttl=5)
+        cache.put("key", TEST_MAILBOX_ID, {"subject": "Test"})
+
+        copied = pickle.loads(pickle.dumps(cache))
+
+        self.assertEqual(copied.ttl, 5)
+        self.assertEqual(copied.get("key", TEST_MAILBOX_ID), {"subject": "Test"})
+        cache.close()
+        copied.close()
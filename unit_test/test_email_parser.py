@@ -1,8 +1,11 @@
 from eml_parser.email_parser import EmailParser
+from eml_parser.exceptions import EmailParserException
+from eml_parser.icon_email import LazyIconEmail
 from unittest import TestCase
 import logging
 import os
 from email import message_from_string
+from base64 import b64encode
 TEST_MAILBOX_ID = "somedude@hotmail.com"
 
 CURRENT_DIR = os.path.dirname(__file__)
@@ -29,6 +32,11 @@ def read_file_to_string(filename):
         return my_file.read()
 
 
+def read_file_to_bytes(filename):
+    with open(filename, "rb") as my_file:
+        return my_file.read()
+
+
 class TestEmailParser(TestCase):
     def setUp(self) -> None:
         self.log = logging.getLogger("stuff")
@@ -359,7 +367,35 @@ Nothing here, just this text</div>
         )
         actual_body = email_parser.decode_body(test_email._payload[0]._payload[0])
 
-        expected_body = """________________________________From: Example User <u">Sent: Tuesday, August 13, 2019 3:56 PMTo: Example User <u">Subject: User Test________________________________From: Example User <u">Sent: Tuesday, August 13, 2019 10:55 AMTo: Example User <u">Subject: Fw: Short Test Email________________________________From: Example UserSent: Tuesday, August 13, 2019 9:30 AMTo: u" <u">Subject: Short Test Email"""
+        # The part declares iso-8859-1, so the é survives
+        expected_body = """
+
+
+________________________________
+From: Example User <u"é>
+Sent: Tuesday, August 13, 2019 3:56 PM
+To: Example User <u"é>
+Subject: User Test
+
+
+
+
+________________________________
+From: Example User <u"é>
+Sent: Tuesday, August 13, 2019 10:55 AM
+To: Example User <u"é>
+Subject: Fw: Short Test Email
+
+
+
+________________________________
+From: Example User
+Sent: Tuesday, August 13, 2019 9:30 AM
+To: u"é <u"é>
+Subject: Short Test Email
+
+
+"""
         self.assertEqual(expected_body, actual_body)
 
     def test_decode_multipart_body_html_unicode(self):
@@ -392,3 +428,221 @@ Nothing here, just this text</div>
 
         expected = '<p class="MsoNormal"><a href="http://example.com" title="http://proteexample.com.com/s/414KCXDXZofXVRNRZT6ai-n?domain=example.com">http://aexample.com</a><o:p></o:p></p>'
         self.assertTrue(expected in email.body)
+
+    def test_get_headers(self):
+        basic_email_text = read_file_to_string(GET_BASIC_EMAIL)
+        test_email = message_from_string(basic_email_text)
+
+        actual = EmailParser.get_headers(test_email)
+
+        self.assertEqual(len(actual), 10)
+        self.assertEqual(
+            actual[0], {"name": "To", "value": "Example User <user@example.com>"}
+        )
+        self.assertEqual(actual[2], {"name": "Subject", "value": "Test"})
+        self.assertEqual(
+            actual[5],
+            {
+                "name": "User-Agent",
+                "value": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.13; rv:60.0)\n Gecko/20100101 Thunderbird/60.8.0",
+            },
+        )
+
+    def test_parse_with_selected_hash_algorithms(self):
+        raw_email = read_file_to_string(GET_RAW_ATTACHMENT_PAYLOAD3)
+        email_parser = EmailParser(self.log, hash_algorithms=("sha256",))
+        email = email_parser.make_email_from_raw(
+            message_from_string(raw_email), TEST_MAILBOX_ID
+        )
+
+        attachment = email.attached_files[0]
+        self.assertIsNone(attachment.indicators.md5)
+        self.assertIsNone(attachment.indicators.sha1)
+        self.assertEqual(
+            attachment.indicators.sha256,
+            "a1485e471988b56478ca36c592638f225bb9c0f171e83148cfdd996ab099262c",
+        )
+        self.assertIsNone(email.indicators.md5)
+
+    def test_make_email_from_bytes(self):
+        raw_email = read_file_to_string(GET_RAW_ATTACHMENT_PAYLOAD)
+        email_parser = EmailParser(self.log)
+        expected = email_parser.make_email_from_raw(
+            message_from_string(raw_email), TEST_MAILBOX_ID
+        )
+        actual = email_parser.make_email_from_bytes(
+            raw_email.encode("utf-8"), TEST_MAILBOX_ID
+        )
+
+        self.assertEqual(actual.make_serializable(), expected.make_serializable())
+
+    def test_make_email_from_file(self):
+        email_parser = EmailParser(self.log)
+        expected = email_parser.make_email_from_bytes(
+            read_file_to_bytes(GET_EML_WITH_EML_ATTACHED), TEST_MAILBOX_ID
+        )
+
+        from_path = email_parser.make_email_from_file(
+            GET_EML_WITH_EML_ATTACHED, TEST_MAILBOX_ID
+        )
+        with open(GET_EML_WITH_EML_ATTACHED, "rb") as email_file:
+            from_file_object = email_parser.make_email_from_file(
+                email_file, TEST_MAILBOX_ID
+            )
+
+        self.assertEqual(len(from_path.attached_emails), 4)
+        self.assertEqual(len(from_path.attached_files), 2)
+        self.assertEqual(from_path.make_serializable(), expected.make_serializable())
+        self.assertEqual(
+            from_file_object.make_serializable(), expected.make_serializable()
+        )
+
+    def test_make_email_from_8bit_bytes(self):
+        raw_email = (
+            "From: Jürgen <user@example.com>\r\n"
+            "To: user@example.com\r\n"
+            "Subject: Grüße\r\n"
+            "Content-Type: text/plain; charset=utf-8\r\n"
+            "Content-Transfer-Encoding: 8bit\r\n"
+            "\r\n"
+            "Hallo Grüße\r\n"
+        ).encode("utf-8")
+        email_parser = EmailParser(self.log)
+        email = email_parser.make_email_from_bytes(raw_email, TEST_MAILBOX_ID)
+
+        self.assertEqual(email.subject, "Grüße")
+        self.assertEqual(email.sender, "user@example.com")
+        self.assertEqual(email.recipients, ["user@example.com"])
+        self.assertEqual(
+            email.headers[0], {"name": "From", "value": "Jürgen <user@example.com>"}
+        )
+        self.assertTrue("Hallo Grüße" in email.body)
+
+    def test_base64_body_not_decoded_twice(self):
+        body = "Café https://example.com/?id=41&ref=20AB\r\n"
+        raw_email = (
+            "From: user@example.com\r\n"
+            "To: user@example.com\r\n"
+            "Subject: Link\r\n"
+            "Content-Type: text/plain; charset=utf-8\r\n"
+            "Content-Transfer-Encoding: base64\r\n"
+            "\r\n"
+        ).encode("utf-8") + b64encode(body.encode("utf-8"))
+        email_parser = EmailParser(self.log)
+        email = email_parser.make_email_from_bytes(raw_email, TEST_MAILBOX_ID)
+
+        self.assertEqual(email.body, body)
+
+    def test_nested_emails_parsed_once(self):
+        raw_email = read_file_to_string(GET_RAW_ATTACHMENT_PAYLOAD)
+        email_parser = EmailParser(self.log)
+        email = email_parser.make_email_from_raw(
+            message_from_string(raw_email), TEST_MAILBOX_ID
+        )
+
+        # Emails nested deeper in the tree are listed by every ancestor, but they are
+        # only parsed once
+        level_2 = email.attached_emails[0]
+        self.assertEqual(email.attached_emails[1].subject, "Pic attached")
+        self.assertIs(email.attached_emails[1], level_2.attached_emails[0])
+        self.assertTrue(level_2.has_attachments)
+
+    def test_lazy_nested(self):
+        for payload in (GET_EML_WITH_EML_ATTACHED, GET_RAW_ATTACHMENT_PAYLOAD):
+            raw_email = read_file_to_string(payload)
+            eager = EmailParser(self.log).make_email(raw_email, TEST_MAILBOX_ID)
+            lazy = EmailParser(self.log, lazy_nested=True).make_email(
+                raw_email, TEST_MAILBOX_ID
+            )
+
+            self.assertTrue(lazy.attached_emails)
+            for attached_email in lazy.attached_emails:
+                self.assertIsInstance(attached_email, LazyIconEmail)
+                self.assertFalse(attached_email.parsed)
+            self.assertEqual(lazy.body, eager.body)
+            self.assertEqual(lazy.has_attachments, eager.has_attachments)
+
+            # Attached emails only hold their own attachments, flatten finds them all
+            eager.flatten()
+            lazy.flatten()
+            self.assertTrue(all(email.parsed for email in lazy.attached_emails))
+            self.assertEqual(
+                sorted(email.dedup_key() for email in lazy.flattened_attached_emails),
+                sorted(email.dedup_key() for email in eager.flattened_attached_emails),
+            )
+            self.assertEqual(
+                sorted(file.dedup_key() for file in lazy.flattened_attached_files),
+                sorted(file.dedup_key() for file in eager.flattened_attached_files),
+            )
+
+    def test_fields_projection(self):
+        raw_email = read_file_to_string(GET_RAW_ATTACHMENT_PAYLOAD)
+        full = EmailParser(self.log).make_email(raw_email, TEST_MAILBOX_ID)
+
+        headers_only = EmailParser(self.log, fields={"headers"}).make_email(
+            raw_email, TEST_MAILBOX_ID
+        )
+        self.assertEqual(headers_only.subject, full.subject)
+        self.assertEqual(headers_only.sender, full.sender)
+        self.assertEqual(headers_only.recipients, full.recipients)
+        self.assertEqual(headers_only.headers, full.headers)
+        self.assertIsNone(headers_only.body)
+        self.assertIsNone(headers_only.indicators)
+        self.assertEqual(headers_only.attached_files, [])
+        self.assertEqual(headers_only.attached_emails, [])
+
+        # Only the image attached to the outer email, not the one in the attached email
+        double_attached_email = read_file_to_string(GET_DOUBLE_ATTACHED_WITH_IMAGES)
+        hashes_only = EmailParser(
+            self.log, fields={"attachments", "indicators"}
+        ).make_email(double_attached_email, TEST_MAILBOX_ID)
+        self.assertIsNone(hashes_only.headers)
+        self.assertEqual(hashes_only.attached_emails, [])
+        self.assertEqual(len(hashes_only.attached_files), 1)
+        self.assertEqual(
+            hashes_only.attached_files[0].indicators.sha256,
+            EmailParser(self.log)
+            .make_email(double_attached_email, TEST_MAILBOX_ID)
+            .attached_files[0]
+            .indicators.sha256,
+        )
+
+        nested_only = EmailParser(self.log, fields={"nested"}).make_email(
+            raw_email, TEST_MAILBOX_ID
+        )
+        self.assertEqual(
+            [email.subject for email in nested_only.attached_emails],
+            [email.subject for email in full.attached_emails],
+        )
+        self.assertEqual(nested_only.attached_files, [])
+
+        # Attached .eml files are attached emails too
+        eml_attached = read_file_to_string(GET_EML_WITH_EML_ATTACHED)
+        full_eml = EmailParser(self.log).make_email(eml_attached, TEST_MAILBOX_ID)
+        nested_eml = EmailParser(self.log, fields={"nested"}).make_email(
+            eml_attached, TEST_MAILBOX_ID
+        )
+        self.assertEqual(len(full_eml.attached_emails), 4)
+        self.assertEqual(
+            [email.subject for email in nested_eml.attached_emails],
+            [email.subject for email in full_eml.attached_emails],
+        )
+        self.assertEqual(nested_eml.attached_files, [])
+
+        no_indicators = EmailParser(
+            self.log, fields={"body", "attachments", "nested"}
+        ).make_email(raw_email, TEST_MAILBOX_ID)
+        self.assertEqual(no_indicators.body, full.body)
+        self.assertIsNone(no_indicators.indicators)
+        self.assertTrue(no_indicators.attached_files)
+        self.assertTrue(
+            all(
+                icon_file.indicators is None
+                for icon_file in no_indicators.attached_files
+            )
+        )
+        self.assertFalse("indicators" in no_indicators.make_serializable())
+
+    def test_unknown_field(self):
+        with self.assertRaises(EmailParserException):
+            EmailParser(self.log, fields={"headers", "bodies"})
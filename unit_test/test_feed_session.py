@@ -0,0 +1,92 @@
+from eml_parser.attachment_store import AttachmentStore
+from eml_parser.email_parser import EmailParser
+from eml_parser.exceptions import EmailParserException
+from eml_parser.result_cache import ParseResultCache
+from unittest import TestCase
+from unittest.mock import patch
+import logging
+import os
+
+CURRENT_DIR = os.path.dirname(__file__)
+PAYLOADS = f"{CURRENT_DIR}/payloads"
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+
+def read_file_to_bytes(filename):
+    with open(f"{PAYLOADS}/{filename}", "rb") as my_file:
+        return my_file.read()
+
+
+def feed(session, raw_email, chunk_size):
+    for start in range(0, len(raw_email), chunk_size):
+        session.feed(raw_email[start : start + chunk_size])
+    return session.close()
+
+
+class TestFeedSession(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.email_parser = EmailParser(self.log)
+
+    def test_matches_make_email(self):
+        for filename in (
+            "basic_email.txt",
+            "quoted_printable.eml",
+            "double_attached_with_images.txt",
+            "lots_of_eml_attached.eml",
+            "hash_crash.eml",
+        ):
+            raw_email = read_file_to_bytes(filename)
+            expected = self.email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+
+            for chunk_size in (1, 100, len(raw_email)):
+                session = self.email_parser.feed_session(TEST_MAILBOX_ID)
+                actual = feed(session, raw_email, chunk_size)
+
+                self.assertEqual(
+                    actual.make_serializable(), expected.make_serializable(), filename
+                )
+                self.assertEqual(session.size, len(raw_email))
+
+    def test_attachments_hashed_while_feeding(self):
+        raw_email = read_file_to_bytes("double_attached_with_images.txt")
+        store = AttachmentStore()
+        email_parser = EmailParser(self.log, attachment_store=store)
+        session = email_parser.feed_session(TEST_MAILBOX_ID)
+
+        for start in range(0, len(raw_email), 1024):
+            session.feed(raw_email[start : start + 1024])
+        hashed = store.misses
+
+        with patch("eml_parser.attachment_store.hash_content") as hash_content:
+            actual = session.close()
+
+        hash_content.assert_not_called()
+        self.assertGreater(hashed, 0)
+        self.assertEqual(store.misses, hashed)
+        self.assertEqual(
+            actual.make_serializable(),
+            self.email_parser.make_email(
+                raw_email, TEST_MAILBOX_ID
+            ).make_serializable(),
+        )
+
+    def test_result_cache(self):
+        raw_email = read_file_to_bytes("basic_email.txt")
+        email_parser = EmailParser(self.log, result_cache=ParseResultCache())
+
+        expected = email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+        actual = feed(email_parser.feed_session(TEST_MAILBOX_ID), raw_email, 10)
+
+        self.assertIs(actual, expected)
+        self.assertEqual(email_parser.result_cache.hits, 1)
+
+    def test_closed(self):
+        session = self.email_parser.feed_session(TEST_MAILBOX_ID)
+        session.feed(read_file_to_bytes("basic_email.txt"))
+        session.close()
+
+        with self.assertRaises(EmailParserException):
+            session.feed(b"more")
+        with self.assertRaises(EmailParserException):
+            session.close()
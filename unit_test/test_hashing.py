@@ -0,0 +1,67 @@
+from base64 import b64decode, b64encode
+from binascii import Error
+from unittest import TestCase
+import os
+
+from eml_parser.exceptions import EmailParserException
+from eml_parser.hashing import hash_content, iter_base64_decoded
+from eml_parser.indicators import Indicators
+
+
+class TestHashing(TestCase):
+    def test_base64_decoded_in_chunks(self):
+        raw = os.urandom(10000)
+        encoded = b64encode(raw).decode()
+        # Break it into mime style lines so the chunks don't line up with quads
+        encoded = "\r\n".join(encoded[i : i + 76] for i in range(0, len(encoded), 76))
+
+        for chunk_size in (1, 3, 7, 64, 1000, 100000):
+            actual = b"".join(iter_base64_decoded(encoded, chunk_size))
+            self.assertEqual(actual, raw)
+
+    def test_base64_matches_b64decode_on_odd_input(self):
+        for encoded in ("QQ==QUJD", "Q!!Q==", "QUJD\nQUJD", "QUJDQQ==\n\n", ""):
+            expected = b64decode(encoded)
+            actual = b"".join(iter_base64_decoded(encoded, 3))
+            self.assertEqual(actual, expected)
+
+    def test_base64_bad_padding(self):
+        with self.assertRaises(Error):
+            b"".join(iter_base64_decoded("QUJ", 2))
+
+    def test_hash_content_single_algorithm(self):
+        actual = hash_content("content", algorithms=("sha256",))
+        self.assertEqual(
+            actual,
+            {
+                "sha256": "ed7002b439e9ac845f22357d822bac1444730fbdb6016d3ec9432297b9ec9f73"
+            },
+        )
+
+    def test_hash_content_unsupported_algorithm(self):
+        with self.assertRaises(EmailParserException):
+            hash_content("content", algorithms=("sha512",))
+
+    def test_indicators_base64(self):
+        indicators = Indicators("Y29udGVudA==", "base64")
+        self.assertEqual(indicators.md5, "9a0364b9e99bb480dd25e1f0284c8555")
+        self.assertEqual(indicators.sha1, "040f06fd774092478d450774f5ba30c5da78acc8")
+        self.assertEqual(
+            indicators.sha256,
+            "ed7002b439e9ac845f22357d822bac1444730fbdb6016d3ec9432297b9ec9f73",
+        )
+
+    def test_indicators_sha256_only(self):
+        indicators = Indicators("content", algorithms=("sha256",))
+        self.assertIsNone(indicators.md5)
+        self.assertIsNone(indicators.sha1)
+        self.assertEqual(
+            indicators.sha256,
+            "ed7002b439e9ac845f22357d822bac1444730fbdb6016d3ec9432297b9ec9f73",
+        )
+        self.assertEqual(
+            indicators.make_serializable(),
+            {
+                "sha256": "ed7002b439e9ac845f22357d822bac1444730fbdb6016d3ec9432297b9ec9f73"
+            },
+        )
@@ -0,0 +1,101 @@
+from eml_parser.email_parser import EmailParser
+from eml_parser.headers_only import EmailHeaders, parse_header_block
+from unittest import TestCase
+import io
+import logging
+import os
+import pathlib
+
+CURRENT_DIR = os.path.dirname(__file__)
+PAYLOADS = f"{CURRENT_DIR}/payloads"
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+
+def read_file_to_bytes(filename):
+    with open(f"{PAYLOADS}/{filename}", "rb") as my_file:
+        return my_file.read()
+
+
+class TestHeadersOnly(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.email_parser = EmailParser(self.log)
+
+    def test_matches_full_parse(self):
+        for filename in (
+            "basic_email.txt",
+            "quoted_printable.eml",
+            "Grüße_von_Stefan_Appel.eml",
+            "four_deep_with_pic.txt",
+            "hash_crash.eml",
+        ):
+            raw_email = read_file_to_bytes(filename)
+            actual = self.email_parser.parse_headers_only(raw_email)
+            expected = self.email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+
+            self.assertIsInstance(actual, EmailHeaders)
+            self.assertEqual(actual.subject, expected.subject, filename)
+            self.assertEqual(actual.sender, expected.sender, filename)
+            self.assertEqual(actual.recipients, expected.recipients, filename)
+            self.assertEqual(actual.date_received, expected.date_received, filename)
+            self.assertEqual(actual.headers, expected.headers, filename)
+
+    def test_sources(self):
+        raw_email = read_file_to_bytes("basic_email.txt")
+        expected = self.email_parser.parse_headers_only(raw_email).to_dict()
+
+        for source in (
+            raw_email.decode("utf-8"),
+            bytearray(raw_email),
+            io.BytesIO(raw_email),
+            pathlib.Path(f"{PAYLOADS}/basic_email.txt"),
+        ):
+            self.assertEqual(
+                self.email_parser.parse_headers_only(source).to_dict(), expected
+            )
+        self.assertTrue(expected["message_id"].startswith("<"))
+
+    def test_one_line_str_is_a_message(self):
+        actual = self.email_parser.parse_headers_only("Subject: One line")
+
+        self.assertEqual(actual.subject, "One line")
+
+    def test_body_is_not_read(self):
+        headers = (
+            b"From: user@example.com\r\nSubject: Big\r\nMessage-ID: <1@example.com>\r\n"
+        )
+        raw_email = io.BytesIO(headers + b"\r\n" + b"x" * 50 * 1024 * 1024)
+
+        actual = self.email_parser.parse_headers_only(raw_email)
+
+        self.assertEqual(actual.subject, "Big")
+        self.assertEqual(actual.message_id, "<1@example.com>")
+        self.assertLess(raw_email.tell(), 64 * 1024)
+
+    def test_parse_header_block(self):
+        block = (
+            b"From user@example.com Thu Aug  8 17:29:14 2019\n"
+            b"Subject: =?utf-8?q?Gr=C3=BC=C3=9Fe?=\n"
+            b"X-Folded: first\n"
+            b"\tsecond\n"
+            b"To: user@example.com"
+        )
+
+        headers = parse_header_block(block)
+
+        self.assertEqual(
+            headers,
+            [
+                {"name": "Subject", "value": "=?utf-8?q?Gr=C3=BC=C3=9Fe?="},
+                {"name": "X-Folded", "value": "first\n\tsecond"},
+                {"name": "To", "value": "user@example.com"},
+            ],
+        )
+        self.assertEqual(EmailHeaders(headers).subject, "Grüße")
+
+    def test_no_headers(self):
+        actual = self.email_parser.parse_headers_only(b"\r\nJust a body")
+
+        self.assertEqual(actual.headers, [])
+        self.assertIsNone(actual.subject)
+        self.assertEqual(actual.recipients, [])
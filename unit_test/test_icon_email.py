@@ -1,5 +1,5 @@
 from unittest import TestCase
-from eml_parser.icon_email import IconEmail
+from eml_parser.icon_email import IconEmail, LazyIconEmail
 from eml_parser.icon_file import IconFile
 from eml_parser.email_parser import EmailParser
 from eml_parser.exceptions import EmailParserException
@@ -7,6 +7,7 @@ from email import message_from_string
 import logging
 import datetime
 import os
+import pickle
 
 CURRENT_DIR = os.path.dirname(__file__)
 BASIC_MESSAGE_PAYLOAD = (
@@ -173,6 +174,76 @@ class TestIconEmail(TestCase):
         self.assertEqual(attached_email0.subject, "Attachment")
         self.assertEqual(attached_email1.subject, "Test Message Attachment Subject")
 
+    def test_flatten_discovery_order(self):
+        shared_file = IconFile(file_name="shared.txt", content="same content")
+        inner = IconEmail(subject=None, body="inner", attached_files=[shared_file])
+        first = IconEmail(subject="b", body="first", attached_emails=[inner])
+        copy = IconEmail(subject="b", body="first")
+        second = IconEmail(
+            subject="a",
+            body="second",
+            attached_files=[IconFile(file_name="shared.txt", content="same content")],
+        )
+        icon_email = IconEmail(
+            body="root",
+            attached_files=[IconFile(file_name="root.txt", content="root")],
+            attached_emails=[first, inner, copy, second],
+        )
+
+        # A None subject used to make sorting raise TypeError
+        icon_email.flatten()
+
+        self.assertEqual(icon_email.flattened_attached_emails, [first, inner, second])
+        self.assertEqual(
+            [icon_file.name for icon_file in icon_email.flattened_attached_files],
+            ["root.txt", "shared.txt"],
+        )
+        self.assertEqual(list(icon_email.iter_all_emails()), [first, inner, second])
+
+        icon_email.flatten()
+        self.assertEqual(len(icon_email.flattened_attached_files), 2)
+
+    def test_iter_all_emails_deep(self):
+        icon_email = IconEmail(body="level 0")
+        current = icon_email
+        for level in range(1, 5000):
+            attached = IconEmail(
+                body=f"level {level}",
+                attached_files=[IconFile(file_name=f"{level}.txt", content=str(level))],
+            )
+            current.attached_emails = [attached]
+            current = attached
+
+        self.assertEqual(len(list(icon_email.iter_all_emails())), 4999)
+        self.assertEqual(next(icon_email.iter_all_files()).name, "1.txt")
+
+    def test_lazy_icon_email(self):
+        calls = []
+
+        def parse():
+            calls.append(1)
+            return IconEmail(subject="Lazy", body="body", has_attachments=True)
+
+        lazy_email = LazyIconEmail(parse)
+        self.assertFalse(lazy_email.parsed)
+        self.assertEqual(calls, [])
+
+        self.assertEqual(lazy_email.subject, "Lazy")
+        self.assertEqual(lazy_email.body, "body")
+        self.assertTrue(lazy_email.parsed)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(lazy_email, IconEmail(subject="Lazy", body="body"))
+
+        # Fields set before parsing win over the parsed ones
+        lazy_email = LazyIconEmail(parse)
+        lazy_email.has_attachments = False
+        self.assertFalse(lazy_email.has_attachments)
+        self.assertEqual(lazy_email.subject, "Lazy")
+
+        unpickled = pickle.loads(pickle.dumps(LazyIconEmail(parse)))
+        self.assertIs(type(unpickled), IconEmail)
+        self.assertEqual(unpickled.subject, "Lazy")
+
     def test_json_handler(self):
         icon_email = IconEmail()
         actual = icon_email.json_handler(b"some_bytes")
@@ -208,6 +279,8 @@ class TestIconEmail(TestCase):
         self.assertIsNotNone(
             actual
         )  # It's very difficult to test an actual value with time
+        # The object itself is left as it was
+        self.assertIsInstance(object_with_datetime.data, datetime.datetime)
 
     def test_hash(self):
         email_with_nested_attachments_text = read_file_to_string(
@@ -223,3 +296,83 @@ class TestIconEmail(TestCase):
 
         print(type(actual))
         self.assertIsInstance(actual, int)
+
+    def test_equal_emails_hash_equal(self):
+        hashed = IconEmail(subject="Subject", body="Body")
+        unhashed = IconEmail(subject="Subject", body="Body")
+        unhashed.indicators = None  # e.g. parsed without the indicators field
+
+        self.assertEqual(hashed == unhashed, hash(hashed) == hash(unhashed))
+        self.assertEqual(IconEmail(subject="Subject", body="Body"), hashed)
+        self.assertEqual(len({hashed, IconEmail(subject="Subject", body="Body")}), 1)
+
+    def test_hash_follows_changes(self):
+        icon_email = IconEmail(subject="Subject", body="Body")
+        hash(icon_email)
+
+        icon_email.subject = "Other subject"
+
+        self.assertEqual(
+            hash(icon_email), hash(IconEmail(subject="Other subject", body="Body"))
+        )
+        self.assertIn(icon_email, {IconEmail(subject="Other subject", body="Body")})
+
+    def test_make_serializable_leaves_email_untouched(self):
+        raw_email = read_file_to_string(
+            f"{CURRENT_DIR}/payloads/3_deep_with_text_attachment.txt"
+        )
+        email_parser = EmailParser(self.logger)
+        icon_email = email_parser.make_email_from_raw(
+            message_from_string(raw_email), "fake_account"
+        )
+
+        actual = icon_email.make_serializable()
+
+        self.assertEqual(actual, icon_email.to_dict())
+        self.assertEqual(actual["attached_files"][0]["name"], "test_example.com")
+        self.assertEqual(
+            actual["attached_files"][0]["indicators"]["md5"],
+            "17ee38189af19fa3c7047bdab0042cae",
+        )
+        # The attached file still holds its Indicators object, not a dict
+        self.assertEqual(
+            icon_email.attached_files[0].indicators.md5,
+            "17ee38189af19fa3c7047bdab0042cae",
+        )
+
+    def test_to_dict_converts_values(self):
+        icon_email = IconEmail(
+            subject="",
+            date_received=datetime.datetime(2019, 8, 8, 17, 29, 14),
+            categories=["Foo", None, "", b"bytes"],
+            headers=[{"name": "To", "value": None}],
+        )
+
+        actual = icon_email.to_dict()
+
+        self.assertFalse("subject" in actual)
+        self.assertEqual(actual["date_received"], "2019-08-08T17:29:14")
+        self.assertEqual(actual["categories"], ["Foo", "Ynl0ZXM="])
+        self.assertEqual(actual["headers"], [{"name": "To"}])
+
+    def test_equality_and_pickling(self):
+        raw_email = read_file_to_string(
+            f"{CURRENT_DIR}/payloads/3_deep_with_text_attachment.txt"
+        )
+        email_parser = EmailParser(self.logger)
+        icon_email = email_parser.make_email_from_raw(
+            message_from_string(raw_email), "fake_account"
+        )
+        same_email = email_parser.make_email_from_raw(
+            message_from_string(raw_email), "fake_account"
+        )
+
+        self.assertFalse(hasattr(icon_email, "__dict__"))
+        self.assertEqual(icon_email, same_email)
+        self.assertEqual(hash(icon_email), hash(same_email))
+        self.assertNotEqual(icon_email, IconEmail(body="Different body"))
+
+        copied = pickle.loads(pickle.dumps(icon_email))
+        self.assertEqual(copied, icon_email)
+        self.assertEqual(hash(copied), hash(icon_email))
+        self.assertEqual(copied.make_serializable(), icon_email.make_serializable())
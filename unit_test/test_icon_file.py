@@ -1,5 +1,6 @@
 from eml_parser.icon_file import IconFile
 from unittest import TestCase
+import pickle
 
 # This class tests icon file
 class TestIconFile(TestCase):
@@ -39,3 +40,23 @@ class TestIconFile(TestCase):
             },
         }
         self.assertEqual(actual, expected)
+
+    def test_equality_and_hash(self):
+        icon_file = IconFile(
+            file_name="test.txt", content="content", content_type="plain/text"
+        )
+        same_file = IconFile(
+            file_name="test.txt", content="content", content_type="plain/text"
+        )
+        other_file = IconFile(
+            file_name="test.txt", content="other", content_type="plain/text"
+        )
+
+        self.assertEqual(icon_file, same_file)
+        self.assertEqual(hash(icon_file), hash(same_file))
+        self.assertNotEqual(icon_file, other_file)
+        self.assertEqual(len({icon_file, same_file, other_file}), 2)
+
+        copied = pickle.loads(pickle.dumps(icon_file))
+        self.assertEqual(copied, icon_file)
+        self.assertEqual(hash(copied), hash(icon_file))
@@ -0,0 +1,121 @@
+from eml_parser.email_parser import EmailParser
+from eml_parser.limits import ParseLimits, current_budget, decoded_size
+from eml_parser.result_cache import ParseResultCache
+from email.parser import BytesParser
+from unittest import TestCase
+import logging
+import os
+
+CURRENT_DIR = os.path.dirname(__file__)
+PAYLOADS = f"{CURRENT_DIR}/payloads"
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+
+def read_file_to_bytes(filename):
+    with open(f"{PAYLOADS}/{filename}", "rb") as my_file:
+        return my_file.read()
+
+
+class TestParseLimits(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+
+    def parse(self, filename, **limits):
+        email_parser = EmailParser(self.log, limits=ParseLimits(**limits))
+        return email_parser.make_email(read_file_to_bytes(filename), TEST_MAILBOX_ID)
+
+    def test_within_limits(self):
+        raw_email = read_file_to_bytes("four_deep_with_pic.txt")
+        limits = ParseLimits(
+            max_depth=10,
+            max_parts=100,
+            max_attachment_bytes=10**8,
+            max_total_bytes=10**9,
+            max_seconds=600,
+        )
+
+        actual = EmailParser(self.log, limits=limits).make_email(
+            raw_email, TEST_MAILBOX_ID
+        )
+        expected = EmailParser(self.log).make_email(raw_email, TEST_MAILBOX_ID)
+
+        self.assertIsNone(actual.limit_exceeded)
+        self.assertEqual(actual.make_serializable(), expected.make_serializable())
+
+    def test_max_depth(self):
+        actual = self.parse("2 level deep email attached.eml", max_depth=0)
+
+        self.assertEqual(actual.limit_exceeded, "max_depth")
+        self.assertEqual(actual.subject, "Fw: 2 level deep email attached")
+        self.assertEqual(actual.attached_emails, [])
+        self.assertEqual(actual.make_serializable()["limit_exceeded"], "max_depth")
+
+    def test_max_depth_eml_attachment(self):
+        actual = self.parse("lots_of_eml_attached.eml", max_depth=0)
+
+        self.assertEqual(actual.limit_exceeded, "max_depth")
+        self.assertEqual(actual.attached_emails, [])
+
+    def test_max_parts(self):
+        actual = self.parse("four_deep_with_pic.txt", max_parts=3)
+
+        self.assertEqual(actual.limit_exceeded, "max_parts")
+        self.assertTrue(actual.body)
+
+    def test_max_parts_flags_nested_emails(self):
+        actual = self.parse("four_deep_with_pic.txt", max_parts=10)
+
+        self.assertEqual(len(actual.attached_emails), 2)
+        for attached_email in actual.attached_emails:
+            self.assertEqual(attached_email.limit_exceeded, "max_parts")
+
+    def test_partial_nested_email_not_cached(self):
+        raw_email = read_file_to_bytes("lots_of_eml_attached.eml")
+        limits = ParseLimits(max_parts=6)
+        cache = ParseResultCache()
+        email_parser = EmailParser(self.log, limits=limits, result_cache=cache)
+
+        outer = email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+        self.assertEqual(outer.limit_exceeded, "max_parts")
+        self.assertEqual(len(cache), 0)
+
+        # The attached emails parsed on their own, not what the outer budget left of them
+        for part in BytesParser().parsebytes(raw_email).walk():
+            if not (part.get_filename() or "").endswith(".eml"):
+                continue
+            raw_attached = part.get_payload(decode=True)
+            actual = email_parser.make_email(raw_attached, TEST_MAILBOX_ID)
+            expected = EmailParser(self.log, limits=limits).make_email(
+                raw_attached, TEST_MAILBOX_ID
+            )
+            self.assertEqual(actual.make_serializable(), expected.make_serializable())
+
+    def test_track_restores_outer_budget(self):
+        limits = ParseLimits(max_parts=1)
+        with limits.track() as outer:
+            with limits.track() as inner:
+                self.assertIs(current_budget(), inner)
+            self.assertIs(current_budget(), outer)
+        self.assertIsNone(current_budget())
+
+    def test_max_attachment_bytes(self):
+        actual = self.parse("double_attached_with_images.txt", max_attachment_bytes=10)
+
+        self.assertEqual(actual.limit_exceeded, "max_attachment_bytes")
+        self.assertEqual(actual.attached_files, [])
+
+    def test_max_total_bytes(self):
+        actual = self.parse("basic_email.txt", max_total_bytes=1)
+
+        self.assertEqual(actual.limit_exceeded, "max_total_bytes")
+        self.assertIsNone(actual.indicators)
+
+    def test_max_seconds(self):
+        actual = self.parse("four_deep_with_pic.txt", max_seconds=0)
+
+        self.assertEqual(actual.limit_exceeded, "max_seconds")
+        self.assertEqual(actual.attached_files, [])
+
+    def test_decoded_size(self):
+        self.assertEqual(decoded_size("Y29udGVudA==", "base64"), 9)
+        self.assertEqual(decoded_size("content"), 7)
@@ -0,0 +1,113 @@
+from eml_parser import mailbox_reader
+from eml_parser.email_parser import EmailParser
+from unittest import TestCase
+import io
+import logging
+import os
+import tempfile
+
+CURRENT_DIR = os.path.dirname(__file__)
+BASIC_EMAIL = f"{CURRENT_DIR}/payloads/basic_email.txt"
+QUOTED_PRINTABLE_EMAIL = f"{CURRENT_DIR}/payloads/quoted_printable.eml"
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+
+def read_file_to_bytes(filename):
+    with open(filename, "rb") as my_file:
+        return my_file.read()
+
+
+class TestMailboxReader(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.directory = tempfile.TemporaryDirectory()
+        self.basic_email = read_file_to_bytes(BASIC_EMAIL)
+        self.quoted_printable_email = read_file_to_bytes(QUOTED_PRINTABLE_EMAIL)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write(self, relative_path, contents):
+        path = os.path.join(self.directory.name, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as my_file:
+            my_file.write(contents)
+        return path
+
+    def make_mbox(self, newline=b"\n"):
+        return (
+            b"From user@example.com Thu Aug  8 17:29:14 2019"
+            + newline
+            + self.basic_email
+            + newline
+            + b"From user@example.com Thu Aug  8 17:29:15 2019"
+            + newline
+            + b"From user@example.com Thu Aug  8 17:29:16 2019"
+            + newline
+            + self.quoted_printable_email
+        )
+
+    def test_iter_mbox(self):
+        path = self.write("archive.mbox", self.make_mbox())
+
+        actual = list(mailbox_reader.iter_mbox(path))
+
+        # The empty message between the two "From " lines is skipped
+        self.assertEqual(
+            actual, [self.basic_email + b"\n", self.quoted_printable_email]
+        )
+        self.assertTrue(mailbox_reader.is_mbox(path))
+        self.assertEqual(list(mailbox_reader.iter_messages(path)), actual)
+
+    def test_iter_mbox_stream_matches_memory_map(self):
+        for newline in (b"\n", b"\r\n"):
+            path = self.write("archive.mbox", self.make_mbox(newline))
+            with open(path, "rb") as mbox_file:
+                streamed = list(mailbox_reader.iter_mbox_stream(mbox_file))
+
+            self.assertEqual(streamed, list(mailbox_reader.iter_mbox(path)))
+            self.assertEqual(len(streamed), 2)
+
+    def test_iter_mbox_ignores_preamble(self):
+        path = self.write(
+            "archive.mbox",
+            b"junk before the first message\n"
+            + b"From user@example.com Thu Aug  8 17:29:14 2019\n"
+            + self.basic_email,
+        )
+
+        self.assertFalse(mailbox_reader.is_mbox(path))
+        self.assertEqual(list(mailbox_reader.iter_mbox(path)), [self.basic_email])
+        self.assertEqual(
+            list(mailbox_reader.iter_mbox_stream(io.BytesIO(read_file_to_bytes(path)))),
+            [self.basic_email],
+        )
+
+    def test_iter_mbox_empty_file(self):
+        path = self.write("empty.mbox", b"")
+        self.assertEqual(list(mailbox_reader.iter_mbox(path)), [])
+
+    def test_iter_maildir(self):
+        self.write("maildir/new/1.eml", self.basic_email)
+        self.write("maildir/cur/2.eml:2,S", self.quoted_printable_email)
+        self.write("maildir/tmp/3.eml", b"Still being delivered")
+        self.write("maildir/.Sent/cur/4.eml", self.basic_email)
+        os.makedirs(os.path.join(self.directory.name, "maildir/.Sent/new"))
+        path = os.path.join(self.directory.name, "maildir")
+
+        actual = list(mailbox_reader.iter_maildir(path))
+
+        self.assertTrue(mailbox_reader.is_maildir(path))
+        self.assertEqual(
+            actual, [self.basic_email, self.quoted_printable_email, self.basic_email]
+        )
+
+    def test_parse_mbox(self):
+        path = self.write("archive.mbox", self.make_mbox())
+        email_parser = EmailParser(self.log)
+
+        emails = mailbox_reader.parse_mbox(email_parser, path, TEST_MAILBOX_ID)
+
+        self.assertEqual(next(emails).subject, "Test")
+        self.assertEqual(next(emails).subject, "SOAR Mimecast URL Test 1")
+        self.assertIsNone(next(emails, None))
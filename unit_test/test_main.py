@@ -0,0 +1,123 @@
+from eml_parser.__main__ import JsonEmailParser, main
+from eml_parser.email_parser import EmailParser
+from unittest import TestCase
+import io
+import json
+import logging
+import os
+import tempfile
+from unittest.mock import patch
+
+CURRENT_DIR = os.path.dirname(__file__)
+BASIC_EMAIL = f"{CURRENT_DIR}/payloads/basic_email.txt"
+QUOTED_PRINTABLE_EMAIL = f"{CURRENT_DIR}/payloads/quoted_printable.eml"
+
+
+def read_file_to_bytes(filename):
+    with open(filename, "rb") as my_file:
+        return my_file.read()
+
+
+class TestMain(TestCase):
+    def setUp(self) -> None:
+        self.basic_email = read_file_to_bytes(BASIC_EMAIL)
+        self.quoted_printable_email = read_file_to_bytes(QUOTED_PRINTABLE_EMAIL)
+
+    def run_main(self, argv, stdin=None):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        exit_code = main(argv, stdin=stdin, stdout=stdout, stderr=stderr)
+        emails = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        return exit_code, emails, stderr.getvalue()
+
+    def test_files_and_mbox(self):
+        with tempfile.TemporaryDirectory() as directory:
+            mbox_path = os.path.join(directory, "archive.mbox")
+            with open(mbox_path, "wb") as mbox:
+                mbox.write(b"From user@example.com Thu Aug  8 17:29:14 2019\n")
+                mbox.write(self.basic_email)
+                mbox.write(b"\nFrom user@example.com Thu Aug  8 17:29:15 2019\n")
+                mbox.write(self.quoted_printable_email)
+
+            exit_code, emails, stderr = self.run_main(
+                ["--workers", "0", "-m", "mailbox", BASIC_EMAIL, directory]
+            )
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(
+            [email["subject"] for email in emails],
+            ["Test", "Test", "SOAR Mimecast URL Test 1"],
+        )
+        self.assertEqual(emails[0]["account"], "mailbox")
+        self.assertTrue("Parsed 3 message(s), 0 failed" in stderr)
+        self.assertTrue("Latency per message: p50" in stderr)
+
+    def test_stdin_with_failure(self):
+        broken = b"From: user@example.com\n\nNo subject\n"
+        for raw, expected_exit_code in ((self.basic_email, 0), (broken, 1)):
+            exit_code, emails, stderr = self.run_main(
+                ["--workers", "0", "-q"], stdin=io.BytesIO(raw)
+            )
+            self.assertEqual(exit_code, expected_exit_code)
+            self.assertEqual(len(emails), 1 - expected_exit_code)
+
+        self.assertTrue("Failed to parse -" in stderr)
+        self.assertFalse("Parsed" in stderr)
+
+    def test_unreadable_input(self):
+        with tempfile.TemporaryDirectory() as directory:
+            missing = os.path.join(directory, "missing.eml")
+            exit_code, emails, stderr = self.run_main(
+                ["--workers", "0", BASIC_EMAIL, missing, BASIC_EMAIL]
+            )
+
+        self.assertEqual(exit_code, 1)
+        self.assertEqual([email["subject"] for email in emails], ["Test", "Test"])
+        self.assertTrue(f"Failed to read {missing}" in stderr)
+        self.assertTrue("Parsed 3 message(s), 1 failed" in stderr)
+
+    def test_parallel_output_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = os.path.join(directory, "out.ndjson")
+            exit_code, _, _ = self.run_main(
+                [
+                    "-w",
+                    "2",
+                    "-q",
+                    "-o",
+                    output_path,
+                    BASIC_EMAIL,
+                    QUOTED_PRINTABLE_EMAIL,
+                ]
+            )
+            with open(output_path) as output:
+                subjects = [json.loads(line)["subject"] for line in output]
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(subjects, ["Test", "SOAR Mimecast URL Test 1"])
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_path = os.path.join(directory, "cache.sqlite")
+            argv = ["-w", "2", "-q", "--cache", cache_path, BASIC_EMAIL]
+
+            _, first_run, _ = self.run_main(argv)
+            with patch("eml_parser.email_parser.EmailParser.format_result") as parse:
+                exit_code, second_run, _ = self.run_main(
+                    ["-w", "0", "-q", "--cache", cache_path, BASIC_EMAIL]
+                )
+                parse.assert_not_called()
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(second_run, first_run)
+
+    def test_serialized_by_worker(self):
+        email_parser = EmailParser(logging.getLogger("test"))
+
+        actual = JsonEmailParser(email_parser).make_email(self.basic_email, "mailbox")
+
+        self.assertIsInstance(actual, str)
+        self.assertEqual(
+            json.loads(actual),
+            email_parser.make_email(self.basic_email, "mailbox").make_serializable(),
+        )
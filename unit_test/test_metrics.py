@@ -0,0 +1,128 @@
+from eml_parser.email_parser import EmailParser
+from eml_parser.metrics import MessageMetrics
+from email import message_from_bytes
+from unittest import TestCase
+import logging
+import os
+import pickle
+
+CURRENT_DIR = os.path.dirname(__file__)
+BASIC_EMAIL = f"{CURRENT_DIR}/payloads/basic_email.txt"
+FOUR_DEEP_EMAIL = f"{CURRENT_DIR}/payloads/four_deep_with_pic.txt"
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+
+def read_file_to_bytes(filename):
+    with open(filename, "rb") as my_file:
+        return my_file.read()
+
+
+def expected_shape(msg) -> tuple:
+    size = 0
+    part_count = 0
+    depth = 0
+    stack = [(msg, 0)]
+    while stack:
+        part, level = stack.pop()
+        part_count += 1
+        depth = max(depth, level)
+        if part.is_multipart():
+            if part.get_content_maintype() == "message":
+                level += 1
+            stack.extend((child, level) for child in part.get_payload())
+        elif isinstance(part.get_payload(), str):
+            size += len(part.get_payload())
+    return size, part_count, depth
+
+
+class TestMetrics(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.recorded = []
+
+    def test_disabled_by_default(self):
+        email_parser = EmailParser(self.log)
+
+        self.assertFalse("format_result" in vars(email_parser))
+        self.assertFalse("get_headers" in vars(email_parser))
+
+    def test_stages(self):
+        email_parser = EmailParser(self.log, metrics=self.recorded.append)
+
+        email = email_parser.make_email_from_file(FOUR_DEEP_EMAIL, TEST_MAILBOX_ID)
+
+        self.assertEqual(len(self.recorded), 1)
+        metrics = self.recorded[0]
+        self.assertIsInstance(metrics, MessageMetrics)
+        self.assertEqual(metrics.part_count, 15)
+        self.assertEqual(metrics.depth, 2)
+        self.assertGreater(metrics.size, 0)
+        self.assertEqual(
+            set(metrics.stages),
+            {
+                "headers",
+                "body_decode",
+                "newline_cleanup",
+                "attachments",
+                "hashing",
+                "nested_emails",
+                "other",
+            },
+        )
+        self.assertEqual(metrics.stages["nested_emails"].calls, 2)
+        self.assertEqual(metrics.stages["headers"].calls, 1)
+        self.assertAlmostEqual(
+            sum(stage.seconds for stage in metrics.stages.values()),
+            metrics.duration,
+        )
+
+        serialized = email_parser.serialize(email)
+        self.assertEqual(serialized, email.make_serializable())
+        self.assertEqual(len(self.recorded), 2)
+        self.assertEqual(list(self.recorded[1].stages), ["serialization"])
+
+    def test_shape_measured_by_attachment_walk(self):
+        email_parser = EmailParser(self.log, metrics=self.recorded.append)
+
+        for filename in (
+            BASIC_EMAIL,
+            FOUR_DEEP_EMAIL,
+            f"{CURRENT_DIR}/payloads/lots_of_eml_attached.eml",
+        ):
+            raw_email = read_file_to_bytes(filename)
+            email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+
+            metrics = self.recorded[-1]
+            self.assertEqual(
+                (metrics.size, metrics.part_count, metrics.depth),
+                expected_shape(message_from_bytes(raw_email)),
+            )
+            self.assertEqual(metrics.stages["attachments"].bytes, metrics.size)
+
+    def test_no_shape_without_walk(self):
+        email_parser = EmailParser(
+            self.log, metrics=self.recorded.append, fields={"headers"}
+        )
+
+        email_parser.make_email_from_file(FOUR_DEEP_EMAIL, TEST_MAILBOX_ID)
+
+        self.assertEqual(self.recorded[0].part_count, 0)
+        self.assertNotIn("attachments", self.recorded[0].stages)
+
+    def test_same_result(self):
+        email_parser = EmailParser(self.log, metrics=self.recorded.append)
+
+        actual = email_parser.make_email_from_file(FOUR_DEEP_EMAIL, TEST_MAILBOX_ID)
+        expected = EmailParser(self.log).make_email_from_file(
+            FOUR_DEEP_EMAIL, TEST_MAILBOX_ID
+        )
+
+        self.assertEqual(actual.make_serializable(), expected.make_serializable())
+
+    def test_pickle(self):
+        email_parser = EmailParser(self.log, metrics=print)
+
+        copied = pickle.loads(pickle.dumps(email_parser))
+
+        self.assertTrue("format_result" in vars(copied))
+        self.assertIs(copied.metrics, print)
@@ -0,0 +1,39 @@
+from eml_parser.microsoft_newline_cleaner import remove_microsoft_newlines
+from unittest import TestCase
+
+
+class TestMicrosoftNewlineCleaner(TestCase):
+    def test_soft_line_breaks(self):
+        self.assertEqual(
+            remove_microsoft_newlines("one=\r\n\r\ntwo=\r\nthree=\n\nfour=\nfive\n"),
+            "onetwothreefourfive\n",
+        )
+
+    def test_quoted_printable(self):
+        self.assertEqual(
+            remove_microsoft_newlines('<p class=3D"MsoNormal">Gr=C3=BC=C3=9Fe</p>'),
+            '<p class="MsoNormal">Grüße</p>',
+        )
+
+    def test_unicode(self):
+        self.assertEqual(
+            remove_microsoft_newlines("Grüße =E2=80=93 bye"), "Grüße – bye"
+        )
+
+    def test_not_utf8(self):
+        # Latin-1 escapes can't be decoded as UTF-8, the text is kept as is
+        self.assertEqual(remove_microsoft_newlines("Gr=FC=DFe=\n"), "Gr=FC=DFe")
+
+    def test_plain_text(self):
+        self.assertEqual(remove_microsoft_newlines("Just text\r\n"), "Just text\r\n")
+
+    def test_transfer_decoded(self):
+        # Text email.message already decoded keeps its '=' as they are
+        for transfer_encoding in ("base64", "quoted-printable", " Base64 "):
+            self.assertEqual(
+                remove_microsoft_newlines("Café ?id=41&ref=20AB", transfer_encoding),
+                "Café ?id=41&ref=20AB",
+            )
+        self.assertEqual(
+            remove_microsoft_newlines("Café ?id=41&ref=20AB", "8bit"), "Café ?idA&ref AB"
+        )
@@ -0,0 +1,115 @@
+from eml_parser.email_parser import EmailParser
+from eml_parser.result_cache import ParseResultCache
+from unittest import TestCase
+from unittest.mock import patch
+import logging
+import os
+import pickle
+
+CURRENT_DIR = os.path.dirname(__file__)
+BASIC_EMAIL = f"{CURRENT_DIR}/payloads/basic_email.txt"
+QUOTED_PRINTABLE_EMAIL = f"{CURRENT_DIR}/payloads/quoted_printable.eml"
+LOTS_OF_EML_ATTACHED = f"{CURRENT_DIR}/payloads/lots_of_eml_attached.eml"
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+
+def read_file_to_bytes(filename):
+    with open(filename, "rb") as my_file:
+        return my_file.read()
+
+
+class TestParseResultCache(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.basic_email = read_file_to_bytes(BASIC_EMAIL)
+
+    def test_key(self):
+        key = ParseResultCache.key(self.basic_email, TEST_MAILBOX_ID)
+
+        self.assertEqual(
+            key, ParseResultCache.key(bytearray(self.basic_email), TEST_MAILBOX_ID)
+        )
+        self.assertNotEqual(key, ParseResultCache.key(self.basic_email, "other"))
+        self.assertNotEqual(
+            key, ParseResultCache.key(self.basic_email + b"\n", TEST_MAILBOX_ID)
+        )
+
+    def test_evicts_by_count(self):
+        cache = ParseResultCache(max_entries=2)
+
+        cache.put("a", "email a", 1)
+        cache.put("b", "email b", 1)
+        self.assertEqual(cache.get("a"), "email a")  # Makes b the least recently used
+        cache.put("c", "email c", 1)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "email c")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (2, 1, 1))
+
+    def test_evicts_by_size(self):
+        cache = ParseResultCache(max_bytes=10)
+
+        cache.put("a", "email a", 6)
+        cache.put("b", "email b", 6)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.size, 6)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_parser_skips_parsing_on_hit(self):
+        cache = ParseResultCache()
+        email_parser = EmailParser(self.log, result_cache=cache)
+
+        first = email_parser.make_email(self.basic_email, TEST_MAILBOX_ID)
+        with patch.object(email_parser, "format_result") as format_result:
+            second = email_parser.make_email(self.basic_email, TEST_MAILBOX_ID)
+            from_file = email_parser.make_email_from_file(BASIC_EMAIL, TEST_MAILBOX_ID)
+            format_result.assert_not_called()
+
+        self.assertIs(second, first)
+        self.assertIs(from_file, first)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        other = email_parser.make_email(
+            read_file_to_bytes(QUOTED_PRINTABLE_EMAIL), TEST_MAILBOX_ID
+        )
+        self.assertIsNot(other, first)
+        self.assertEqual(len(cache), 2)
+
+    def test_attached_emails_not_cached(self):
+        cache = ParseResultCache()
+        email_parser = EmailParser(self.log, result_cache=cache)
+
+        email_parser.make_email(
+            read_file_to_bytes(LOTS_OF_EML_ATTACHED), TEST_MAILBOX_ID
+        )
+
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 1, 1))
+
+    def test_parsers_with_other_settings_miss(self):
+        cache = ParseResultCache()
+        email_parser = EmailParser(self.log, result_cache=cache)
+        headers_parser = EmailParser(self.log, result_cache=cache, fields={"headers"})
+        sha256_parser = EmailParser(
+            self.log, result_cache=cache, hash_algorithms=("sha256",)
+        )
+
+        full = email_parser.make_email(self.basic_email, TEST_MAILBOX_ID)
+        headers_only = headers_parser.make_email(self.basic_email, TEST_MAILBOX_ID)
+        sha256_only = sha256_parser.make_email(self.basic_email, TEST_MAILBOX_ID)
+
+        self.assertIsNot(headers_only, full)
+        self.assertIsNone(headers_only.body)
+        self.assertIsNone(sha256_only.indicators.md5)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 3, 3))
+        self.assertIs(email_parser.make_email(self.basic_email, TEST_MAILBOX_ID), full)
+
+    def test_pickle_starts_empty(self):
+        cache = ParseResultCache(max_entries=5)
+        cache.put("a", "email a", 1)
+
+        copied = pickle.loads(pickle.dumps(cache))
+
+        self.assertEqual(copied.max_entries, 5)
+        self.assertEqual(len(copied), 0)
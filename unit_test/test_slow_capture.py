@@ -0,0 +1,158 @@
+from eml_parser.attachment_store import AttachmentStore
+from eml_parser.email_parser import EmailParser
+from eml_parser.slow_capture import SlowMessageCapture, mime_tree
+from email import message_from_bytes
+from unittest import TestCase
+from unittest.mock import patch
+import logging
+import os
+import pickle
+import pstats
+import tempfile
+
+CURRENT_DIR = os.path.dirname(__file__)
+BASIC_EMAIL = f"{CURRENT_DIR}/payloads/basic_email.txt"
+TWO_LEVEL_EMAIL = f"{CURRENT_DIR}/payloads/2 level deep email attached.eml"
+THREE_DEEP_EMAIL = f"{CURRENT_DIR}/payloads/3_deep_with_text_attachment.txt"
+TEST_MAILBOX_ID = "somedude@hotmail.com"
+
+
+def read_file_to_bytes(filename):
+    with open(filename, "rb") as my_file:
+        return my_file.read()
+
+
+class TestSlowMessageCapture(TestCase):
+    def setUp(self) -> None:
+        self.log = logging.getLogger("test")
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def captures(self):
+        return sorted(os.listdir(self.directory.name))
+
+    def test_capture_slow_message(self):
+        capture = SlowMessageCapture(self.directory.name, threshold=0)
+        email_parser = EmailParser(self.log, slow_capture=capture)
+
+        email = email_parser.make_email(
+            read_file_to_bytes(TWO_LEVEL_EMAIL), TEST_MAILBOX_ID
+        )
+
+        # Attached emails are part of the same capture
+        self.assertEqual(len(self.captures()), 1)
+        path = os.path.join(self.directory.name, self.captures()[0])
+        self.assertEqual(
+            sorted(os.listdir(path)), ["message.eml", "profile.pstats", "summary.txt"]
+        )
+        pstats.Stats(os.path.join(path, "profile.pstats"))
+        with open(os.path.join(path, "summary.txt")) as summary:
+            self.assertTrue("multipart/mixed" in summary.read())
+        with open(os.path.join(path, "message.eml"), "rb") as message_file:
+            reparsed = EmailParser(self.log).make_email(
+                message_file.read(), TEST_MAILBOX_ID
+            )
+        self.assertEqual(reparsed.subject, email.subject)
+
+    def test_fast_messages_not_captured(self):
+        capture = SlowMessageCapture(self.directory.name, threshold=60)
+        email_parser = EmailParser(self.log, slow_capture=capture)
+
+        email_parser.make_email(read_file_to_bytes(BASIC_EMAIL), TEST_MAILBOX_ID)
+
+        self.assertEqual(self.captures(), [])
+
+    def test_fast_messages_not_profiled(self):
+        capture = SlowMessageCapture(self.directory.name, threshold=60)
+        email_parser = EmailParser(self.log, slow_capture=capture)
+
+        with patch("eml_parser.slow_capture.cProfile.Profile") as profile:
+            email_parser.make_email(read_file_to_bytes(BASIC_EMAIL), TEST_MAILBOX_ID)
+        profile.assert_not_called()
+
+    def test_capture_keeps_raw_message(self):
+        capture = SlowMessageCapture(self.directory.name, threshold=0, max_captures=3)
+        email_parser = EmailParser(self.log, slow_capture=capture)
+        raw_email = read_file_to_bytes(TWO_LEVEL_EMAIL)
+
+        email_parser.make_email(raw_email, TEST_MAILBOX_ID)
+        email_parser.make_email(raw_email.decode("utf-8"), TEST_MAILBOX_ID)
+        email_parser.make_email_from_file(TWO_LEVEL_EMAIL, TEST_MAILBOX_ID)
+
+        self.assertEqual(len(self.captures()), 3)
+        for entry in self.captures():
+            path = os.path.join(self.directory.name, entry, "message.eml")
+            self.assertEqual(read_file_to_bytes(path), raw_email)
+
+    def test_profiled_parse_has_no_side_effects(self):
+        capture = SlowMessageCapture(self.directory.name, threshold=0)
+        measured = []
+        sunk = []
+
+        def sink(filename, content_type, chunks):
+            sunk.append(filename)
+            return None
+
+        raw_email = read_file_to_bytes(THREE_DEEP_EMAIL)
+        EmailParser(
+            self.log,
+            metrics=measured.append,
+            attachment_sink=sink,
+            slow_capture=capture,
+        ).make_email(raw_email, TEST_MAILBOX_ID)
+        store = AttachmentStore()
+        EmailParser(self.log, attachment_store=store, slow_capture=capture).make_email(
+            raw_email, TEST_MAILBOX_ID
+        )
+        email = EmailParser(self.log).make_email(raw_email, TEST_MAILBOX_ID)
+        email.flatten()
+
+        self.assertEqual(len(self.captures()), 2)
+        self.assertEqual(len(measured), 1)
+        self.assertTrue(sunk)
+        self.assertEqual(
+            sorted(sunk),
+            sorted(attached.name for attached in email.flattened_attached_files),
+        )
+        self.assertEqual(store.hits + store.misses, len(sunk))
+
+    def test_prune_oldest_by_mtime(self):
+        capture = SlowMessageCapture(self.directory.name, max_captures=2)
+        # Names sort the other way round from the times the captures were made
+        for entry, mtime in (("c", 100), ("b", 200), ("a", 300)):
+            os.makedirs(os.path.join(self.directory.name, entry))
+            os.utime(os.path.join(self.directory.name, entry), (mtime, mtime))
+
+        capture._prune()
+
+        self.assertEqual(self.captures(), ["a", "b"])
+
+    def test_max_captures(self):
+        capture = SlowMessageCapture(self.directory.name, threshold=0, max_captures=2)
+        email_parser = EmailParser(self.log, slow_capture=capture)
+
+        for _ in range(4):
+            email_parser.make_email(read_file_to_bytes(BASIC_EMAIL), TEST_MAILBOX_ID)
+
+        self.assertEqual(capture.captured, 4)
+        self.assertEqual(len(self.captures()), 2)
+        self.assertTrue(self.captures()[-1].endswith("0004"))
+
+    def test_mime_tree(self):
+        msg = message_from_bytes(read_file_to_bytes(TWO_LEVEL_EMAIL))
+
+        lines = mime_tree(msg).splitlines()
+
+        self.assertTrue(lines[0].startswith("multipart/mixed"))
+        self.assertTrue(any(line.startswith("  message/rfc822") for line in lines))
+
+    def test_pickle(self):
+        capture = SlowMessageCapture(self.directory.name, threshold=2, max_captures=3)
+        email_parser = EmailParser(self.log, slow_capture=capture)
+
+        copied = pickle.loads(pickle.dumps(email_parser))
+
+        self.assertEqual(copied.slow_capture.threshold, 2)
+        self.assertTrue("make_email_from_raw" in vars(copied))